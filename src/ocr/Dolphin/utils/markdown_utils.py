@@ -3,9 +3,10 @@ Copyright (c) 2025 Bytedance Ltd. and/or its affiliates
 SPDX-License-Identifier: MIT
 """
 
+import io
 import re
 import base64
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, TextIO
 
 
 """
@@ -19,13 +20,58 @@ from typing import List, Dict, Any, Optional
     ]
 """
 
+# Patterns are compiled once at import; conversion applies them per element
+TABLE_PATTERN = re.compile(r'<table.*?>.*?</table>', re.DOTALL)
+TABLE_OPEN_TAG_PATTERN = re.compile(r'<table[^>]*>')
+CHINESE_CHAR_PATTERN = re.compile('[\u4e00-\u9fff]')
+ALGORITHM_PATTERN = re.compile(r'\\begin\{algorithm\}(.*?)\\end\{algorithm\}', re.DOTALL)
+CAPTION_PATTERN = re.compile(r'\\caption\{(.*?)\}')
+
+# Formula delimiters, in the order they are processed: block $$, block \[ \], inline $, inline \( \)
+FORMULA_PATTERNS = [
+    re.compile(re.escape(start) + '(.*?)' + re.escape(end), re.DOTALL)
+    for start, end in [('$$', '$$'), ('\\[', '\\]'), ('$', '$'), ('\\(', '\\)')]
+]
+
+# Post-processing. \author{...} and \begin{abstract}...\end{abstract} may span elements
+AUTHOR_PATTERN = re.compile(r'\\author\{(.*?)\}', re.DOTALL)
+ABSTRACT_PATTERN = re.compile(r'\\begin\{abstract\}(?:(.*?)\\end\{abstract\})?', re.DOTALL)
+SPANS = [('\\author{', '}'), ('\\begin{abstract}', '\\end{abstract}')]
+
+# Converted text is post-processed and written in batches of about this many characters
+WRITE_BATCH_CHARS = 1 << 16
+
+# All other fixes in one pass:
+#   \eqno{(n)}  ->  \tag{n}
+#   "\[ \\" and "\\ \]"  ->  "$$ \\" and "\\ $$"  (block formula delimiters with a line break)
+#   "_ {"  ->  "_{"
+#   three or more newlines  ->  one blank line
+# The alternatives reproduce applying these one after another, where one fix
+# can complete another's match ("\[ \\ \]", "\[ \\eqno{(1)}"), and each starts
+# with a literal character so the regex engine can skip straight to candidates.
+# "^ {" is not rewritten: the old rule was anchored to the start of the
+# document, where converted markdown never has a space.
+CLEANUP_PATTERN = re.compile(
+    r'\\(?:'
+    r'eqno\{\((?P<eqno>.*?)\)\}'
+    r'|(?P<block_before_eqno>\[ \\)(?=\\eqno\{\(.*?\)\})'
+    r'|\[ \\\\(?P<block_close>\\? \\\])?'
+    r'|(?P<block_end>\\ \\\])'
+    r')'
+    r'|_ \{'
+    r'|\n\n\n+'
+)
+
+
+def is_chinese(char: str) -> bool:
+    return '\u4e00' <= char <= '\u9fff'
+
 
 def extract_table_from_html(html_string):
     """Extract and clean table tags from HTML string"""
     try:
-        table_pattern = re.compile(r'<table.*?>.*?</table>', re.DOTALL)
-        tables = table_pattern.findall(html_string)
-        tables = [re.sub(r'<table[^>]*>', '<table>', table) for table in tables]
+        tables = TABLE_PATTERN.findall(html_string)
+        tables = [TABLE_OPEN_TAG_PATTERN.sub('<table>', table) for table in tables]
         return '\n'.join(tables)
     except Exception as e:
         print(f"extract_table_from_html error: {str(e)}")
@@ -54,18 +100,16 @@ class MarkdownConverter:
             # Preprocess text to handle line breaks
             text = text.strip()
             text = text.replace('-\n', '')
+            if '\n' not in text:
+                return text.strip()
             
-            # Handle Chinese text line breaks
-            def is_chinese(char):
-                return '\u4e00' <= char <= '\u9fff'
-
-            lines = text.split('\n')
+            lines = [line.strip() for line in text.split('\n')]
             processed_lines = []
             
             # Process all lines except the last one
             for i in range(len(lines)-1):
-                current_line = lines[i].strip()
-                next_line = lines[i+1].strip()
+                current_line = lines[i]
+                next_line = lines[i+1]
                 
                 # Always add the current line, but determine if we need a newline
                 if current_line:  # If current line is not empty
@@ -83,8 +127,8 @@ class MarkdownConverter:
                     processed_lines.append('\n')
             
             # Add the last line
-            if lines and lines[-1].strip():
-                processed_lines.append(lines[-1].strip())
+            if lines and lines[-1]:
+                processed_lines.append(lines[-1])
             
             text = ''.join(processed_lines)
             
@@ -124,71 +168,30 @@ class MarkdownConverter:
         - Replace newlines within formulas with \\
         """
         try:
-            # Define formula delimiters and their corresponding patterns
-            delimiters = [
-                ('$$', '$$'),  # Block formula with $$
-                ('\\[', '\\]'),  # Block formula with \[ \]
-                ('$', '$'),  # Inline formula with $
-                ('\\(', '\\)')  # Inline formula with \( \)
-            ]
-            
-            # Process the text by iterating through each delimiter type
+            # Only newlines inside formulas change
+            if '\n' not in text:
+                return text
             result = text
-            
-            for start_delim, end_delim in delimiters:
-                # Create a pattern that matches from start to end delimiter
-                # Using a custom approach to avoid issues with nested delimiters
-                current_pos = 0
-                processed_parts = []
-                
-                while current_pos < len(result):
-                    # Find the next start delimiter
-                    start_pos = result.find(start_delim, current_pos)
-                    if start_pos == -1:
-                        # No more formulas of this type
-                        processed_parts.append(result[current_pos:])
-                        break
-                    
-                    # Add text before the formula
-                    processed_parts.append(result[current_pos:start_pos])
-                    
-                    # Find the matching end delimiter
-                    end_pos = result.find(end_delim, start_pos + len(start_delim))
-                    if end_pos == -1:
-                        # No matching end delimiter, treat as regular text
-                        processed_parts.append(result[start_pos:])
-                        break
-                    
-                    # Extract the formula content (without delimiters)
-                    formula_content = result[start_pos + len(start_delim):end_pos]
-                    
-                    # Process the formula content - replace newlines with \\
-                    processed_formula = formula_content.replace('\n', ' \\\\ ')
-                    
-                    # Add the processed formula with its delimiters
-                    processed_parts.append(f"{start_delim}{processed_formula}{end_delim}")
-                    
-                    # Move past this formula
-                    current_pos = end_pos + len(end_delim)
-                
-                # Update the result with processed text
-                result = ''.join(processed_parts)
+            for pattern in FORMULA_PATTERNS:
+                result = pattern.sub(self._replace_formula_newlines, result)
+                if '\n' not in result:
+                    break
             return result
         except Exception as e:
             print(f"_process_formulas_in_text error: {str(e)}")
             return text  # Return original text on error
     
+    @staticmethod
+    def _replace_formula_newlines(match) -> str:
+        return match.group(0).replace('\n', ' \\\\ ')
+    
     def _remove_newline_in_heading(self, text: str) -> str:
         """
         Remove newline in heading
         """
         try:
-            # Handle Chinese text line breaks
-            def is_chinese(char):
-                return '\u4e00' <= char <= '\u9fff'
-            
             # Check if the text contains Chinese characters
-            if any(is_chinese(char) for char in text):
+            if CHINESE_CHAR_PATTERN.search(text):
                 return text.replace('\n', '')
             else:
                 return text.replace('\n', ' ')
@@ -284,7 +287,7 @@ class MarkdownConverter:
         """
         try:
             # Remove algorithm environment tags if present
-            text = re.sub(r'\\begin\{algorithm\}(.*?)\\end\{algorithm\}', r'\1', text, flags=re.DOTALL)
+            text = ALGORITHM_PATTERN.sub(r'\1', text)
             text = text.replace('\\begin{algorithm}', '').replace('\\end{algorithm}', '')
             text = text.replace('\\begin{algorithmic}', '').replace('\\end{algorithmic}', '')
             
@@ -298,7 +301,7 @@ class MarkdownConverter:
             for line in lines:
                 if '\\caption' in line:
                     # Extract caption text
-                    caption_match = re.search(r'\\caption\{(.*?)\}', line)
+                    caption_match = CAPTION_PATTERN.search(line)
                     if caption_match:
                         caption = f"**{caption_match.group(1)}**\n\n"
                     continue
@@ -334,119 +337,140 @@ class MarkdownConverter:
             print(f"_handle_formula error: {str(e)}")
             return f"*[Error processing formula: {str(e)}]*\n\n"
 
-    def convert(self, recognition_results: List[Dict[str, Any]]) -> str:
+    def convert(self, recognition_results: Iterable[Dict[str, Any]], out: Optional[TextIO] = None) -> Optional[str]:
         """
         Convert recognition results to markdown format
+        
+        With ``out`` (a text file handle) the markdown is written there element by
+        element and nothing is returned, so ``recognition_results`` can be a generator
+        over a whole book without the document ever being held as one string.
         """
+        if out is not None:
+            self._write(recognition_results, out)
+            return None
         try:
-            markdown_content = []
-            
-            for section_count, result in enumerate(recognition_results):
-                try:
-                    label = result.get('label', '')
-                    text = result.get('text', '').strip()
-                    
-                    # Skip empty text
-                    if not text:
-                        continue
-                        
-                    # Handle different content types
-                    if label in {'title', 'sec', 'sub_sec'}:
-                        markdown_content.append(self._handle_heading(text, label))
-                    elif label == 'list':
-                        markdown_content.append(self._handle_list_item(text))
-                    elif label == 'fig':
-                        markdown_content.append(self._handle_figure(text, section_count))
-                    elif label == 'tab':
-                        markdown_content.append(self._handle_table(text))
-                    elif label == 'alg':
-                        markdown_content.append(self._handle_algorithm(text))
-                    elif label == 'formula':
-                        markdown_content.append(self._handle_formula(text))
-                    elif label not in self.special_labels:
-                        # Handle regular text (paragraphs, etc.)
-                        processed_text = self._handle_text(text)
-                        markdown_content.append(f"{processed_text}\n\n")
-                except Exception as e:
-                    print(f"Error processing item {section_count}: {str(e)}")
-                    # Add a placeholder for the failed item
-                    markdown_content.append(f"*[Error processing content]*\n\n")
-            
-            # Join all content and apply post-processing
-            result = ''.join(markdown_content)
-            return self._post_process(result)
+            buffer = io.StringIO()
+            self._write(recognition_results, buffer)
+            return buffer.getvalue()
         except Exception as e:
             print(f"convert error: {str(e)}")
             return f"Error generating markdown content: {str(e)}"
 
-    def _post_process(self, markdown_content: str) -> str:
+    def _convert_element(self, result: Dict[str, Any], section_count: int) -> str:
         """
-        Apply post-processing fixes to the generated markdown content
+        Markdown for one recognition result, before post-processing
         """
         try:
-            # Handle author information
-            author_pattern = re.compile(r'\\author\{(.*?)\}', re.DOTALL)
-            
-            def process_author_match(match):
-                # Extract author content
-                author_content = match.group(1)
-                # Process the author content
-                return self._handle_text(author_content)
-            
-            # Replace \author{...} with processed content
-            markdown_content = author_pattern.sub(process_author_match, markdown_content)
-            
-            # Handle special case where author is inside math environment
-            math_author_pattern = re.compile(r'\$(\\author\{.*?\})\$', re.DOTALL)
-            match = math_author_pattern.search(markdown_content)
-            if match:
-                # Extract the author command
-                author_cmd = match.group(1)
-                # Extract content from author command
-                author_content_match = re.search(r'\\author\{(.*?)\}', author_cmd, re.DOTALL)
-                if author_content_match:
-                    # Get author content and process it
-                    author_content = author_content_match.group(1)
-                    processed_content = self._handle_text(author_content)
-                    # Replace the entire $\author{...}$ block with processed content
-                    markdown_content = markdown_content.replace(match.group(0), processed_content)
-            
-            # Replace LaTeX abstract environment with plain text
-            markdown_content = re.sub(r'\\begin\{abstract\}(.*?)\\end\{abstract\}', 
-                                     r'**Abstract** \1', 
-                                     markdown_content, 
-                                     flags=re.DOTALL)
+            label = result.get('label', '')
+            text = result.get('text', '').strip()
             
-            # Replace standalone \begin{abstract} (without matching end)
-            markdown_content = re.sub(r'\\begin\{abstract\}', 
-                                     r'**Abstract**', 
-                                     markdown_content)
-            
-            # Replace LaTeX equation numbers with tag format, handling cases with extra backslashes
-            markdown_content = re.sub(r'\\eqno\{\((.*?)\)\}',
-                                    r'\\tag{\1}',
-                                    markdown_content)
-
-            # Find the starting tag of the formula
-            markdown_content = markdown_content.replace("\[ \\\\", "$$ \\\\")
+            # Skip empty text
+            if not text:
+                return ""
+                
+            # Handle different content types
+            if label in {'title', 'sec', 'sub_sec'}:
+                return self._handle_heading(text, label)
+            elif label == 'list':
+                return self._handle_list_item(text)
+            elif label == 'fig':
+                return self._handle_figure(text, section_count)
+            elif label == 'tab':
+                return self._handle_table(text)
+            elif label == 'alg':
+                return self._handle_algorithm(text)
+            elif label == 'formula':
+                return self._handle_formula(text)
+            elif label not in self.special_labels:
+                # Handle regular text (paragraphs, etc.)
+                processed_text = self._handle_text(text)
+                return f"{processed_text}\n\n"
+            return ""
+        except Exception as e:
+            print(f"Error processing item {section_count}: {str(e)}")
+            # Add a placeholder for the failed item
+            return f"*[Error processing content]*\n\n"
 
-            # Find the ending tag of the formula (ensure this is the only ending tag)
-            markdown_content = markdown_content.replace("\\\\ \]", "\\\\ $$")
+    def _write(self, recognition_results: Iterable[Dict[str, Any]], out: TextIO) -> None:
+        """
+        Convert and post-process element by element, writing each piece once no later
+        element can change it
+        
+        Post-processing only looks across element boundaries for newline runs and for
+        \\author{...} and \\begin{abstract}...\\end{abstract}, so trailing newlines are
+        held until the next batch and text is held while one of those spans is open.
+        The output is the same as post-processing the whole document at once.
+        """
+        pending: List[str] = []
+        pending_chars = 0
+        open_spans = [False] * len(SPANS)
+        for section_count, result in enumerate(recognition_results):
+            chunk = self._convert_element(result, section_count)
+            if not chunk:
+                continue
+            pending.append(chunk)
+            pending_chars += len(chunk)
+            if '\\' in chunk:
+                for i, (start, end) in enumerate(SPANS):
+                    position = chunk.rfind(start)
+                    if position != -1:
+                        open_spans[i] = end not in chunk[position + len(start):]
+                    elif open_spans[i] and end in chunk:
+                        open_spans[i] = False
+            elif open_spans[0] and '}' in chunk:
+                open_spans[0] = False
+            if pending_chars < WRITE_BATCH_CHARS or any(open_spans):
+                continue
+            
+            content = ''.join(pending)
+            body = content.rstrip('\n')
+            processed = self._post_process(body)
+            written = processed.rstrip('\n')
+            out.write(written)
+            pending = [processed[len(written):] + content[len(body):]]
+            pending_chars = len(pending[0])
+        out.write(self._post_process(''.join(pending)))
 
-            # Fix other common LaTeX issues
-            replacements = [
-                # Fix spacing issues in subscripts and superscripts
-                (r'_ {', r'_{'),
-                (r'^ {', r'^{'),
-                
-                # Fix potential issues with multiple consecutive newlines
-                (r'\n{3,}', r'\n\n')
-            ]
+    def _post_process(self, markdown_content: str) -> str:
+        """
+        Apply post-processing fixes to the generated markdown content
+        """
+        try:
+            # Replace \author{...} with processed content
+            if '\\author{' in markdown_content:
+                markdown_content = AUTHOR_PATTERN.sub(
+                    lambda match: self._handle_text(match.group(1)), markdown_content
+                )
             
-            for old, new in replacements:
-                markdown_content = re.sub(old, new, markdown_content)
+            # Replace LaTeX abstract environment (or a \begin{abstract} without an end) with plain text
+            if '\\begin{abstract}' in markdown_content:
+                markdown_content = ABSTRACT_PATTERN.sub(self._replace_abstract, markdown_content)
             
-            return markdown_content
+            return CLEANUP_PATTERN.sub(self._replace_cleanup, markdown_content)
         except Exception as e:
             print(f"_post_process error: {str(e)}")
             return markdown_content  # Return original content if post-processing fails
+
+    @staticmethod
+    def _replace_abstract(match) -> str:
+        if match.group(1) is None:
+            return '**Abstract**'
+        return '**Abstract** ' + match.group(1).replace('\\begin{abstract}', '**Abstract**')
+
+    @classmethod
+    def _replace_cleanup(cls, match) -> str:
+        if match.group('eqno') is not None:
+            # Equation numbers to tag format; the number itself may need the other fixes
+            return '\\tag{' + CLEANUP_PATTERN.sub(cls._replace_cleanup, match.group('eqno')) + '}'
+        if match.group('block_before_eqno') is not None:
+            return '$$ \\'
+        if match.group('block_end') is not None:
+            return '\\\\ $$'
+        text = match.group(0)
+        if text == '_ {':
+            return '_{'
+        if text[0] == '\n':
+            return '\n\n'
+        # Start of a block formula, possibly closed right away
+        close = match.group('block_close')
+        return '$$ \\\\' + (close[:-2] + '$$' if close else '')
@@ -300,7 +300,7 @@ class StoppingCriteriaScores(StoppingCriteria):
         self.varvars.push(self.vars.variance())
         self.size += 1
         if self.size < self.window_size:
-            return False
+            return torch.zeros(len(last_scores), dtype=torch.bool, device=input_ids.device)
 
         varvar = self.varvars.variance()
         for b in range(len(last_scores)):
@@ -312,7 +312,10 @@ class StoppingCriteriaScores(StoppingCriteria):
             else:
                 self.stop_inds[b] = 0
                 self.stopped[b] = False
-        return all(self.stopped.values()) and len(self.stopped) > 0
+        # One flag per row, so generate() pads out rows that stopped while the rest continue
+        return torch.tensor(
+            [self.stopped[b] for b in range(len(last_scores))], dtype=torch.bool, device=input_ids.device
+        )
 
 
 def batch(l, b=15):
@@ -423,9 +426,15 @@ class DonutModel(PreTrainedModel):
         """
         Generate a token sequence in an auto-regressive manner.
 
+        Several images can be decoded at once: the encoder runs one forward over
+        the stacked images and ``generate`` decodes all rows together, padding
+        rows that finish early. Outputs are returned per row, in input order.
+
         Args:
+            prompt_ids: (1, sequence_length), shared by every image, or
+                (batch_size, sequence_length) with one prompt of equal length per image
             image: input document image (PIL.Image)
-            image_tensors: (1, num_channels, height, width)
+            image_tensors: (batch_size, num_channels, height, width)
                 convert prompt to tensor if image_tensor is not fed
         """
         output = {
@@ -446,6 +455,13 @@ class DonutModel(PreTrainedModel):
 
         image_tensors = image_tensors.to(self.device)
         prompt_ids = prompt_ids.to(self.device)
+        if prompt_ids.size(0) == 1 and image_tensors.size(0) > 1:
+            prompt_ids = prompt_ids.expand(image_tensors.size(0), -1)
+        elif prompt_ids.size(0) != image_tensors.size(0):
+            raise ValueError(
+                f"Got {prompt_ids.size(0)} prompts for {image_tensors.size(0)} images; "
+                "pass one shared prompt or one per image"
+            )
         last_hidden_state = self.vpm(image_tensors, text_embedding=self.get_input_embeddings(prompt_ids))
 
         encoder_outputs = ModelOutput(last_hidden_state=last_hidden_state, attentions=None)
@@ -69,3 +69,7 @@ class DolphinProcessor:
         if return_img_size:
             return self.transform(image).unsqueeze(0), (origin_w, origin_h)
         return self.transform(image).unsqueeze(0)
+
+    def process_images_for_inference(self, images):
+        """Resize, pad and stack several images into one (batch_size, C, H, W) tensor"""
+        return torch.cat([self.process_image_for_inference(image) for image in images], dim=0)
@@ -4,10 +4,11 @@ SPDX-License-Identifier: MIT
 """
 
 import copy
-import io
 import json
 import os
+import queue
 import re
+import threading
 from dataclasses import dataclass
 from typing import List, Tuple
 
@@ -52,37 +53,105 @@ def save_figure_to_local(pil_crop, save_dir, image_name, reading_order):
         return f"{image_name}_figure_{reading_order:03d}_error.png"
 
 
-def convert_pdf_to_images(pdf_path, target_size=896):
-    """Convert PDF pages to images
+def render_pdf_page(page, target_size=896):
+    """Render one PDF page straight from the pixmap buffer
 
     Args:
-        pdf_path: Path to PDF file
+        page: pymupdf page
         target_size: Target size for the longest dimension
 
     Returns:
-        List of PIL Images
+        PIL Image (RGB) backed by a NumPy array, without a PNG encode/decode
     """
-    images = []
-    try:
-        doc = pymupdf.open(pdf_path)
+    # Calculate scale to make longest dimension equal to target_size
+    rect = page.rect
+    scale = target_size / max(rect.width, rect.height)
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale), colorspace=pymupdf.csRGB, alpha=False)
 
-        for page_num in range(len(doc)):
-            page = doc[page_num]
+    # Rows may be padded past width * 3 bytes, so slice by stride
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+    pixels = pixels[:, : pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+    return Image.fromarray(pixels, "RGB")
 
-            # Calculate scale to make longest dimension equal to target_size
-            rect = page.rect
-            scale = target_size / max(rect.width, rect.height)
 
-            # Render page as image
-            mat = pymupdf.Matrix(scale, scale)
-            pix = page.get_pixmap(matrix=mat)
+def iter_pdf_images(pdf_path, target_size=896, first_page=0, last_page=None, prefetch=4):
+    """Stream PDF pages as images, rendering ahead of the consumer
+
+    A background thread renders pages into a bounded queue, so rasterizing
+    the next pages overlaps with inference on the current one (pymupdf holds
+    the GIL while rendering, torch releases it while computing) and at most
+    ``prefetch`` rendered pages are held in memory however long the PDF is.
+
+    Args:
+        pdf_path: Path to PDF file
+        target_size: Target size for the longest dimension
+        first_page: Index of the first page to render (0-based)
+        last_page: Index one past the last page to render, None for the end
+        prefetch: Rendered pages buffered ahead of the consumer
+
+    Yields:
+        (page_num, PIL Image) in page order, page_num 0-based
+
+    Raises:
+        Whatever pymupdf raised while opening or rendering the PDF
+    """
+    pages = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def render():
+        try:
+            with pymupdf.open(pdf_path) as doc:
+                end = len(doc) if last_page is None else min(last_page, len(doc))
+                for page_num in range(first_page, end):
+                    if not put((page_num, render_pdf_page(doc[page_num], target_size))):
+                        return
+        except Exception as e:
+            put(e)
+            return
+        put(done)
+
+    renderer = threading.Thread(target=render, name="pdf-render", daemon=True)
+    renderer.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Also reached when the consumer stops early: unblock and retire the renderer
+        stop.set()
+        renderer.join()
+
+
+def convert_pdf_to_images(pdf_path, target_size=896, first_page=0, last_page=None):
+    """Convert PDF pages to images
+
+    Materializes ``iter_pdf_images``; prefer the iterator for long PDFs.
 
-            # Convert to PIL Image
-            img_data = pix.tobytes("png")
-            pil_image = Image.open(io.BytesIO(img_data))
-            images.append(pil_image)
+    Args:
+        pdf_path: Path to PDF file
+        target_size: Target size for the longest dimension
+        first_page: Index of the first page to render (0-based)
+        last_page: Index one past the last page to render, None for the end
 
-        doc.close()
+    Returns:
+        List of PIL Images
+    """
+    try:
+        images = [image for _, image in iter_pdf_images(pdf_path, target_size, first_page, last_page)]
         print(f"Successfully converted {len(images)} pages from PDF")
         return images
 
@@ -96,6 +165,29 @@ def is_pdf_file(file_path):
     return file_path.lower().endswith(".pdf")
 
 
+def iter_pdf_elements(all_page_results):
+    """Elements of all pages in order, with a separator element between pages that have any
+
+    Args:
+        all_page_results: List of results for all pages
+
+    Yields:
+        Recognition results, as the combined markdown conversion expects them
+    """
+    count = 0
+    for page_data in all_page_results:
+        page_elements = page_data.get("elements", [])
+        if not page_elements:
+            continue
+        # Add page separator if not the first page
+        if count:
+            yield {"label": "page_separator", "text": "\n\n---\n\n", "reading_order": count}
+            count += 1
+        for element in page_elements:
+            yield element
+            count += 1
+
+
 def save_combined_pdf_results(all_page_results, pdf_path, save_dir):
     """Save combined results for multi-page PDF with both JSON and Markdown
 
@@ -125,28 +217,13 @@ def save_combined_pdf_results(all_page_results, pdf_path, save_dir):
     try:
         markdown_converter = MarkdownConverter()
 
-        # Combine all page results into a single list for markdown conversion
-        all_elements = []
-        for page_data in all_page_results:
-            page_elements = page_data.get("elements", [])
-            if page_elements:
-                # Add page separator if not the first page
-                if all_elements:
-                    all_elements.append(
-                        {"label": "page_separator", "text": f"\n\n---\n\n", "reading_order": len(all_elements)}
-                    )
-                all_elements.extend(page_elements)
-
-        # Generate markdown content
-        markdown_content = markdown_converter.convert(all_elements)
-
-        # Save markdown file
+        # Stream the markdown straight to the file, page by page
         markdown_filename = f"{base_name}.md"
         markdown_path = os.path.join(save_dir, "markdown", markdown_filename)
         os.makedirs(os.path.dirname(markdown_path), exist_ok=True)
 
         with open(markdown_path, "w", encoding="utf-8") as f:
-            f.write(markdown_content)
+            markdown_converter.convert(iter_pdf_elements(all_page_results), out=f)
 
         # print(f"Combined markdown saved to: {markdown_path}")
 
@@ -1,30 +1,435 @@
+"""
+Parallel Dolphin OCR driver
+Splits the PDFs in pdf_by_chapter into page-range tasks and runs them on a
+pool of workers (one per GPU, or N CPU workers) that each load Dolphin
+once. Pages are triaged first (triage.yaml) so blank pages and back
+matter cost no inference, and every page's result is cached under a hash
+of its pixels so a revised PDF only re-runs the pages that changed. Failed
+tasks are retried, and finished files are recorded in a manifest so an
+interrupted run resumes where it stopped.
+
+Examples:
+    # One worker per GPU in CUDA_VISIBLE_DEVICES
+    python ocr.py
+    
+    # Explicit GPUs, 16-page tasks
+    python ocr.py --gpus 0,1,2,3 --pages-per-task 16
+    
+    # CPU-only node
+    python ocr.py --cpu-workers 4
+    
+    # Every page through the full pipeline
+    python ocr.py --no-triage
+"""
+
 import os
-import subprocess
-
-PDF_DIR = 'pdf_by_chapter'
-OUTPUT_DIR = 'output'
-DEMO_SCRIPT = 'demo_page.py'
-CONFIG_PATH = os.path.join('config', 'Dolphin.yaml')
-
-# Ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# List all PDF files in the input directory
-pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith('.pdf')]
-
-for pdf_file in pdf_files:
-    input_path = os.path.join(PDF_DIR, pdf_file)  # relative to current dir
-    output_path = OUTPUT_DIR                      # relative to current dir
-    print(f'Processing: {input_path}')
-    cmd = [
-        'python', DEMO_SCRIPT,
-        '--config', CONFIG_PATH,
-        '--input_path', input_path,
-        '--save_dir', output_path
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True, cwd='Dolphin')
-    if result.returncode == 0:
-        print(f'Successfully processed {pdf_file}')
-    else:
-        print(f'Error processing {pdf_file}:')
-        print(result.stderr)
+import sys
+import json
+import time
+import queue
+import shutil
+import signal
+import argparse
+import multiprocessing as mp
+from collections import deque
+from dataclasses import asdict
+from typing import Dict, Any, List, Optional
+
+from triage import DEFAULT_RULES, TriageRules, load_rules, plan_pages, summarize
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DOLPHIN_DIR = os.path.join(SCRIPT_DIR, 'Dolphin')
+PDF_DIR = os.path.join(SCRIPT_DIR, 'pdf_by_chapter')
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, 'output')
+CONFIG_PATH = os.path.join(DOLPHIN_DIR, 'config', 'Dolphin.yaml')
+MANIFEST_NAME = 'ocr_manifest.jsonl'
+PARTS_DIR_NAME = 'parts'
+CACHE_DIR_NAME = 'page_cache'
+
+def file_fingerprint(path: str) -> Dict[str, Any]:
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+def load_manifest(path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest manifest entry per file; a torn last line from a killed run is ignored"""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry['file']] = entry
+    return entries
+
+def append_manifest(path: str, entry: Dict[str, Any]) -> None:
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def count_pages(pdf_path: str) -> int:
+    import pymupdf
+    with pymupdf.open(pdf_path) as doc:
+        return len(doc)
+
+def part_path(parts_dir: str, pdf_file: str, first_page: int, last_page: int) -> str:
+    base_name = os.path.splitext(pdf_file)[0]
+    return os.path.join(parts_dir, base_name, f"pages_{first_page + 1:04d}_{last_page:04d}.json")
+
+def read_part(path: str, fingerprint: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """Pages from a finished task, or None if missing or from an older copy of the PDF"""
+    try:
+        with open(path, 'r') as f:
+            part = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return part['pages'] if part.get('fingerprint') == fingerprint else None
+
+def write_part(path: str, fingerprint: Dict[str, Any], pages: List[Dict[str, Any]]) -> None:
+    """Atomically, so a killed worker never leaves a half-written part behind"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'fingerprint': fingerprint, 'pages': pages}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def worker_main(worker_id: int, device: str, args: Dict[str, Any], inbox, outbox) -> None:
+    """Load Dolphin once, then process page-range tasks until told to stop"""
+    if device.startswith('cuda:'):
+        # Pin the worker to its GPU before torch initializes CUDA
+        os.environ['CUDA_VISIBLE_DEVICES'] = device.split(':', 1)[1]
+        device = 'cuda'
+    sys.path.insert(0, SCRIPT_DIR)
+    import torch
+    from pipeline import DolphinModel, process_pdf_pages
+    from page_cache import PageCache
+    from triage import TriageRules
+    
+    if device == 'cpu' and args['cpu_threads']:
+        torch.set_num_threads(args['cpu_threads'])
+    start = time.time()
+    model = DolphinModel(args['config'], device=device)
+    rules = TriageRules(**args['triage'])
+    cache = None
+    if args['cache_dir']:
+        namespace = PageCache.namespace_for({'model': model.fingerprint, 'triage': args['triage']})
+        cache = PageCache(args['cache_dir'], namespace, read=not args['force'])
+    outbox.put(('ready', worker_id, None, time.time() - start))
+    
+    while True:
+        task = inbox.get()
+        if task is None:
+            return
+        start = time.time()
+        try:
+            pages = process_pdf_pages(model, task['pdf_path'], args['output_dir'], task['first_page'],
+                                      task['last_page'], args['max_batch_size'], args['prefetch_pages'],
+                                      rules, task['planned'], cache)
+            write_part(task['part_path'], task['fingerprint'], pages)
+        except Exception as e:
+            outbox.put(('failed', worker_id, task['id'], f"{type(e).__name__}: {e}"))
+        else:
+            outbox.put(('done', worker_id, task['id'], time.time() - start))
+
+class OCRDriver:
+    """Work queue of page-range tasks over a pool of model workers
+    
+    Tasks are handed to idle workers one at a time, so the driver always
+    knows what a worker was doing if it dies: the task is retried (up to
+    ``max_retries`` times) and the worker restarted. When every range of a
+    PDF is done its parts are merged into the usual recognition JSON and
+    markdown, and the file is recorded in the manifest.
+    """
+    
+    def __init__(self, devices: List[str], args: Dict[str, Any], max_retries: int = 2):
+        self.devices = devices
+        self.args = args
+        self.max_retries = max_retries
+        self.output_dir = args['output_dir']
+        self.parts_dir = os.path.join(self.output_dir, PARTS_DIR_NAME)
+        self.manifest_path = os.path.join(self.output_dir, MANIFEST_NAME)
+        self.context = mp.get_context('spawn')
+        self.outbox = self.context.Queue()
+        self.workers: Dict[int, Dict[str, Any]] = {}
+        self.tasks: Dict[int, Dict[str, Any]] = {}
+        self.pending: deque = deque()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.rules = TriageRules(**args['triage'])
+        self.full_page_seconds: Optional[float] = None
+        self.triage_totals = {'pages': 0, 'pages_skipped': 0, 'pages_layout_only': 0, 'pages_cached': 0,
+                              'seconds_saved': 0.0}
+        self.startup_failures = 0
+    
+    def plan(self, pdf_files: List[str], pages_per_task: int, force: bool = False) -> None:
+        """Queue the page ranges still missing for every PDF not already in the manifest"""
+        manifest = {} if force else load_manifest(self.manifest_path)
+        for pdf_file in pdf_files:
+            pdf_path = os.path.join(self.args['pdf_dir'], pdf_file)
+            fingerprint = file_fingerprint(pdf_path)
+            entry = manifest.get(pdf_file)
+            if entry and entry.get('status') == 'done' and entry.get('fingerprint') == fingerprint:
+                print(f"⏭️  {pdf_file}: already done")
+                continue
+            try:
+                num_pages = count_pages(pdf_path)
+                planned = plan_pages(pdf_path, self.rules)
+            except Exception as e:
+                print(f"❌ {pdf_file}: cannot open ({e})")
+                self.files[pdf_file] = {'remaining': 0, 'failed': str(e)}
+                self._record(pdf_file, fingerprint, 'failed', error=str(e))
+                continue
+            
+            ranges = [(start, min(start + pages_per_task, num_pages))
+                      for start in range(0, num_pages, pages_per_task)]
+            state = {'pdf_path': pdf_path, 'fingerprint': fingerprint, 'num_pages': num_pages,
+                     'parts': [], 'remaining': 0, 'failed': None, 'seconds': 0.0}
+            self.files[pdf_file] = state
+            resumed = 0
+            for first_page, last_page in ranges:
+                path = part_path(self.parts_dir, pdf_file, first_page, last_page)
+                state['parts'].append(path)
+                if not force and read_part(path, fingerprint) is not None:
+                    resumed += 1
+                    continue
+                task_id = len(self.tasks)
+                self.tasks[task_id] = {
+                    'id': task_id, 'file': pdf_file, 'pdf_path': pdf_path, 'fingerprint': fingerprint,
+                    'first_page': first_page, 'last_page': last_page, 'part_path': path, 'attempts': 0,
+                    'planned': {page: planned[page] for page in range(first_page, last_page) if page in planned}
+                }
+                self.pending.append(task_id)
+                state['remaining'] += 1
+            print(f"📄 {pdf_file}: {num_pages} pages in {len(ranges)} tasks"
+                  + (f" ({resumed} already done)" if resumed else "")
+                  + (f", {len(planned)} pages triaged by rules" if planned else ""))
+            if state['remaining'] == 0:
+                self._finish_file(pdf_file)
+    
+    def _start_worker(self, worker_id: int) -> None:
+        inbox = self.context.Queue()
+        process = self.context.Process(
+            target=worker_main, args=(worker_id, self.devices[worker_id], self.args, inbox, self.outbox),
+            daemon=True
+        )
+        process.start()
+        self.workers[worker_id] = {'process': process, 'inbox': inbox, 'task': None, 'ready': False}
+    
+    def _dispatch(self) -> None:
+        for worker_id, worker in self.workers.items():
+            if worker['ready'] and worker['task'] is None and self.pending:
+                task_id = self.pending.popleft()
+                task = self.tasks[task_id]
+                task['attempts'] += 1
+                worker['task'] = task_id
+                worker['inbox'].put({key: task[key] for key in
+                                     ('id', 'pdf_path', 'fingerprint', 'first_page', 'last_page', 'part_path',
+                                      'planned')})
+    
+    def _task_failed(self, task_id: int, error: str) -> None:
+        task = self.tasks[task_id]
+        label = f"{task['file']} pages {task['first_page'] + 1}-{task['last_page']}"
+        if task['attempts'] <= self.max_retries:
+            print(f"🔁 {label} failed ({error}); retry {task['attempts']}/{self.max_retries}")
+            self.pending.append(task_id)
+            return
+        print(f"❌ {label} failed after {task['attempts']} attempts: {error}")
+        state = self.files[task['file']]
+        state['failed'] = error
+        state['remaining'] -= 1
+        if state['remaining'] == 0:
+            self._finish_file(task['file'])
+    
+    def _task_done(self, task_id: int, seconds: float) -> None:
+        task = self.tasks[task_id]
+        state = self.files[task['file']]
+        state['remaining'] -= 1
+        state['seconds'] += seconds
+        pages = task['last_page'] - task['first_page']
+        print(f"✅ {task['file']} pages {task['first_page'] + 1}-{task['last_page']} "
+              f"in {seconds:.1f}s ({pages / seconds * 60 if seconds else 0:.1f} pages/min)")
+        if state['remaining'] == 0:
+            self._finish_file(task['file'])
+    
+    def _record(self, pdf_file: str, fingerprint: Dict[str, Any], status: str, **extra) -> None:
+        append_manifest(self.manifest_path, {
+            'file': pdf_file, 'fingerprint': fingerprint, 'status': status,
+            'completed_at': time.time(), **extra
+        })
+    
+    def _finish_file(self, pdf_file: str) -> None:
+        """Merge a PDF's parts into recognition JSON and markdown, then record it"""
+        from utils.utils import save_combined_pdf_results
+        
+        state = self.files[pdf_file]
+        if state['failed']:
+            self._record(pdf_file, state['fingerprint'], 'failed', error=state['failed'])
+            return
+        pages = []
+        for path in state['parts']:
+            part = read_part(path, state['fingerprint'])
+            if part is None:
+                self._record(pdf_file, state['fingerprint'], 'failed', error=f"missing part {path}")
+                return
+            pages.extend(part)
+        json_path = save_combined_pdf_results(pages, state['pdf_path'], self.output_dir)
+        triage = summarize(pages, self.full_page_seconds)
+        self._record(pdf_file, state['fingerprint'], 'done', pages=len(pages),
+                     seconds=round(state['seconds'], 2), json_path=json_path, triage=triage)
+        shutil.rmtree(os.path.join(self.parts_dir, os.path.splitext(pdf_file)[0]), ignore_errors=True)
+        print(f"📚 {pdf_file}: {len(pages)} pages merged into {json_path}")
+        self._report_triage(pdf_file, triage)
+    
+    def _report_triage(self, pdf_file: str, triage: Dict[str, Any]) -> None:
+        if triage['full_page_seconds'] is not None:
+            self.full_page_seconds = triage['full_page_seconds']
+        for key in self.triage_totals:
+            self.triage_totals[key] += triage[key] or 0
+        if not (triage['pages_skipped'] or triage['pages_layout_only'] or triage['elements_skipped']
+                or triage['pages_cached']):
+            return
+        reasons = ', '.join(f"{reason} {count}" for reason, count in sorted(triage['reasons'].items()))
+        saved = f"~{triage['seconds_saved']:.0f}s inference saved" if triage['seconds_saved'] is not None \
+            else "time saved unknown (no fully recognized page yet)"
+        print(f"🔎 {pdf_file}: {triage['pages_cached']} pages from cache, {triage['pages_skipped']} skipped, "
+              f"{triage['pages_layout_only']} layout-only, {triage['elements_skipped']} elements not recognized"
+              + (f" ({reasons})" if reasons else "") + f"; {saved}")
+    
+    def _handle(self, message) -> None:
+        kind, worker_id, task_id, value = message
+        worker = self.workers[worker_id]
+        if kind == 'ready':
+            worker['ready'] = True
+            print(f"🐬 Worker {worker_id} ({self.devices[worker_id]}) loaded Dolphin in {value:.1f}s")
+            return
+        if worker['task'] != task_id:
+            # From a worker that has since died and had its task requeued
+            return
+        worker['task'] = None
+        if kind == 'done':
+            self._task_done(task_id, value)
+        else:
+            self._task_failed(task_id, value)
+    
+    def _drain_outbox(self) -> None:
+        while True:
+            try:
+                self._handle(self.outbox.get_nowait())
+            except queue.Empty:
+                return
+    
+    def _check_workers(self) -> None:
+        """Retry the task of any worker that died and start a replacement"""
+        for worker_id, worker in list(self.workers.items()):
+            process = worker['process']
+            if process.is_alive():
+                continue
+            # It may have reported its task just before exiting
+            self._drain_outbox()
+            if not worker['ready']:
+                self.startup_failures += 1
+                print(f"❌ Worker {worker_id} ({self.devices[worker_id]}) exited with code "
+                      f"{process.exitcode} while loading the model")
+                if self.startup_failures > self.max_retries * len(self.devices):
+                    raise RuntimeError("Workers keep failing to load Dolphin; giving up")
+            else:
+                print(f"⚠️  Worker {worker_id} exited with code {process.exitcode}; restarting")
+            if worker['task'] is not None:
+                self._task_failed(worker['task'], f"worker exited with code {process.exitcode}")
+            self._start_worker(worker_id)
+    
+    def run(self) -> bool:
+        """Process every planned task; True if no file failed"""
+        if self.pending:
+            print(f"🚀 {len(self.pending)} tasks on {len(self.devices)} workers ({', '.join(self.devices)})")
+            for worker_id in range(len(self.devices)):
+                self._start_worker(worker_id)
+        
+        try:
+            while any(state['remaining'] for state in self.files.values()):
+                self._check_workers()
+                self._dispatch()
+                try:
+                    message = self.outbox.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                self._handle(message)
+        finally:
+            for worker in self.workers.values():
+                if worker['process'].is_alive():
+                    worker['inbox'].put(None)
+            for worker in self.workers.values():
+                worker['process'].join(timeout=30)
+                if worker['process'].is_alive():
+                    worker['process'].terminate()
+        return not any(state['failed'] for state in self.files.values())
+
+def resolve_devices(gpus: Optional[str], cpu_workers: int) -> List[str]:
+    """One device per worker: listed GPUs, else CUDA_VISIBLE_DEVICES, else CPU workers"""
+    if gpus is None and cpu_workers <= 0:
+        gpus = os.environ.get('CUDA_VISIBLE_DEVICES')
+    if gpus:
+        return [f"cuda:{gpu.strip()}" for gpu in gpus.split(',') if gpu.strip()]
+    return ['cpu'] * max(1, cpu_workers)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run Dolphin OCR over a directory of PDFs')
+    parser.add_argument('--pdf-dir', default=PDF_DIR)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--config', default=CONFIG_PATH, help='Dolphin model config')
+    parser.add_argument('--gpus', default=None,
+                        help='Comma-separated GPU ids, one worker each (default: CUDA_VISIBLE_DEVICES)')
+    parser.add_argument('--cpu-workers', type=int, default=0, help='CPU workers when no GPU is used')
+    parser.add_argument('--pages-per-task', type=int, default=32,
+                        help='Page range handed to a worker at a time')
+    parser.add_argument('--max-batch-size', type=int, default=16, help='Element crops recognized per batch')
+    parser.add_argument('--prefetch-pages', type=int, default=4,
+                        help='Pages rendered ahead of inference per worker')
+    parser.add_argument('--max-retries', type=int, default=2, help='Retries per task before its file fails')
+    parser.add_argument('--force', action='store_true',
+                        help='Ignore the manifest, finished parts and page cache (the cache is refreshed)')
+    parser.add_argument('--cache-dir', default=None,
+                        help=f"Page cache directory (default: <output-dir>/{CACHE_DIR_NAME})")
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the page cache')
+    parser.add_argument('--triage-rules', default=DEFAULT_RULES, help='Page triage rules (YAML)')
+    parser.add_argument('--no-triage', action='store_true', help='Run every page through the full pipeline')
+    args = parser.parse_args()
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    sys.path.insert(0, DOLPHIN_DIR)
+    
+    pdf_files = sorted(f for f in os.listdir(args.pdf_dir) if f.lower().endswith('.pdf'))
+    devices = resolve_devices(args.gpus, args.cpu_workers)
+    cpu_threads = max(1, (os.cpu_count() or 1) // len(devices)) if devices[0] == 'cpu' else 0
+    print(f"🐬 Dolphin OCR: {len(pdf_files)} PDFs in {args.pdf_dir} -> {args.output_dir}")
+    
+    driver = OCRDriver(devices, {
+        'config': args.config,
+        'pdf_dir': args.pdf_dir,
+        'output_dir': args.output_dir,
+        'max_batch_size': args.max_batch_size,
+        'prefetch_pages': args.prefetch_pages,
+        'cache_dir': None if args.no_cache else (args.cache_dir or os.path.join(args.output_dir, CACHE_DIR_NAME)),
+        'force': args.force,
+        'triage': asdict(TriageRules(enabled=False) if args.no_triage else load_rules(args.triage_rules)),
+        'cpu_threads': cpu_threads
+    }, max_retries=args.max_retries)
+    driver.plan(pdf_files, args.pages_per_task, force=args.force)
+    # Preemption (SIGTERM) stops the workers cleanly; finished parts are kept for the rerun
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(143))
+    start = time.time()
+    ok = driver.run()
+    
+    done = sum(1 for state in driver.files.values() if not state['failed'])
+    print(f"\n🎉 {done}/{len(driver.files)} PDFs processed in {time.time() - start:.1f}s "
+          f"(manifest: {driver.manifest_path})")
+    totals = driver.triage_totals
+    if totals['pages_skipped'] or totals['pages_layout_only'] or totals['pages_cached']:
+        print(f"🔎 Of {totals['pages']} pages: {totals['pages_cached']} from cache, {totals['pages_skipped']} "
+              f"skipped, {totals['pages_layout_only']} layout-only; ~{totals['seconds_saved']:.0f}s inference saved")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
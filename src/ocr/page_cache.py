@@ -0,0 +1,101 @@
+"""
+Content-addressed OCR page cache
+Stores the recognition result of every page under a hash of its rendered
+pixels, so re-running OCR on a revised PDF only runs the model on pages
+that actually changed
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+class PageCache:
+    """Recognition JSON per page, keyed by the page's pixels and the pipeline settings
+    
+    ``namespace`` identifies everything besides the pixels that shapes the
+    result (model config and checkpoint, triage rules); changing any of them
+    starts a fresh namespace instead of serving stale pages. Figures are
+    stored with the entry and restored under the current page's file names,
+    so a page that moved (e.g. after a page was inserted earlier) still gets
+    correctly named figures.
+    """
+    
+    def __init__(self, root: str, namespace: str, read: bool = True):
+        self.root = os.path.join(root, namespace)
+        self.read = read
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def namespace_for(settings: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    
+    @staticmethod
+    def page_key(image, planned: Optional[Tuple[str, str]] = None) -> str:
+        """Hash of the rendered page (and any rule-based triage decision for it)
+        
+        Identical pages in different PDFs share an entry.
+        """
+        pixels = np.ascontiguousarray(np.asarray(image))
+        digest = hashlib.sha256(f"{image.mode}:{image.size}:{list(planned or [])}".encode('utf-8'))
+        digest.update(pixels.data)
+        return digest.hexdigest()
+    
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+    
+    def _figure_path(self, key: str, reading_order: int) -> str:
+        return os.path.join(self.root, key[:2], f"{key}_figure_{reading_order:03d}.png")
+    
+    def get(self, key: str, save_dir: str,
+            image_name: str) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+        """Cached (elements, triage) for a page, with its figures restored into ``save_dir``"""
+        if not self.read:
+            self.misses += 1
+            return None
+        try:
+            with open(self._entry_path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        
+        elements = entry['elements']
+        figures_dir = os.path.join(save_dir, 'markdown', 'figures')
+        for element in elements:
+            if element.get('label') != 'fig' or 'figure_path' not in element:
+                continue
+            figure_filename = f"{image_name}_figure_{element['reading_order']:03d}.png"
+            try:
+                shutil.copyfile(self._figure_path(key, element['reading_order']),
+                                os.path.join(figures_dir, figure_filename))
+            except OSError:
+                # A figure went missing from the cache: recompute the page
+                self.misses += 1
+                return None
+            element['figure_path'] = f"figures/{figure_filename}"
+            element['text'] = f"![Figure](figures/{figure_filename})"
+        self.hits += 1
+        return elements, entry['triage']
+    
+    def put(self, key: str, elements: List[Dict[str, Any]], triage: Dict[str, Any], save_dir: str) -> None:
+        """Store a page's result and copies of its figures; the entry is written last"""
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        for element in elements:
+            if element.get('label') == 'fig' and 'figure_path' in element:
+                source = os.path.join(save_dir, 'markdown', element['figure_path'])
+                if os.path.exists(source):
+                    shutil.copyfile(source, self._figure_path(key, element['reading_order']))
+        
+        tmp_path = f"{entry_path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'elements': elements, 'triage': triage}, f, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+    
+    def get_stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,312 @@
+"""
+Dolphin page pipeline
+Loads the Dolphin model once and runs layout parsing plus element
+recognition over PDF pages in-process, so a worker can process many PDFs
+without reloading weights
+"""
+
+import os
+import sys
+import time
+import hashlib
+from typing import Dict, Any, List, Optional, Collection, Tuple
+
+import cv2
+import torch
+from omegaconf import OmegaConf
+from PIL import Image
+from transformers import PreTrainedTokenizerFast
+
+DOLPHIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Dolphin')
+sys.path.insert(0, DOLPHIN_DIR)
+
+from utils.model import DonutConfig, DonutModel, SwinEncoder
+from utils.processor import DolphinProcessor
+from page_cache import PageCache
+from triage import TriageRules, classify_page, SKIP, LAYOUT, FULL
+from utils.utils import (
+    iter_pdf_images, parse_layout_string, prepare_image, process_coordinates,
+    save_figure_to_local, setup_output_dirs
+)
+
+DEFAULT_CONFIG = os.path.join(DOLPHIN_DIR, 'config', 'Dolphin.yaml')
+
+LAYOUT_PROMPT = "Parse the reading order of this document."
+TEXT_PROMPT = "Read text in the image."
+TABLE_PROMPT = "Parse the table in the image."
+
+# Inference settings (the ``inference`` section of Dolphin.yaml) when it is absent
+INFERENCE_DEFAULTS = {
+    'precision': 'fp32',
+    'quantize_decoder': False,
+    'compile_encoder': False
+}
+
+def _resolve(path: str) -> str:
+    """Checkpoint paths in Dolphin.yaml are relative to the Dolphin directory"""
+    return path if os.path.isabs(path) else os.path.join(DOLPHIN_DIR, path)
+
+class DolphinModel:
+    """DonutModel with its tokenizer and image processor, loaded once
+    
+    The ``inference`` section of the config selects the inference mode;
+    ``inference`` overrides single keys of it (e.g. for benchmarks).
+    """
+    
+    def __init__(self, config_path: str = DEFAULT_CONFIG, device: Optional[str] = None,
+                 inference: Optional[Dict[str, Any]] = None):
+        config = OmegaConf.load(config_path)
+        model_args = config.model
+        self.inference_mode = {**INFERENCE_DEFAULTS,
+                               **OmegaConf.to_container(config.get('inference') or OmegaConf.create({})),
+                               **(inference or {})}
+        self.fingerprint = self._fingerprint(config_path, model_args)
+        self.fingerprint['inference'] = self.inference_mode
+        swin_args = OmegaConf.to_container(model_args.pop('swin_args'))
+        self.extra_answer_tokens = model_args.get('extra_answer_tokens', False)
+        
+        tokenizer = PreTrainedTokenizerFast(tokenizer_file=_resolve(model_args.tokenizer_path))
+        tokenizer.pad_token = "<pad>"
+        tokenizer.bos_token = "<s>"
+        tokenizer.eos_token = "</s>"
+        tokenizer.unk_token = "<unk>"
+        if self.extra_answer_tokens:
+            prompt_end_token = " <Answer/>"
+            tokenizer.add_special_tokens({"additional_special_tokens": [prompt_end_token]})
+            tokenizer._prompt_end_token = prompt_end_token
+            tokenizer._prompt_end_token_id = tokenizer.convert_tokens_to_ids(prompt_end_token)
+        self.tokenizer = tokenizer
+        
+        donut_config = DonutConfig(
+            decoder_layer=model_args.decoder_layer,
+            max_length=model_args.max_length,
+            max_position_embeddings=model_args.max_position_embeddings,
+            hidden_dimension=model_args.hidden_dimension
+        )
+        vision_tower = SwinEncoder(
+            input_size=swin_args['img_size'],
+            patch_size=swin_args['patch_size'],
+            embed_dim=swin_args['embed_dim'],
+            window_size=swin_args['window_size'],
+            encoder_layer=swin_args['encoder_layer'],
+            num_heads=swin_args['num_heads'],
+            align_long_axis=swin_args['align_long_axis']
+        )
+        self.model = DonutModel(config=donut_config, vision_tower=vision_tower, tokenizer=tokenizer)
+        if model_args.get('model_name_or_path'):
+            state_dict = torch.load(_resolve(model_args.model_name_or_path), map_location='cpu')
+            self.model.load_state_dict(state_dict, strict=True)
+        
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.model.to(self.device)
+        self.model.eval()
+        self._apply_inference_mode()
+        self.processor = DolphinProcessor(
+            {}, tokenizer, transform_args={'input_size': swin_args['img_size'], 'max_length': model_args.max_length}
+        )
+    
+    def _apply_inference_mode(self) -> None:
+        """Cast, quantize and/or compile the loaded model as ``inference_mode`` asks
+        
+        - precision: fp32, bf16, or fp16 (CUDA only); inputs are cast to match
+          in DonutModel.inference
+        - quantize_decoder: int8 dynamic quantization of the BART decoder's
+          Linear layers (CPU, fp32 only); the encoder stays in float
+        - compile_encoder: torch.compile the Swin encoder (torch >= 2.0); the
+          first batch of each new size pays the compilation
+        """
+        mode = self.inference_mode
+        dtypes = {'fp32': torch.float32, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+        if mode['precision'] not in dtypes:
+            raise ValueError(f"Unknown precision '{mode['precision']}' (expected one of {', '.join(dtypes)})")
+        if mode['precision'] == 'fp16' and self.device.type != 'cuda':
+            raise ValueError("fp16 inference needs a CUDA device; use bf16 on CPU")
+        if mode['quantize_decoder'] and (self.device.type != 'cpu' or mode['precision'] != 'fp32'):
+            raise ValueError("quantize_decoder is int8 dynamic quantization: CPU and fp32 only")
+        if mode['compile_encoder'] and not hasattr(torch, 'compile'):
+            raise ValueError(f"compile_encoder needs torch >= 2.0 (found {torch.__version__})")
+        
+        if mode['precision'] != 'fp32':
+            self.model.to(dtypes[mode['precision']])
+        if mode['quantize_decoder']:
+            # In place: a copy would also deep-copy the decoder wrapper bound into generate()
+            torch.ao.quantization.quantize_dynamic(
+                self.model.llm.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+        if mode['compile_encoder']:
+            self.model.vpm = torch.compile(self.model.vpm)
+    
+    @staticmethod
+    def _fingerprint(config_path: str, model_args) -> Dict[str, Any]:
+        """Identifies the config and checkpoint, so cached results from another model are not reused"""
+        with open(config_path, 'rb') as f:
+            fingerprint = {'config': hashlib.sha256(f.read()).hexdigest()}
+        checkpoint = model_args.get('model_name_or_path')
+        if checkpoint and os.path.exists(_resolve(checkpoint)):
+            stat = os.stat(_resolve(checkpoint))
+            fingerprint['checkpoint'] = {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+        return fingerprint
+    
+    def _postprocess(self, output: str, prompt: str) -> str:
+        # Rows that finished early in a batch are padded out to the longest row
+        output = output.replace("<s>", "").replace(prompt, "").replace("</s>", "").replace("<pad>", "")
+        if self.extra_answer_tokens:
+            output = output.split(self.tokenizer._prompt_end_token)[-1]
+        return output.strip()
+    
+    def chat(self, prompt: str, image: Image.Image) -> str:
+        """Answer one prompt about one image"""
+        return self.chat_batch(prompt, [image])[0]
+    
+    def chat_batch(self, prompt: str, images: List[Image.Image]) -> List[str]:
+        """Answer the same prompt for each image in one batched encoder pass and decode"""
+        if not images:
+            return []
+        question = prompt
+        if self.extra_answer_tokens and self.tokenizer._prompt_end_token not in question:
+            question = question + self.tokenizer._prompt_end_token
+        image_tensors = self.processor.process_images_for_inference(images)
+        prompt_ids = self.processor.process_prompt_for_inference(question)
+        with torch.no_grad():
+            output = self.model.inference(prompt_ids=prompt_ids, image_tensors=image_tensors)
+        return [self._postprocess(text, prompt) for text in output["repetitions"]]
+
+def recognize_elements(model: DolphinModel, elements: List[Dict[str, Any]], prompt: str,
+                       max_batch_size: int = 16) -> List[Dict[str, Any]]:
+    """Read the cropped elements of one kind (text or tables) in batches"""
+    results = []
+    for start in range(0, len(elements), max_batch_size):
+        batch = elements[start:start + max_batch_size]
+        texts = model.chat_batch(prompt, [element['crop'] for element in batch])
+        for element, text in zip(batch, texts):
+            results.append({
+                'label': element['label'],
+                'bbox': element['bbox'],
+                'text': text.strip(),
+                'reading_order': element['reading_order']
+            })
+    return results
+
+def process_elements(layout_output: str, padded_image, dims, model: DolphinModel, save_dir: str,
+                     image_name: str, max_batch_size: int = 16, recognize: bool = True,
+                     skip_labels: Collection[str] = ()) -> List[Dict[str, Any]]:
+    """Crop every element of a parsed layout and recognize it (figures are saved as images)
+    
+    With ``recognize`` off, or for labels in ``skip_labels``, elements are
+    kept with their label and box but empty text and ``'triaged': True``.
+    """
+    text_elements, table_elements, figure_results, triaged = [], [], [], []
+    previous_box = None
+    for reading_order, (bbox, label) in enumerate(parse_layout_string(layout_output)):
+        try:
+            x1, y1, x2, y2, orig_x1, orig_y1, orig_x2, orig_y2, previous_box = process_coordinates(
+                bbox, padded_image, dims, previous_box
+            )
+            cropped = padded_image[y1:y2, x1:x2]
+            if cropped.size == 0 or cropped.shape[0] <= 3 or cropped.shape[1] <= 3:
+                continue
+            pil_crop = Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB))
+            box = [orig_x1, orig_y1, orig_x2, orig_y2]
+            if label == 'fig':
+                figure_filename = save_figure_to_local(pil_crop, save_dir, image_name, reading_order)
+                figure_results.append({
+                    'label': label,
+                    'text': f"![Figure](figures/{figure_filename})",
+                    'figure_path': f"figures/{figure_filename}",
+                    'bbox': box,
+                    'reading_order': reading_order
+                })
+            elif not recognize or label in skip_labels:
+                triaged.append({'label': label, 'bbox': box, 'text': '', 'reading_order': reading_order,
+                                'triaged': True})
+            else:
+                element = {'crop': pil_crop, 'label': label, 'bbox': box, 'reading_order': reading_order}
+                (table_elements if label == 'tab' else text_elements).append(element)
+        except Exception as e:
+            print(f"⚠️  Skipping element {reading_order} ({label}) of {image_name}: {e}")
+    
+    results = figure_results + triaged
+    results.extend(recognize_elements(model, text_elements, TEXT_PROMPT, max_batch_size))
+    results.extend(recognize_elements(model, table_elements, TABLE_PROMPT, max_batch_size))
+    results.sort(key=lambda element: element.get('reading_order', 0))
+    return results
+
+def process_page(model: DolphinModel, image: Image.Image, save_dir: str, image_name: str,
+                 max_batch_size: int = 16, recognize: bool = True,
+                 skip_labels: Collection[str] = ()) -> List[Dict[str, Any]]:
+    """Layout pass, then element recognition, for one page image"""
+    layout_output = model.chat(LAYOUT_PROMPT, image)
+    padded_image, dims = prepare_image(image)
+    return process_elements(layout_output, padded_image, dims, model, save_dir, image_name, max_batch_size,
+                            recognize, skip_labels)
+
+def triage_page(model: DolphinModel, image: Image.Image, save_dir: str, image_name: str,
+                max_batch_size: int, rules: TriageRules,
+                planned: Optional[Tuple[str, str]] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Run as much of the pipeline as the page's triage decision calls for
+    
+    Returns the elements and the decision with its ``seconds`` and
+    ``elements_skipped``. A page whose every non-figure element has a skipped
+    label is reported as layout-only.
+    """
+    triage = classify_page(image, rules, planned)
+    start = time.time()
+    elements = []
+    if triage['action'] != SKIP:
+        # Pages forced to full by a rule get no label triage either
+        skip_labels = rules.skip_labels if rules.enabled and triage['reason'] != 'rule' else ()
+        elements = process_page(model, image, save_dir, image_name, max_batch_size,
+                                recognize=triage['action'] == FULL, skip_labels=skip_labels)
+    skipped = sum(1 for element in elements if element.get('triaged'))
+    if triage['action'] == FULL and skipped and all(
+            element.get('triaged') or element['label'] == 'fig' for element in elements):
+        triage.update(action=LAYOUT, reason='labels')
+    triage['seconds'] = round(time.time() - start, 3)
+    triage['elements_skipped'] = skipped
+    return elements, triage
+
+def process_pdf_pages(model: DolphinModel, pdf_path: str, save_dir: str, first_page: int = 0,
+                      last_page: Optional[int] = None, max_batch_size: int = 16, prefetch: int = 4,
+                      rules: Optional[TriageRules] = None,
+                      planned: Optional[Dict[int, Tuple[str, str]]] = None,
+                      cache: Optional[PageCache] = None) -> List[Dict[str, Any]]:
+    """Recognize pages [first_page, last_page) of a PDF
+    
+    Pages are streamed from a background renderer (``prefetch`` pages ahead),
+    so rasterization overlaps with inference and memory does not grow with
+    the page count. Each page is triaged first (``rules``, plus decisions
+    ``planned`` per 0-based page by ``triage.plan_pages``); without rules
+    every page gets full recognition. With a ``cache``, pages whose pixels
+    were recognized before are served from it and only changed pages reach
+    the model. Returns one ``{'page_number', 'elements', 'triage'}`` entry
+    per page (1-based page numbers), the per-page layout
+    ``save_combined_pdf_results`` expects.
+    """
+    rules = rules or TriageRules(enabled=False)
+    planned = planned or {}
+    setup_output_dirs(save_dir)
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    pages = []
+    for page_num, image in iter_pdf_images(pdf_path, first_page=first_page, last_page=last_page,
+                                           prefetch=prefetch):
+        page_number = page_num + 1
+        image_name = f"{base_name}_page_{page_number:03d}"
+        key = cached = None
+        if cache is not None:
+            key = cache.page_key(image, planned.get(page_num))
+            cached = cache.get(key, save_dir, image_name)
+        if cached is not None:
+            elements, triage = cached
+            triage['cached'] = True
+        else:
+            elements, triage = triage_page(model, image, save_dir, image_name, max_batch_size, rules,
+                                           planned.get(page_num))
+            if cache is not None:
+                cache.put(key, elements, triage, save_dir)
+        pages.append({'page_number': page_number, 'elements': elements, 'triage': triage})
+    
+    if last_page is not None and len(pages) != last_page - first_page:
+        raise RuntimeError(f"Rendered {len(pages)} of pages {first_page + 1}-{last_page} from {pdf_path}")
+    if not pages:
+        raise RuntimeError(f"No pages rendered from {pdf_path}")
+    return pages
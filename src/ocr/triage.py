@@ -0,0 +1,166 @@
+"""
+Page triage for Dolphin OCR
+Decides per page how much inference a page is worth before the model sees
+it: blank pages, back matter and configured page ranges are skipped or get
+the layout pass only, and elements the layout labels as low value (e.g.
+bibliography entries) are not recognized.
+"""
+
+import os
+import re
+import fnmatch
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'triage.yaml')
+
+# Actions, cheapest first
+SKIP = 'skip'        # no inference; the page is kept with no elements
+LAYOUT = 'layout'    # layout pass only; figures are saved, text is not recognized
+FULL = 'full'        # layout pass and recognition of every element
+
+@dataclass
+class TriageRules:
+    """Thresholds and page-range rules, loaded from triage.yaml"""
+    enabled: bool = True
+    blank_ink_density: float = 0.0005     # Below this the page is blank (or only a page number)
+    skip_labels: List[str] = field(default_factory=list)  # Layout labels that are not recognized
+    back_matter_headings: List[str] = field(default_factory=list)  # First text line that starts back matter
+    files: Dict[str, Dict[str, str]] = field(default_factory=dict)  # Filename glob -> {action: page ranges}
+
+def load_rules(path: Optional[str] = DEFAULT_RULES) -> TriageRules:
+    """Rules from a YAML file; defaults if the path is None or missing"""
+    if not path or not os.path.exists(path):
+        return TriageRules()
+    from omegaconf import OmegaConf
+    values = OmegaConf.to_container(OmegaConf.load(path)) or {}
+    unknown = set(values) - set(TriageRules.__dataclass_fields__)
+    if unknown:
+        raise ValueError(f"Unknown triage settings in {path}: {', '.join(sorted(unknown))}")
+    return TriageRules(**values)
+
+def parse_ranges(spec: str, num_pages: int) -> List[int]:
+    """0-based page indices from 1-based ranges like ``"1-2, 7, 300-"`` (open end = last page)"""
+    pages = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r'(\d+)\s*(-\s*(\d*))?', part)
+        if not match:
+            raise ValueError(f"Bad page range '{part}'")
+        start = int(match.group(1))
+        end = start if match.group(2) is None else int(match.group(3) or num_pages)
+        pages.extend(range(max(start, 1) - 1, min(end, num_pages)))
+    return pages
+
+def first_text_line(page) -> str:
+    """First non-empty line of a page's text layer ('' for scanned pages)"""
+    for line in page.get_text('text').splitlines():
+        if line.strip():
+            return line.strip()
+    return ''
+
+def plan_pages(pdf_path: str, rules: TriageRules) -> Dict[int, Tuple[str, str]]:
+    """Actions decided before rendering: page-range rules and back matter
+    
+    Back matter is found from the text layer: from the first page whose
+    first line is one of ``back_matter_headings`` to the end of the PDF.
+    Range rules for the file override that. Pages not in the result are
+    decided from their pixels by ``classify_page``.
+    """
+    if not rules.enabled:
+        return {}
+    import pymupdf
+    
+    planned: Dict[int, Tuple[str, str]] = {}
+    headings = {heading.lower() for heading in rules.back_matter_headings}
+    with pymupdf.open(pdf_path) as doc:
+        num_pages = len(doc)
+        if headings:
+            for page_num in range(num_pages):
+                line = first_text_line(doc[page_num]).lower()
+                if line in headings:
+                    for back_page in range(page_num, num_pages):
+                        planned[back_page] = (SKIP, f"back matter ({line})")
+                    break
+    
+    pdf_file = os.path.basename(pdf_path)
+    for pattern, actions in rules.files.items():
+        if not fnmatch.fnmatch(pdf_file, pattern):
+            continue
+        for action in (SKIP, LAYOUT, FULL):
+            for page_num in parse_ranges(actions.get(action, ''), num_pages):
+                planned[page_num] = (action, 'rule')
+    return planned
+
+def ink_density(image) -> float:
+    """Fraction of dark pixels after crop_margin's contrast stretch and binarization"""
+    data = np.asarray(image.convert('L'), dtype=np.float32)
+    low, high = data.min(), data.max()
+    if high == low:
+        return 0.0
+    return float(((data - low) * (255.0 / (high - low)) < 200).mean())
+
+def classify_page(image, rules: TriageRules, planned: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+    """Triage decision for a rendered page: ``{'action', 'reason', 'ink_density'}``"""
+    if not rules.enabled:
+        return {'action': FULL, 'reason': 'triage disabled', 'ink_density': None}
+    if planned is not None and planned[0] != FULL:
+        return {'action': planned[0], 'reason': planned[1], 'ink_density': None}
+    density = ink_density(image)
+    if planned is not None:
+        return {'action': FULL, 'reason': planned[1], 'ink_density': density}
+    if density < rules.blank_ink_density:
+        return {'action': SKIP, 'reason': 'blank', 'ink_density': density}
+    return {'action': FULL, 'reason': 'content', 'ink_density': density}
+
+def summarize(pages: List[Dict[str, Any]], full_page_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """Per-PDF triage report: pages per action and reason, and inference time saved
+    
+    Time saved is estimated against the average full-recognition page time
+    of this PDF (or ``full_page_seconds`` if it had none): a skipped page saves
+    a whole page, a layout-only page saves what its recognition would have cost,
+    and a page served from the page cache saves what it cost when first run.
+    Skipped elements on fully recognized pages are counted but not timed.
+    """
+    actions: Dict[str, int] = {}
+    reasons: Dict[str, int] = {}
+    full_times, layout_times = [], []
+    elements_skipped = 0
+    cached_pages, cached_seconds = 0, 0.0
+    for page in pages:
+        triage = page.get('triage') or {'action': FULL, 'reason': 'content', 'seconds': None}
+        actions[triage['action']] = actions.get(triage['action'], 0) + 1
+        if triage['action'] != FULL:
+            reasons[triage['reason']] = reasons.get(triage['reason'], 0) + 1
+        elements_skipped += triage.get('elements_skipped', 0)
+        if triage.get('seconds') is None:
+            continue
+        if triage.get('cached'):
+            cached_pages += 1
+            cached_seconds += triage['seconds']
+        elif triage['action'] == FULL:
+            full_times.append(triage['seconds'])
+        elif triage['action'] == LAYOUT:
+            layout_times.append(triage['seconds'])
+    
+    full_avg = sum(full_times) / len(full_times) if full_times else full_page_seconds
+    saved_pages = actions.get(SKIP, 0)
+    seconds_saved = cached_seconds if cached_pages else None
+    if full_avg is not None:
+        seconds_saved = (cached_seconds + saved_pages * full_avg
+                         + sum(max(0.0, full_avg - t) for t in layout_times))
+    return {
+        'pages': len(pages),
+        'actions': actions,
+        'reasons': reasons,
+        'pages_skipped': saved_pages,
+        'pages_layout_only': actions.get(LAYOUT, 0),
+        'elements_skipped': elements_skipped,
+        'pages_cached': cached_pages,
+        'full_page_seconds': round(full_avg, 3) if full_avg is not None else None,
+        'seconds_saved': round(seconds_saved, 1) if seconds_saved is not None else None
+    }
@@ -74,6 +74,18 @@ CHUNK_SIZE = 512                # Optimal chunk size for content retrieval
 CHUNK_OVERLAP = 100             # Overlap to maintain context across chunks
 ENABLE_MATH_ENHANCEMENT = True  # Enhance mathematical content recognition
 
+# Index input: 'recognition_json' chunks Dolphin's layout elements directly,
+# 'markdown' re-reads and word-splits the markdown written by the OCR stage
+INDEX_INPUT = 'recognition_json'
+CHUNK_HEADING_LABELS = ['title', 'sec', 'sub_sec']   # Start a new chunk (and section)
+CHUNK_SKIP_LABELS = ['fig', 'reference', 'foot', 'header', 'watermark']  # Not indexed
+
+# Embedding storage: 'float32' writes an IndexFlatIP; 'int8' (4x smaller) or
+# 'binary' (32x smaller) write codes that servers scan first, rescoring the
+# top candidates from the memory-mapped chunk_embeddings.npy. int8 saves
+# memory only (its scan is as slow as float); binary is also faster
+EMBEDDING_STORAGE = 'float32'
+
 # Model-specific settings for Qwen2.5-Math-7B-Instruct
 QWEN_MATH_TEMPERATURE = 0.7      # Higher for better reasoning (was 0.3)
 QWEN_MATH_TOP_P = 0.95          # More inclusive sampling (was 0.9)
@@ -1,4 +1,5 @@
 import os
+import sys
 import glob
 import json
 import torch
@@ -6,11 +7,15 @@ import faiss
 import pickle
 import numpy as np
 import re
-from sentence_transformers import SentenceTransformer
-from typing import List, Tuple
+import hashlib
+from typing import List, Tuple, Dict, Any
 
 # Import configuration
-from config import CHUNK_SIZE, CHUNK_OVERLAP, ENABLE_MATH_ENHANCEMENT
+from config import (CHUNK_SIZE, CHUNK_OVERLAP, ENABLE_MATH_ENHANCEMENT, INDEX_INPUT,
+                    CHUNK_HEADING_LABELS, CHUNK_SKIP_LABELS, EMBEDDING_STORAGE)
+
+# Quantized storage (adaptive_rag.retrieval.quantized) is shared with the servers
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rag_system'))
 
 # Paths
 MARKDOWN_DIR = '/home/rchaudhry_umass_edu/rag/output/markdown'
@@ -31,6 +36,11 @@ MATH_PATTERNS = [
     r'[∫∑∏√∞θαβγδμσ²³]',  # Mathematical symbols
 ]
 
+# HTML tables from Dolphin become one line per row, cells separated by " | "
+TABLE_CELL_END = re.compile(r'</t[dh]\s*>', re.IGNORECASE)
+TABLE_ROW_END = re.compile(r'</tr\s*>', re.IGNORECASE)
+HTML_TAG = re.compile(r'<[^>]+>')
+
 class EnhancedContentProcessor:
     """Process and enhance content for better retrieval"""
     
@@ -39,7 +49,7 @@ class EnhancedContentProcessor:
         """Extract mathematical expressions and enhance them"""
         if not ENABLE_MATH_ENHANCEMENT:
             return text
-            
+        
         math_content = []
         for pattern in MATH_PATTERNS:
             matches = re.findall(pattern, text)
@@ -77,40 +87,162 @@ class EnhancedContentProcessor:
                     chunks.append(chunk)
         
         return chunks
-
-def build_enhanced_index():
-    """Build an enhanced index for better content retrieval"""
     
-    print("Building enhanced index for improved content retrieval...")
+    @staticmethod
+    def element_text(element: Dict[str, Any]) -> str:
+        """Text of one Dolphin layout element as it is indexed"""
+        label = element.get('label', '')
+        text = element.get('text', '').strip()
+        if label == 'tab' and '<' in text:
+            text = TABLE_ROW_END.sub('\n', TABLE_CELL_END.sub(' | ', text))
+            rows = [row.strip().rstrip('|').strip() for row in HTML_TAG.sub('', text).split('\n')]
+            return '\n'.join(row for row in rows if row)
+        if label == 'formula':
+            return text if text.startswith(('$', '\\[')) else f"$${text}$$"
+        # Rejoin lines the OCR wrapped, including hyphenated words
+        text = ' '.join(text.replace('-\n', '').split('\n'))
+        return f"- {text}" if label == 'list' else text
     
-    # Load markdown files
+    @staticmethod
+    def chunk_elements(pages: List[Dict[str, Any]], source: str, chunk_size: int = CHUNK_SIZE,
+                       overlap: int = CHUNK_OVERLAP) -> List[Tuple[str, Dict[str, Any]]]:
+        """Chunks of whole layout elements, with page and label metadata
+        
+        Elements are packed into a chunk up to ``chunk_size`` words and never
+        split, except one longer than a chunk by itself or with the heading just
+        before it, which is cut into word windows (the first one shortened to
+        leave room for that heading). Headings start a new chunk, so chunks stay
+        within a section. The next chunk repeats whole trailing elements of up
+        to ``overlap`` words, fewer when the next element would not fit beside
+        them. Empty elements, elements OCR triage did not recognize and
+        ``CHUNK_SKIP_LABELS`` are left out.
+        """
+        chunks = []
+        current = []  # (text, words, page_number, label)
+        section = ''
+        
+        def flush(carry: bool):
+            nonlocal current
+            if not current:
+                return
+            page_numbers = [item[2] for item in current]
+            text = '\n\n'.join(item[0] for item in current)
+            if ENABLE_MATH_ENHANCEMENT:
+                text = EnhancedContentProcessor.extract_math_content(text)
+            chunks.append((text, {
+                'source': source,
+                'pages': [min(page_numbers), max(page_numbers)],
+                'labels': sorted({item[3] for item in current}),
+                'section': section,
+                'num_elements': len(current)
+            }))
+            kept, kept_words = [], 0
+            if carry:
+                for item in reversed(current[1:]):
+                    if kept_words + item[1] > overlap:
+                        break
+                    kept.insert(0, item)
+                    kept_words += item[1]
+            current = kept
+        
+        for page in pages:
+            page_number = page.get('page_number', 0)
+            for element in page.get('elements', []):
+                label = element.get('label', '')
+                if element.get('triaged') or label in CHUNK_SKIP_LABELS:
+                    continue
+                text = EnhancedContentProcessor.element_text(element)
+                words = text.split()
+                if not words:
+                    continue
+                
+                if label in CHUNK_HEADING_LABELS:
+                    flush(carry=False)
+                    section = text
+                
+                headings_only = all(item[3] in CHUNK_HEADING_LABELS for item in current)
+                heading_words = sum(item[1] for item in current) if headings_only else 0
+                if len(words) + heading_words <= chunk_size:
+                    if current and sum(item[1] for item in current) + len(words) > chunk_size:
+                        flush(carry=True)
+                        while current and sum(item[1] for item in current) + len(words) > chunk_size:
+                            current.pop(0)
+                    current.append((text, len(words), page_number, label))
+                    continue
+                # Longer than a chunk on its own (or with its heading): word windows,
+                # each its own chunk; a heading just before it shares the first window
+                if not headings_only:
+                    flush(carry=False)
+                start = 0
+                while True:
+                    width = chunk_size - sum(item[1] for item in current)
+                    if width <= overlap:
+                        # No room left beside the heading for a window that advances
+                        flush(carry=False)
+                        width = chunk_size
+                    window = words[start:start + width]
+                    current.append((' '.join(window), len(window), page_number, label))
+                    flush(carry=False)
+                    if start + width >= len(words):
+                        break
+                    start += width - overlap
+        flush(carry=False)
+        return chunks
+
+def load_markdown_chunks() -> Tuple[List[str], List[str], List[Dict[str, Any]], int]:
+    """Word-window chunks of the OCR stage's markdown files"""
     md_files = sorted(glob.glob(os.path.join(MARKDOWN_DIR, '*.md')))
-    md_texts = []
-    md_filenames = []
-    md_chunks = []
-    
-    processor = EnhancedContentProcessor()
+    md_chunks, chunk_names, chunk_metadata = [], [], []
     
     print(f"Processing {len(md_files)} markdown files...")
     
     for f in md_files:
         with open(f, 'r', encoding='utf-8') as file:
             text = file.read()
-            md_texts.append(text)
-            md_filenames.append(os.path.basename(f))
-            
-            # Create chunks with mathematical enhancement
-            chunks = processor.chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
-            md_chunks.extend(chunks)
+        
+        # Create chunks with mathematical enhancement
+        chunks = EnhancedContentProcessor.chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+        md_chunks.extend(chunks)
+        chunk_names.extend([os.path.basename(f)] * len(chunks))
+        chunk_metadata.extend({'source': os.path.basename(f)} for _ in chunks)
+    return md_chunks, chunk_names, chunk_metadata, len(md_files)
+
+def load_recognition_chunks() -> Tuple[List[str], List[str], List[Dict[str, Any]], int]:
+    """Element chunks straight from Dolphin's recognition JSON, one file at a time"""
+    json_files = sorted(glob.glob(os.path.join(JSON_DIR, '*.json')))
+    md_chunks, chunk_names, chunk_metadata = [], [], []
     
-    print(f"Created {len(md_chunks)} chunks from {len(md_texts)} documents")
+    print(f"Processing {len(json_files)} recognition JSON files...")
     
-    # Load JSON files for enrichment
-    json_files = sorted(glob.glob(os.path.join(JSON_DIR, '*.json')))
-    json_data = {}
     for f in json_files:
         with open(f, 'r', encoding='utf-8') as file:
-            json_data[os.path.basename(f)] = json.load(file)
+            data = json.load(file)
+        source = os.path.basename(data.get('source_file') or f)
+        for text, meta in EnhancedContentProcessor.chunk_elements(data.get('pages', []), source):
+            first, last = meta['pages']
+            md_chunks.append(text)
+            chunk_names.append(f"{source} p.{first}" if first == last else f"{source} p.{first}-{last}")
+            chunk_metadata.append(meta)
+    return md_chunks, chunk_names, chunk_metadata, len(json_files)
+
+def build_enhanced_index(input_mode: str = INDEX_INPUT, storage: str = EMBEDDING_STORAGE):
+    """Build an enhanced index for better content retrieval"""
+    from sentence_transformers import SentenceTransformer
+    from adaptive_rag.retrieval.quantized import build_quantized_index, write_quantized_index
+    
+    if storage not in ('float32', 'int8', 'binary'):
+        raise ValueError(f"Unknown embedding storage '{storage}' (expected 'float32', 'int8' or 'binary')")
+    
+    print("Building enhanced index for improved content retrieval...")
+    
+    if input_mode == 'recognition_json':
+        md_chunks, chunk_names, chunk_metadata, num_documents = load_recognition_chunks()
+    elif input_mode == 'markdown':
+        md_chunks, chunk_names, chunk_metadata, num_documents = load_markdown_chunks()
+    else:
+        raise ValueError(f"Unknown index input '{input_mode}' (expected 'recognition_json' or 'markdown')")
+    
+    print(f"Created {len(md_chunks)} chunks from {num_documents} documents")
     
     # Build embeddings for chunks
     print(f"Loading embedding model: {EMBED_MODEL}")
@@ -140,33 +272,45 @@ def build_enhanced_index():
     
     print("Saving enhanced index and data...")
     
-    # Save FAISS index
-    faiss.write_index(index, os.path.join(INDEX_DIR, 'faiss.index'))
+    # Save FAISS index, or only the codes: the floats are in chunk_embeddings.npy
+    if storage == 'float32':
+        faiss.write_index(index, os.path.join(INDEX_DIR, 'faiss.index'))
+    else:
+        write_quantized_index(build_quantized_index(chunk_embeddings, storage), INDEX_DIR, storage)
     
     # Save chunk data
     with open(os.path.join(INDEX_DIR, 'md_chunks.pkl'), 'wb') as f:
         pickle.dump(md_chunks, f)
     
-    # Save filenames (for reference)
+    # Save one name per chunk (served as the chunk id)
     with open(os.path.join(INDEX_DIR, 'md_filenames.pkl'), 'wb') as f:
-        pickle.dump(md_filenames, f)
+        pickle.dump(chunk_names, f)
+    
+    # Save per-chunk source, pages and labels (not loaded by the servers)
+    with open(os.path.join(INDEX_DIR, 'chunk_metadata.pkl'), 'wb') as f:
+        pickle.dump(chunk_metadata, f)
     
     # Save chunk embeddings
     np.save(os.path.join(INDEX_DIR, 'chunk_embeddings.npy'), chunk_embeddings)
     
-    # Save JSON data
-    with open(os.path.join(INDEX_DIR, 'json_data.pkl'), 'wb') as f:
-        pickle.dump(json_data, f)
+    # Content hash of the embeddings and how they are searched; servers use it
+    # to invalidate shared caches (quantized first passes rank differently)
+    version = hashlib.sha1(chunk_embeddings.tobytes())
+    version.update(storage.encode())
     
     # Save metadata
     metadata = {
-        'num_documents': len(md_texts),
+        'index_version': version.hexdigest()[:16],
+        'input': input_mode,
+        'num_documents': num_documents,
         'num_chunks': len(md_chunks),
         'chunk_size': CHUNK_SIZE,
         'overlap': CHUNK_OVERLAP,
         'embedding_model': EMBED_MODEL,
         'embedding_dimension': dimension,
-        'index_type': 'IndexFlatIP',
+        'index_type': {'float32': 'IndexFlatIP', 'int8': 'IndexScalarQuantizer',
+                       'binary': 'IndexBinaryFlat'}[storage],
+        'embedding_storage': storage,
         'similarity_metric': 'cosine',
         'math_enhancement_enabled': ENABLE_MATH_ENHANCEMENT
     }
@@ -178,7 +322,7 @@ def build_enhanced_index():
     print(f"Index saved to: {INDEX_DIR}")
     print(f"Number of chunks: {len(md_chunks)}")
     print(f"Embedding dimension: {dimension}")
-    print(f"Index type: IndexFlatIP (optimized for cosine similarity)")
+    print(f"Index type: {metadata['index_type']} ({storage} embeddings)")
     print(f"Math enhancement: {'Enabled' if ENABLE_MATH_ENHANCEMENT else 'Disabled'}")
     
     # Test the index
@@ -3,7 +3,12 @@ Caching components for adaptive RAG
 """
 
 from .query_cache import QueryCache
+from .shared_cache import SharedCache
+from .warmup import CacheWarmer, collect_warmup_queries
 
 __all__ = [
-    "QueryCache"
+    "QueryCache",
+    "SharedCache",
+    "CacheWarmer",
+    "collect_warmup_queries"
 ]
@@ -2,69 +2,187 @@
 Query caching for adaptive RAG
 """
 
+import sys
 import time
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, Optional, Hashable
 from collections import OrderedDict
 
+import numpy as np
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a cached value in bytes
+    
+    Objects can report their own size through a ``cache_nbytes()`` method,
+    which lets them exclude storage shared with the rest of the process.
+    """
+    if hasattr(value, 'cache_nbytes'):
+        return int(value.cache_nbytes())
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+class _CacheShard:
+    """One lock-guarded LRU segment of a QueryCache"""
+    __slots__ = ('lock', 'entries', 'max_entries', 'max_bytes', 'bytes',
+                 'hits', 'misses', 'evictions', 'expirations')
+    
+    def __init__(self, max_entries: int, max_bytes: Optional[int]):
+        self.lock = threading.Lock()
+        # key -> (value, nbytes, expires_at)
+        self.entries: OrderedDict = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def remove(self, key: Hashable) -> None:
+        _, nbytes, _ = self.entries.pop(key)
+        self.bytes -= nbytes
+    
+    def evict_for(self, incoming_bytes: int) -> None:
+        """Evict least recently used entries until ``incoming_bytes`` fits"""
+        while self.entries and (
+                len(self.entries) >= self.max_entries or
+                (self.max_bytes is not None and self.bytes + incoming_bytes > self.max_bytes)):
+            _, (_, nbytes, _) = self.entries.popitem(last=False)
+            self.bytes -= nbytes
+            self.evictions += 1
+
 class QueryCache:
-    """LRU cache for query results"""
+    """Thread-safe LRU cache for query results
+    
+    Keys are spread over lock-striped shards so concurrent retrievals only
+    contend when they hash to the same shard. Each shard bounds both its
+    entry count and its byte footprint, and entries expire after ``ttl``
+    seconds when a TTL is set.
+    """
     
-    def __init__(self, max_size: int = 500):
+    def __init__(self, max_size: int = 500, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, num_shards: int = 8):
         self.max_size = max_size
-        self.cache: OrderedDict = OrderedDict()
-        self.hits = 0
-        self.total_queries = 0
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.num_shards = max(1, min(num_shards, max_size))
         
-    def get(self, key: str) -> Optional[Any]:
+        # Split the limits so the shards add up to exactly max_size/max_bytes:
+        # the first ``limit % num_shards`` shards take one extra unit each
+        self._shards = [_CacheShard(self._split(max_size, i),
+                                    self._split(max_bytes, i) if max_bytes is not None else None)
+                        for i in range(self.num_shards)]
+    
+    def _split(self, limit: int, shard_index: int) -> int:
+        share, remainder = divmod(limit, self.num_shards)
+        return share + (1 if shard_index < remainder else 0)
+    
+    def _shard(self, key: Hashable) -> _CacheShard:
+        return self._shards[hash(key) % self.num_shards]
+    
+    def get(self, key: Hashable) -> Optional[Any]:
         """Get value from cache"""
-        self.total_queries += 1
-        
-        if key in self.cache:
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                shard.misses += 1
+                return None
+            
+            value, _, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                shard.remove(key)
+                shard.expirations += 1
+                shard.misses += 1
+                return None
+            
             # Move to end (most recently used)
-            value = self.cache.pop(key)
-            self.cache[key] = value
-            self.hits += 1
+            shard.entries.move_to_end(key)
+            shard.hits += 1
             return value
-        
-        return None
     
-    def set(self, key: str, value: Any) -> None:
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
         """Set value in cache"""
-        if key in self.cache:
-            # Update existing
-            self.cache.pop(key)
-        elif len(self.cache) >= self.max_size:
-            # Remove least recently used
-            self.cache.popitem(last=False)
+        shard = self._shard(key)
+        if shard.max_entries == 0:
+            # max_size=0 disables the cache
+            return
+        nbytes = estimate_size(value)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
         
-        self.cache[key] = value
+        with shard.lock:
+            if key in shard.entries:
+                # Update existing
+                shard.remove(key)
+            if shard.max_bytes is not None and nbytes > shard.max_bytes:
+                # Never admit an entry that would flush the whole shard
+                return
+            shard.evict_for(nbytes)
+            shard.entries[key] = (value, nbytes, expires_at)
+            shard.bytes += nbytes
+    
+    def delete(self, key: Hashable) -> None:
+        """Remove a key if present"""
+        shard = self._shard(key)
+        with shard.lock:
+            if key in shard.entries:
+                shard.remove(key)
     
     def get_hit_rate(self) -> float:
         """Get cache hit rate"""
-        if self.total_queries == 0:
-            return 0.0
-        return self.hits / self.total_queries
+        stats = self.get_stats()
+        return stats['hit_rate']
     
     def get_size(self) -> int:
         """Get current cache size"""
-        return len(self.cache)
+        return sum(len(shard.entries) for shard in self._shards)
     
     def get_total_queries(self) -> int:
         """Get total number of queries"""
-        return self.total_queries
+        return sum(shard.hits + shard.misses for shard in self._shards)
     
     def clear(self) -> None:
         """Clear the cache"""
-        self.cache.clear()
-        self.hits = 0
-        self.total_queries = 0
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+                shard.bytes = 0
+                shard.hits = 0
+                shard.misses = 0
+                shard.evictions = 0
+                shard.expirations = 0
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
+        size = hits = misses = evictions = expirations = nbytes = 0
+        for shard in self._shards:
+            with shard.lock:
+                size += len(shard.entries)
+                nbytes += shard.bytes
+                hits += shard.hits
+                misses += shard.misses
+                evictions += shard.evictions
+                expirations += shard.expirations
+        total_queries = hits + misses
         return {
-            'size': len(self.cache),
+            'size': size,
             'max_size': self.max_size,
-            'hits': self.hits,
-            'total_queries': self.total_queries,
-            'hit_rate': self.get_hit_rate()
+            'bytes': nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'expirations': expirations,
+            'total_queries': total_queries,
+            'hit_rate': hits / total_queries if total_queries else 0.0,
+            'shards': self.num_shards
         }
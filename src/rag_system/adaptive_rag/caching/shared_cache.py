@@ -0,0 +1,225 @@
+"""
+Cross-process cache tier for adaptive RAG
+"""
+
+import os
+import json
+import time
+import stat
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+
+# Array dtypes an entry may hold; nothing else is ever decoded from the file
+ARRAY_DTYPES = {'int64': np.int64, 'float32': np.float32}
+TOUCH_BATCH = 64  # Hits buffered before their accessed_at is written back
+
+class SharedCache:
+    """SQLite-backed cache shared by every process on a node
+    
+    Sits behind the in-process QueryCache: uvicorn workers and SLURM
+    replicas pointing at the same file (ideally on /dev/shm) serve each
+    other's hits. Entries are keyed by a stable hash of the query key and
+    tagged with the index version, so rebuilding the index invalidates
+    everything written against the old one.
+    
+    Values are dicts of NumPy arrays (int64/float32) and JSON-serializable
+    fields. They are stored as raw array bytes plus a JSON header, never
+    pickled, so whoever can write the file cannot run code in the servers.
+    The file is created readable by its owner only. Entries beyond
+    ``max_entries`` are evicted least recently used first.
+    """
+    
+    def __init__(self, path: str, index_version: str, max_entries: int = 10000,
+                 ttl: Optional[float] = None, timeout: float = 0.5):
+        self.path = path
+        self.index_version = index_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.timeout = timeout
+        
+        # sqlite3 connections must not be shared between threads
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._writes = 0
+        self._touched: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._create_private(path)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                ' key_hash TEXT PRIMARY KEY,'
+                ' index_version TEXT NOT NULL,'
+                ' expires_at REAL,'
+                ' accessed_at REAL NOT NULL,'
+                ' fields TEXT NOT NULL,'
+                ' arrays BLOB NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)')
+            # Drop anything written against another index build
+            conn.execute('DELETE FROM results WHERE index_version != ?', (index_version,))
+    
+    @staticmethod
+    def _create_private(path: str) -> None:
+        """Create the database file with mode 0600, refusing one another user can write"""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+        try:
+            info = os.fstat(fd)
+        finally:
+            os.close(fd)
+        if info.st_uid != os.getuid() or info.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            raise PermissionError(f"Shared cache {path} must be owned by this user with mode 0600 "
+                                  f"(found uid {info.st_uid}, mode {stat.S_IMODE(info.st_mode):o})")
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+    
+    @staticmethod
+    def _hash_key(key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+    
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+    
+    @staticmethod
+    def _encode(value: Dict[str, Any]) -> Tuple[str, bytes]:
+        """JSON header (plain fields and array layout) and the concatenated array bytes"""
+        fields, arrays, parts, offset = {}, {}, [], 0
+        for name, item in value.items():
+            if isinstance(item, np.ndarray):
+                if item.dtype.name not in ARRAY_DTYPES:
+                    raise TypeError(f"Cannot store {item.dtype} array '{name}' in the shared cache")
+                data = np.ascontiguousarray(item).tobytes()
+                arrays[name] = [item.dtype.name, list(item.shape), offset]
+                parts.append(data)
+                offset += len(data)
+            else:
+                fields[name] = item
+        return json.dumps({'fields': fields, 'arrays': arrays}), b''.join(parts)
+    
+    @staticmethod
+    def _decode(header: str, data: bytes) -> Dict[str, Any]:
+        layout = json.loads(header)
+        value = dict(layout['fields'])
+        for name, (dtype, shape, offset) in layout['arrays'].items():
+            count = int(np.prod(shape, dtype=np.int64))
+            value[name] = np.frombuffer(data, dtype=ARRAY_DTYPES[dtype], count=count,
+                                        offset=offset).reshape(shape).copy()
+        return value
+    
+    def _touch(self, key_hash: str, now: float) -> None:
+        """Record a hit; accessed_at is written back in batches"""
+        with self._stats_lock:
+            self._touched[key_hash] = now
+            if len(self._touched) < TOUCH_BATCH:
+                return
+            touched, self._touched = self._touched, {}
+        self._write_touched(touched)
+    
+    def _write_touched(self, touched: Dict[str, float]) -> None:
+        try:
+            self._connect().executemany('UPDATE results SET accessed_at = ? WHERE key_hash = ?',
+                                        [(at, key_hash) for key_hash, at in touched.items()])
+        except sqlite3.Error:
+            self._count('errors')
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get value from the shared tier, or None on miss or error"""
+        key_hash = self._hash_key(key)
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT fields, arrays, expires_at FROM results WHERE key_hash = ? AND index_version = ?',
+                (key_hash, self.index_version)
+            ).fetchone()
+        except sqlite3.Error:
+            self._count('errors')
+            return None
+        
+        now = time.time()
+        if row is None or (row[2] is not None and row[2] <= now):
+            self._count('misses')
+            return None
+        try:
+            value = self._decode(row[0], row[1])
+        except (ValueError, TypeError, KeyError):
+            # Malformed row: treat as a miss rather than fail the request
+            self._count('errors')
+            return None
+        
+        self._count('hits')
+        self._touch(key_hash, now)
+        return value
+    
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a value; failures are counted and otherwise ignored"""
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        fields, arrays = self._encode(value)
+        try:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO results (key_hash, index_version, expires_at, accessed_at, fields, arrays)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (self._hash_key(key), self.index_version, expires_at, now, fields, arrays)
+            )
+            with self._stats_lock:
+                self._writes += 1
+                prune = self._writes % 256 == 0
+                touched, self._touched = (self._touched, {}) if prune else ({}, self._touched)
+            if prune:
+                # Recent hits first, so pruning sees current access times
+                if touched:
+                    self._write_touched(touched)
+                self._prune(conn, now)
+        except sqlite3.Error:
+            self._count('errors')
+    
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired entries and the least recently used beyond max_entries"""
+        conn.execute('DELETE FROM results WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,))
+        conn.execute(
+            'DELETE FROM results WHERE key_hash IN ('
+            ' SELECT key_hash FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+    
+    def clear(self) -> None:
+        """Remove every entry, for all processes"""
+        try:
+            self._connect().execute('DELETE FROM results')
+        except sqlite3.Error:
+            self._count('errors')
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get statistics for this process's use of the shared tier"""
+        try:
+            size = self._connect().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        total_queries = self.hits + self.misses
+        return {
+            'path': self.path,
+            'index_version': self.index_version,
+            'size': size,
+            'max_size': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'total_queries': total_queries,
+            'hit_rate': self.hits / total_queries if total_queries else 0.0
+        }
@@ -0,0 +1,131 @@
+"""
+Cache warm-up for adaptive RAG
+"""
+
+import os
+import json
+import time
+import threading
+from collections import Counter
+from typing import Dict, Any, List, Optional, Callable
+
+# Repository-level question bank (src/rag_system/adaptive_rag/caching -> repo root)
+DEFAULT_QUESTION_BANK = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', '..', 'data', 'question_bank.json')
+
+def _iter_log_queries(log_file: str, max_bytes: int):
+    """Yield queries from the tail of a JSONL query log"""
+    try:
+        with open(log_file, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - max_bytes))
+            if size > max_bytes:
+                f.readline()  # Skip the partial first line
+            for line in f:
+                try:
+                    query = json.loads(line).get('query')
+                except (ValueError, AttributeError):
+                    continue
+                if query:
+                    yield query
+    except OSError:
+        return
+
+def collect_warmup_queries(limit: int, log_files: List[str],
+                           question_bank_file: Optional[str] = None,
+                           max_log_bytes: int = 16 * 1024 * 1024) -> List[str]:
+    """Most frequent logged queries, topped up from the question bank
+    
+    Only the last ``max_log_bytes`` of each log are read, so startup cost
+    stays flat however long the server has been running.
+    """
+    if limit <= 0:
+        return []
+    
+    counts: Counter = Counter()
+    for log_file in log_files:
+        counts.update(_iter_log_queries(log_file, max_log_bytes))
+    queries = [query for query, _ in counts.most_common(limit)]
+    
+    if len(queries) < limit and question_bank_file:
+        try:
+            with open(question_bank_file, 'r') as f:
+                question_bank = json.load(f)
+        except (OSError, ValueError):
+            question_bank = []
+        seen = set(queries)
+        for item in question_bank:
+            question = item.get('question', '').strip()
+            if question and question not in seen:
+                queries.append(question)
+                seen.add(question)
+                if len(queries) >= limit:
+                    break
+    
+    return queries
+
+class CacheWarmer:
+    """Runs retrieval warm-up in a background thread and tracks progress"""
+    
+    def __init__(self, batch_size: int = 32):
+        self.batch_size = batch_size
+        self.state = 'idle'
+        self.total = 0
+        self.completed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self, retriever, load_queries: Callable[[], List[str]],
+              select_profile: Callable[[str], str], k: Optional[int] = None) -> None:
+        """Warm ``retriever``'s caches without blocking the caller
+        
+        ``load_queries`` runs on the warm-up thread too, so reading logs
+        never delays startup.
+        """
+        self.state = 'loading'
+        self.completed = 0
+        self.started_at = time.time()
+        self._thread = threading.Thread(
+            target=self._run, args=(retriever, load_queries, select_profile, k),
+            name='cache-warmup', daemon=True)
+        self._thread.start()
+    
+    def _run(self, retriever, load_queries: Callable[[], List[str]],
+             select_profile: Callable[[str], str], k: Optional[int]) -> None:
+        try:
+            queries = load_queries()
+            self.total = len(queries)
+            self.state = 'running'
+            
+            # Group by profile so each group goes through one batched path
+            by_profile: Dict[str, List[str]] = {}
+            for query in queries:
+                by_profile.setdefault(select_profile(query), []).append(query)
+            
+            for profile, profile_queries in by_profile.items():
+                for start in range(0, len(profile_queries), self.batch_size):
+                    batch = profile_queries[start:start + self.batch_size]
+                    retriever.retrieve_batch(batch, profile=profile, k=k,
+                                             batch_size=self.batch_size)
+                    self.completed += len(batch)
+            self.state = 'done'
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+    
+    def get_progress(self) -> Dict[str, Any]:
+        """Get warm-up progress"""
+        end = self.finished_at or time.time()
+        return {
+            'state': self.state,
+            'completed': self.completed,
+            'total': self.total,
+            'progress': self.completed / self.total if self.total else 1.0,
+            'elapsed': end - self.started_at if self.started_at else 0.0,
+            'error': self.error
+        }
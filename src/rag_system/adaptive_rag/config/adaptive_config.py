@@ -3,7 +3,7 @@ Adaptive RAG Configuration - No hardcoded keywords, learned parameters
 """
 
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from dataclasses import dataclass, field
 
 @dataclass
@@ -29,11 +29,43 @@ class AdaptiveConfig:
     # Caching
     cache_sizes: Dict[str, int] = field(default_factory=lambda: {
         'query': 500,
-        'context': 300, 
-        'pack': 20
+        'context': 300
     })
+    cache_max_bytes: Dict[str, int] = field(default_factory=lambda: {
+        'query': 64 * 1024 * 1024,
+        'context': 32 * 1024 * 1024
+    })
+    cache_ttl_seconds: float = 3600.0  # Entry lifetime, 0 disables expiry
+    cache_shards: int = 8  # Lock stripes per cache
+    shared_cache_path: Optional[str] = None  # SQLite file shared across workers, None disables
+    shared_cache_max_entries: int = 10000
+    pack_reload_interval: float = 2.0  # Seconds between pack file mtime checks, 0 disables hot reload
+    
+    # Cache warm-up at server startup
+    warmup_queries: int = 200  # Most frequent logged/question-bank queries to precompute, 0 disables
+    warmup_batch_size: int = 32
+    warmup_question_bank: Optional[str] = None  # Defaults to data/question_bank.json
+    
+    # Index location (None uses the retriever's default)
+    index_dir: Optional[str] = None
+    retrieval_shards: Optional[str] = None  # Comma-separated shard host:port list, None searches locally
+    shard_timeout: float = 0.5  # Seconds to wait for shards before merging what answered
+    shard_concurrency: int = 8  # Concurrent searches per process the shard fan-out pool is sized for
+    retrieval_replicas: Optional[str] = None  # Comma-separated host:port list of identical retrieval workers
+    replica_timeout: float = 2.0  # Seconds per replica search attempt
+    replica_health_interval: float = 2.0  # Seconds between replica health checks
+    rescore_factor: int = 8  # int8/binary indexes: first-pass candidates per result rescored in float
     
     # Model settings
+    mock_model: bool = False  # Serve MockModelInterface instead of loading weights (load tests)
+    mock_prefill_latency: float = 0.05  # Seconds
+    mock_per_token_latency: float = 0.005  # Seconds per generated token
+    model_path: Optional[str] = None  # Defaults to the Qwen2.5-Math-7B-Instruct snapshot
+    generation_url: Optional[str] = None  # Generation server base URL, None loads the model in-process
+    generation_timeout: float = 300.0  # Seconds per remote generation request
+    generation_queue_size: int = 16  # Requests waiting for the model before new ones get 429
+    generation_drain_timeout: float = 120.0  # Seconds to finish queued generations on shutdown
+    web_workers: int = 1  # uvicorn worker processes for the API server
     model_temperature: float = 0.7
     model_top_p: float = 0.95
     model_max_tokens: int = 1024
@@ -42,6 +74,17 @@ class AdaptiveConfig:
     # Telemetry
     enable_telemetry: bool = True
     telemetry_log_file: str = "adaptive_rag_telemetry.jsonl"
+    telemetry_queue_size: int = 10000  # Events buffered before new ones are dropped
+    telemetry_batch_size: int = 256
+    telemetry_flush_interval: float = 1.0  # Seconds
+    telemetry_stats_state_file: Optional[str] = None  # Persists /stats offsets and counters across restarts
+    enable_metrics: bool = True  # Stage histograms and counters served on /metrics
+    
+    # Request tracing
+    trace_file: Optional[str] = None  # JSONL span export (e.g. adaptive_rag_traces.jsonl), None disables tracing
+    trace_sample_rate: float = 0.1  # Fraction of requests traced when trace_file is set
+    profile_every: int = 0  # cProfile the synchronous stages of every Nth traced request, 0 disables
+    profile_dir: str = "profiles"
     
     def __post_init__(self):
         """Validate configuration after initialization"""
@@ -81,10 +124,44 @@ def load_env_config() -> None:
         'ADAPTIVE_MIN_RELEVANCE': 'min_relevance',
         'ADAPTIVE_MAX_CONTEXT_TOKENS': 'max_context_tokens',
         'ADAPTIVE_MAX_CONTEXT_CHUNKS': 'max_context_chunks',
+        'ADAPTIVE_INDEX_DIR': 'index_dir',
+        'ADAPTIVE_RETRIEVAL_SHARDS': 'retrieval_shards',
+        'ADAPTIVE_SHARD_TIMEOUT': 'shard_timeout',
+        'ADAPTIVE_SHARD_CONCURRENCY': 'shard_concurrency',
+        'ADAPTIVE_RETRIEVAL_REPLICAS': 'retrieval_replicas',
+        'ADAPTIVE_REPLICA_TIMEOUT': 'replica_timeout',
+        'ADAPTIVE_REPLICA_HEALTH_INTERVAL': 'replica_health_interval',
+        'ADAPTIVE_RESCORE_FACTOR': 'rescore_factor',
+        'ADAPTIVE_MOCK_MODEL': 'mock_model',
+        'ADAPTIVE_MOCK_PREFILL_LATENCY': 'mock_prefill_latency',
+        'ADAPTIVE_MOCK_PER_TOKEN_LATENCY': 'mock_per_token_latency',
+        'ADAPTIVE_MODEL_PATH': 'model_path',
+        'ADAPTIVE_GENERATION_URL': 'generation_url',
+        'ADAPTIVE_GENERATION_TIMEOUT': 'generation_timeout',
+        'ADAPTIVE_GENERATION_QUEUE_SIZE': 'generation_queue_size',
+        'ADAPTIVE_GENERATION_DRAIN_TIMEOUT': 'generation_drain_timeout',
+        'ADAPTIVE_WEB_WORKERS': 'web_workers',
         'ADAPTIVE_MODEL_TEMPERATURE': 'model_temperature',
         'ADAPTIVE_MODEL_TOP_P': 'model_top_p',
         'ADAPTIVE_MODEL_MAX_TOKENS': 'model_max_tokens',
         'ADAPTIVE_MODEL_REPETITION_PENALTY': 'model_repetition_penalty',
+        'ADAPTIVE_CACHE_TTL_SECONDS': 'cache_ttl_seconds',
+        'ADAPTIVE_CACHE_SHARDS': 'cache_shards',
+        'ADAPTIVE_SHARED_CACHE_PATH': 'shared_cache_path',
+        'ADAPTIVE_SHARED_CACHE_MAX_ENTRIES': 'shared_cache_max_entries',
+        'ADAPTIVE_PACK_RELOAD_INTERVAL': 'pack_reload_interval',
+        'ADAPTIVE_WARMUP_QUERIES': 'warmup_queries',
+        'ADAPTIVE_WARMUP_BATCH_SIZE': 'warmup_batch_size',
+        'ADAPTIVE_WARMUP_QUESTION_BANK': 'warmup_question_bank',
+        'ADAPTIVE_TELEMETRY_QUEUE_SIZE': 'telemetry_queue_size',
+        'ADAPTIVE_TELEMETRY_BATCH_SIZE': 'telemetry_batch_size',
+        'ADAPTIVE_TELEMETRY_FLUSH_INTERVAL': 'telemetry_flush_interval',
+        'ADAPTIVE_TELEMETRY_STATS_STATE_FILE': 'telemetry_stats_state_file',
+        'ADAPTIVE_ENABLE_METRICS': 'enable_metrics',
+        'ADAPTIVE_TRACE_FILE': 'trace_file',
+        'ADAPTIVE_TRACE_SAMPLE_RATE': 'trace_sample_rate',
+        'ADAPTIVE_PROFILE_EVERY': 'profile_every',
+        'ADAPTIVE_PROFILE_DIR': 'profile_dir',
     }
     
     updates = {}
@@ -92,10 +169,14 @@ def load_env_config() -> None:
         if env_var in os.environ:
             value = os.environ[env_var]
             # Convert to appropriate type
-            if config_key in ['token_cutoff', 'start_k', 'widen_by', 'max_k', 'max_context_tokens', 'max_context_chunks', 'model_max_tokens']:
+            if config_key in ['token_cutoff', 'start_k', 'widen_by', 'max_k', 'max_context_tokens', 'max_context_chunks', 'model_max_tokens', 'cache_shards', 'shared_cache_max_entries', 'warmup_queries', 'warmup_batch_size', 'telemetry_queue_size', 'telemetry_batch_size', 'profile_every', 'generation_queue_size', 'web_workers', 'rescore_factor', 'shard_concurrency']:
                 updates[config_key] = int(value)
-            elif config_key in ['relevance_threshold', 'min_relevance', 'model_temperature', 'model_top_p', 'model_repetition_penalty']:
+            elif config_key in ['relevance_threshold', 'min_relevance', 'model_temperature', 'model_top_p', 'model_repetition_penalty', 'cache_ttl_seconds', 'pack_reload_interval', 'telemetry_flush_interval', 'trace_sample_rate', 'mock_prefill_latency', 'mock_per_token_latency', 'shard_timeout', 'replica_timeout', 'replica_health_interval', 'generation_timeout', 'generation_drain_timeout']:
                 updates[config_key] = float(value)
+            elif config_key in ['enable_metrics', 'mock_model']:
+                updates[config_key] = value.lower() in ('1', 'true', 'yes')
+            else:
+                updates[config_key] = value
     
     if updates:
         update_adaptive_config(**updates)
@@ -3,10 +3,16 @@ Core adaptive RAG components
 """
 
 from .query_analyzer import QueryAnalyzer
-from .model_interface import ModelInterface, create_model_interface
+from .model_interface import ModelInterface, MockModelInterface, create_model_interface, load_model
+from .generation_service import GenerationQueue, GenerationOverloadedError, RemoteModelInterface
 
 __all__ = [
     "QueryAnalyzer",
     "ModelInterface",
-    "create_model_interface"
+    "MockModelInterface",
+    "create_model_interface",
+    "load_model",
+    "GenerationQueue",
+    "GenerationOverloadedError",
+    "RemoteModelInterface"
 ]
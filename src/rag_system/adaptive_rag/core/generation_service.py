@@ -0,0 +1,230 @@
+"""
+Disaggregated generation for adaptive RAG
+A bounded request queue in front of one model (run by generation_server.py)
+and the model interface the web tier uses to reach it over HTTP
+"""
+
+import math
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Any, Optional
+
+import requests
+
+from .model_interface import ModelInterface, GenerationConfig, GenerationResult
+
+class GenerationOverloadedError(RuntimeError):
+    """The generation queue is full or draining; retry after ``retry_after`` seconds"""
+    
+    def __init__(self, message: str, retry_after: int = 1, draining: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.draining = draining
+
+class _Job:
+    __slots__ = ('prompt', 'config', 'future', 'enqueued')
+    
+    def __init__(self, prompt: str, config: GenerationConfig):
+        self.prompt = prompt
+        self.config = config
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+class GenerationQueue:
+    """Bounded FIFO in front of a single model worker thread
+    
+    ``submit`` never blocks: when ``max_size`` requests are already waiting
+    it raises GenerationOverloadedError with a Retry-After estimate, so a
+    traffic spike is turned away at the door instead of piling up requests
+    (and their prompts) in the model process. One worker thread owns the
+    model, so the GPU sees one generation at a time.
+    """
+    
+    def __init__(self, model_interface: ModelInterface, max_size: int = 16, window: int = 1000):
+        self.model_interface = model_interface
+        self.max_size = max_size
+        self._queue: "queue.Queue[Optional[_Job]]" = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)
+        self._service_times = deque(maxlen=window)
+        self.busy = False
+        self.draining = False
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._worker = threading.Thread(target=self._run, name='generation-worker', daemon=True)
+        self._worker.start()
+    
+    def submit(self, prompt: str, config: Optional[GenerationConfig] = None) -> Future:
+        """Enqueue a generation; the future resolves to a GenerationResult"""
+        if self.draining:
+            raise GenerationOverloadedError("Generation service is draining", self.retry_after(),
+                                            draining=True)
+        job = _Job(prompt, config or GenerationConfig())
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise GenerationOverloadedError(
+                f"Generation queue full ({self.max_size} waiting)", self.retry_after())
+        with self._lock:
+            self.submitted += 1
+        return job.future
+    
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            self.busy = True
+            wait = started - job.enqueued
+            try:
+                result = self.model_interface.generate(job.prompt, job.config)
+            except Exception as e:
+                self._finished(wait, started, failed=True)
+                job.future.set_exception(e)
+            else:
+                self._finished(wait, started, failed=False)
+                result.model_metadata = {**(result.model_metadata or {}), 'queue_wait': wait}
+                job.future.set_result(result)
+    
+    def _finished(self, wait: float, started: float, failed: bool) -> None:
+        self.busy = False
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self._waits.append(wait)
+            self._service_times.append(time.perf_counter() - started)
+    
+    def retry_after(self) -> int:
+        """Whole seconds until the current backlog should have cleared"""
+        with self._lock:
+            service = (sum(self._service_times) / len(self._service_times)) if self._service_times else 1.0
+        backlog = self._queue.qsize() + (1 if self.busy else 0)
+        return max(1, int(math.ceil(backlog * service)))
+    
+    def drain(self, timeout: float = 60.0) -> bool:
+        """Stop admitting requests and wait for the queued ones to finish
+        
+        Returns False if work was still pending at ``timeout``; requests
+        still queued then fail with GenerationOverloadedError (draining), and
+        the worker stops after the generation it is running.
+        """
+        self.draining = True
+        deadline = time.time() + timeout
+        while (self._queue.qsize() or self.busy) and time.time() < deadline:
+            time.sleep(0.05)
+        drained = not (self._queue.qsize() or self.busy)
+        while True:
+            self._fail_queued()
+            try:
+                self._queue.put_nowait(None)
+                return drained
+            except queue.Full:
+                continue
+    
+    def _fail_queued(self) -> None:
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if job is None or not job.future.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self.failed += 1
+            job.future.set_exception(GenerationOverloadedError(
+                "Generation service shut down before this request ran", draining=True))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            service = list(self._service_times)
+            stats = {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_size': self.max_size,
+                'busy': self.busy,
+                'draining': self.draining,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected
+            }
+        
+        def percentile(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))] if values else None
+        
+        stats['queue_wait_p50'] = percentile(waits, 0.50)
+        stats['queue_wait_p95'] = percentile(waits, 0.95)
+        stats['queue_wait_max'] = waits[-1] if waits else None
+        stats['service_time_avg'] = sum(service) / len(service) if service else None
+        return stats
+
+class RemoteModelInterface(ModelInterface):
+    """Model interface backed by a generation server over HTTP
+    
+    A 429/503 from the server (queue full or draining) is raised as
+    GenerationOverloadedError carrying the server's Retry-After, so the web
+    tier can pass the backpressure on to its own clients.
+    """
+    
+    def __init__(self, url: str, timeout: float = 300.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+        self._info: Optional[Dict[str, Any]] = None
+    
+    @property
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+    
+    def generate(self, prompt: str, config: Optional[GenerationConfig] = None) -> GenerationResult:
+        config = config or GenerationConfig()
+        response = self._session.post(f"{self.url}/generate",
+                                      json={'prompt': prompt, 'config': config.__dict__},
+                                      timeout=self.timeout)
+        if response.status_code in (429, 503):
+            retry_after = int(response.headers.get('Retry-After', '1'))
+            raise GenerationOverloadedError(response.json().get('detail', 'Generation service busy'),
+                                            retry_after, draining=response.status_code == 503)
+        response.raise_for_status()
+        body = response.json()
+        return GenerationResult(
+            text=body['text'],
+            tokens_generated=body['tokens_generated'],
+            generation_time=body['generation_time'],
+            model_metadata=body.get('model_metadata') or {},
+            prefill_time=body.get('prefill_time'),
+            decode_time=body.get('decode_time')
+        )
+    
+    def get_service_stats(self) -> Dict[str, Any]:
+        """The generation server's /health (queue depth, wait times, model info)"""
+        response = self._session.get(f"{self.url}/health", timeout=5)
+        response.raise_for_status()
+        return response.json()
+    
+    def get_model_info(self) -> Dict[str, Any]:
+        if self._info is None:
+            try:
+                self._info = self.get_service_stats().get('model', {})
+            except requests.RequestException:
+                return {'model_type': 'remote', 'url': self.url, 'supports_tool_calling': False}
+        return {**self._info, 'model_type': f"remote:{self._info.get('model_type', 'unknown')}",
+                'url': self.url}
+    
+    def supports_tool_calling(self) -> bool:
+        return bool(self.get_model_info().get('supports_tool_calling'))
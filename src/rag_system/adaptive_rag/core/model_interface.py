@@ -25,6 +25,30 @@ class GenerationResult:
     tokens_generated: int
     generation_time: float
     model_metadata: Dict[str, Any]
+    prefill_time: Optional[float] = None  # Prompt processing up to the first new token
+    decode_time: Optional[float] = None  # Remaining token-by-token generation
+    
+    @property
+    def tokens_per_second(self) -> float:
+        """Decode throughput, falling back to overall throughput without a prefill split"""
+        elapsed = self.decode_time if self.decode_time else self.generation_time
+        return self.tokens_generated / elapsed if elapsed and self.tokens_generated else 0.0
+
+class FirstTokenTimer:
+    """Stopping criterion that only records when the first new token appears
+    
+    ``generate`` calls stopping criteria once per decoding step, so the first
+    call marks the end of prefill. Never stops generation.
+    """
+    
+    def __init__(self):
+        self.first_token_time: Optional[float] = None
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token_time is None:
+            import time
+            self.first_token_time = time.time()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
 
 class ModelInterface(ABC):
     """Abstract interface for different model types"""
@@ -65,7 +89,9 @@ class TransformerModelInterface(ModelInterface):
         # Tokenize input
         inputs = self.tokenizer(prompt, return_tensors='pt').to(self.device)
         
-        # Generate
+        # Generate (the timer splits prefill from decode)
+        from transformers import StoppingCriteriaList
+        timer = FirstTokenTimer()
         with torch.no_grad():
             output = self.model.generate(
                 **inputs,
@@ -75,7 +101,8 @@ class TransformerModelInterface(ModelInterface):
                 top_p=config.top_p,
                 top_k=config.top_k,
                 repetition_penalty=config.repetition_penalty,
-                pad_token_id=self.tokenizer.eos_token_id
+                pad_token_id=self.tokenizer.eos_token_id,
+                stopping_criteria=StoppingCriteriaList([timer])
             )
         
         # Decode response
@@ -84,8 +111,13 @@ class TransformerModelInterface(ModelInterface):
             skip_special_tokens=True
         )
         
-        generation_time = time.time() - start_time
+        end_time = time.time()
+        generation_time = end_time - start_time
         tokens_generated = output[0].shape[0] - inputs['input_ids'].shape[1]
+        prefill_time = decode_time = None
+        if timer.first_token_time is not None:
+            prefill_time = timer.first_token_time - start_time
+            decode_time = end_time - timer.first_token_time
         
         return GenerationResult(
             text=response.strip(),
@@ -95,7 +127,9 @@ class TransformerModelInterface(ModelInterface):
                 'model_type': 'transformer',
                 'device': str(self.device),
                 'config': config.__dict__
-            }
+            },
+            prefill_time=prefill_time,
+            decode_time=decode_time
         )
     
     def get_model_info(self) -> Dict[str, Any]:
@@ -200,6 +234,54 @@ class RLModelInterface(ModelInterface):
         # Could be determined by checking for specific methods or attributes
         return hasattr(self.rl_model, 'get_tools') or hasattr(self.rl_model, 'tool_calling')
 
+class MockModelInterface(ModelInterface):
+    """CPU-only stand-in that simulates generation latency
+    
+    Sleeps ``prefill_latency`` plus ``per_token_latency`` for each of
+    ``tokens`` tokens, so load tests exercise the serving path with
+    realistic timings but without a GPU or model weights.
+    """
+    
+    def __init__(self, prefill_latency: float = 0.05, per_token_latency: float = 0.005,
+                 tokens: int = 64):
+        self.prefill_latency = prefill_latency
+        self.per_token_latency = per_token_latency
+        self.tokens = tokens
+    
+    def generate(self, prompt: str, config: Optional[GenerationConfig] = None) -> GenerationResult:
+        """Return a canned answer after the simulated latency"""
+        import time
+        
+        config = config or GenerationConfig()
+        tokens = min(self.tokens, config.max_new_tokens)
+        start_time = time.time()
+        time.sleep(self.prefill_latency)
+        prefill_time = time.time() - start_time
+        time.sleep(self.per_token_latency * tokens)
+        generation_time = time.time() - start_time
+        
+        return GenerationResult(
+            text="This is a mock response for testing purposes.",
+            tokens_generated=tokens,
+            generation_time=generation_time,
+            model_metadata={'model_type': 'mock', 'prompt_chars': len(prompt)},
+            prefill_time=prefill_time,
+            decode_time=generation_time - prefill_time
+        )
+    
+    def get_model_info(self) -> Dict[str, Any]:
+        """Get mock model information"""
+        return {
+            'model_type': 'mock',
+            'prefill_latency': self.prefill_latency,
+            'per_token_latency': self.per_token_latency,
+            'tokens': self.tokens,
+            'supports_tool_calling': False
+        }
+    
+    def supports_tool_calling(self) -> bool:
+        return False
+
 class ModelFactory:
     """Factory for creating model interfaces"""
     
@@ -227,6 +309,29 @@ class ModelFactory:
         else:
             raise ValueError(f"Unknown model type: {model_type}")
 
+DEFAULT_MODEL_PATH = "/datasets/ai/qwen/hub/models--Qwen--Qwen2.5-Math-7B-Instruct/snapshots/ef9926d75ab1d54532f6a30dd5e760355eb9aa4d"
+
+def load_model(model_path: Optional[str] = None):
+    """Load the model and tokenizer
+    
+    Raises on failure; serving canned mock answers has to be asked for
+    explicitly (ADAPTIVE_MOCK_MODEL).
+    """
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    
+    model_path = model_path or DEFAULT_MODEL_PATH
+    print(f"Loading model from {model_path}...")
+    tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path,
+        torch_dtype="auto",
+        device_map="auto",
+        trust_remote_code=True
+    )
+    
+    print("✅ Model loaded successfully")
+    return model, tokenizer
+
 # Convenience function for backward compatibility
 def create_model_interface(model, tokenizer=None, model_type: str = "auto") -> ModelInterface:
     """Create model interface with backward compatibility"""
@@ -3,14 +3,27 @@ Retrieval components for adaptive RAG
 """
 
 from ..config.profiles_config import get_profile_config, select_profile_for_query
-from .dynamic_search import DynamicRetriever
+from .dynamic_search import DynamicRetriever, RetrievalResult
 from .context_composer import ContextComposer
+from .candidates import CandidateSet
+from .pack_index import PackIndex
+from .sharding import ShardServer, ShardedIndex, partition_index
+from .replicas import ReplicatedIndex
+from .quantized import TwoStageIndex
 from .relevance import RelevanceScorer
 
 __all__ = [
     "get_profile_config", 
     "select_profile_for_query",
     "DynamicRetriever",
+    "RetrievalResult",
     "ContextComposer",
+    "CandidateSet",
+    "PackIndex",
+    "ShardServer",
+    "ShardedIndex",
+    "partition_index",
+    "ReplicatedIndex",
+    "TwoStageIndex",
     "RelevanceScorer"
 ]
@@ -0,0 +1,87 @@
+"""
+Compact candidate sets for the retrieval hot path
+"""
+
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence
+
+class CandidateSet:
+    """Retrieved candidates as parallel arrays over a shared chunk store
+    
+    ``ids`` index into ``texts``/``names`` (the retriever's chunk store, not
+    copies of it). Text is only looked up when asked for, and truncation is
+    recorded as a per-candidate character limit, so selecting, reordering and
+    trimming never copy chunk text. Dicts are built by ``to_dicts`` at the
+    API boundary.
+    """
+    __slots__ = ('ids', 'scores', 'texts', 'names', 'source', 'text_limits')
+    
+    def __init__(self, ids: np.ndarray, scores: np.ndarray, texts: Sequence[str],
+                 names: Sequence[str], source: str = 'index',
+                 text_limits: Optional[np.ndarray] = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.texts = texts
+        self.names = names
+        self.source = source
+        # -1 means the full chunk text
+        self.text_limits = (text_limits if text_limits is not None
+                            else np.full(len(self.ids), -1, dtype=np.int64))
+    
+    @classmethod
+    def empty(cls, texts: Sequence[str] = (), names: Sequence[str] = (),
+              source: str = 'index') -> 'CandidateSet':
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32),
+                   texts, names, source)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def text(self, pos: int) -> str:
+        """Text of the candidate at ``pos``, honouring any truncation"""
+        text = self.texts[self.ids[pos]]
+        limit = self.text_limits[pos]
+        return text if limit < 0 else text[:limit]
+    
+    def text_length(self, pos: int) -> int:
+        """Length of the candidate text without materializing a truncated copy"""
+        length = len(self.texts[self.ids[pos]])
+        limit = self.text_limits[pos]
+        return length if limit < 0 else min(length, int(limit))
+    
+    def cache_nbytes(self) -> int:
+        """Bytes owned by this set; the chunk store is shared and not counted"""
+        return int(self.ids.nbytes + self.scores.nbytes + self.text_limits.nbytes)
+    
+    def name(self, pos: int) -> str:
+        return self.names[self.ids[pos]]
+    
+    def take(self, positions) -> 'CandidateSet':
+        """Subset/reorder by position; chunk storage is shared, not copied"""
+        positions = np.asarray(positions, dtype=np.int64)
+        return CandidateSet(self.ids[positions], self.scores[positions], self.texts,
+                            self.names, self.source, self.text_limits[positions])
+    
+    def sorted_by_score(self) -> 'CandidateSet':
+        """Candidates ordered by score, highest first (stable for ties)"""
+        return self.take(np.argsort(-self.scores, kind='stable'))
+    
+    def with_text_limit(self, pos: int, max_chars: int) -> 'CandidateSet':
+        """Copy of the set with the candidate at ``pos`` truncated to ``max_chars``"""
+        text_limits = self.text_limits.copy()
+        text_limits[pos] = max_chars
+        return CandidateSet(self.ids, self.scores, self.texts, self.names,
+                            self.source, text_limits)
+    
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Materialize labelled chunk dicts for API responses"""
+        return [
+            {
+                'id': self.name(i),
+                'text': self.text(i),
+                'source': self.source,
+                'score': score,
+                'label': f'C{i+1}'
+            }
+            for i, score in enumerate(self.scores.tolist())
+        ]
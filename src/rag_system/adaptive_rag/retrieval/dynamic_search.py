@@ -2,70 +2,204 @@
 Dynamic retrieval with progressive widening for adaptive RAG
 """
 
+import os
 import time
+import threading
 import numpy as np
 import faiss
 from typing import Dict, Any, List, Optional, Tuple
-from dataclasses import dataclass
 
 from ..config.adaptive_config import get_adaptive_config
-from ..config.profiles_config import get_profile_config
+from ..config.profiles_config import get_profile_config, get_all_profiles
 from ..caching.query_cache import QueryCache
+from ..caching.shared_cache import SharedCache
+from ..utils.tracing import get_tracer
 from .relevance import RelevanceScorer
 from .context_composer import ContextComposer
+from .candidates import CandidateSet
+from .pack_index import PackIndex, PackWatcher
+from .sharding import ShardedIndex, parse_shard_urls
+from .replicas import ReplicatedIndex
+from .quantized import TwoStageIndex
+
+RETRIEVAL_STAGES = ('cache_lookup', 'encode', 'search', 'widen', 'compose')
 
-@dataclass
 class RetrievalResult:
-    """Result from dynamic retrieval"""
-    chunks: List[Dict[str, Any]]
-    used_widening: bool
-    mean_relevance: float
-    retrieval_time: float
-    profile_used: str
+    """Result from dynamic retrieval
+    
+    Candidate ids and scores are kept as NumPy arrays so callers can report
+    on them without walking the composed chunk dicts. The composed context
+    stays a CandidateSet until ``context_blocks`` serializes it.
+    """
+    __slots__ = ('candidates', 'candidate_ids', 'candidate_scores', 'used_widening',
+                 'mean_relevance', 'retrieval_time', 'profile_used', 'cache_hit',
+                 'timings')
+    
+    def __init__(self, candidates: CandidateSet, candidate_ids: np.ndarray,
+                 candidate_scores: np.ndarray, used_widening: bool = False,
+                 mean_relevance: float = 0.0, retrieval_time: float = 0.0,
+                 profile_used: str = '', cache_hit: bool = False,
+                 timings: Optional[Dict[str, float]] = None):
+        self.candidates = candidates
+        self.candidate_ids = candidate_ids
+        self.candidate_scores = candidate_scores
+        self.used_widening = used_widening
+        self.mean_relevance = mean_relevance
+        self.retrieval_time = retrieval_time
+        self.profile_used = profile_used
+        self.cache_hit = cache_hit
+        self.timings = timings if timings is not None else dict.fromkeys(RETRIEVAL_STAGES, 0.0)
+    
+    @property
+    def context_blocks(self) -> List[Dict[str, Any]]:
+        """Composed chunks as labelled dicts, as served in API responses"""
+        return self.candidates.to_dicts()
+    
+    def cache_nbytes(self) -> int:
+        """Approximate bytes held by a cached result"""
+        return (self.candidates.cache_nbytes() + int(self.candidate_ids.nbytes) +
+                int(self.candidate_scores.nbytes) + 64 * len(self.timings))
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Latency breakdown for performance_metrics"""
+        return {
+            'retrieval_time': self.retrieval_time,
+            'retrieval_stages': dict(self.timings),
+            'retrieval_cache_hit': self.cache_hit,
+            'used_widening': self.used_widening,
+            'mean_relevance': self.mean_relevance,
+            'num_candidates': int(self.candidate_ids.size),
+            'profile_used': self.profile_used
+        }
 
 class DynamicRetriever:
     """Dynamic retriever with progressive widening"""
     
-    def __init__(self, index_dir: str = None, embed_model: str = None):
+    def __init__(self, index_dir: str = None, embed_model: str = None,
+                 embedder: Optional[Any] = None):
         self.config = get_adaptive_config()
-        self.index_dir = index_dir or '/home/rchaudhry_umass_edu/rag/src/rag_system/index_data'
+        self.index_dir = index_dir or self.config.index_dir or '/home/rchaudhry_umass_edu/rag/src/rag_system/index_data'
         self.embed_model = embed_model or 'BAAI/bge-small-en-v1.5'
+        # Anything with SentenceTransformer's encode(); benchmarks pass a synthetic one
+        self.embedder = embedder
         
         # Initialize components
-        self.query_cache = QueryCache(self.config.cache_sizes['query'])
+        self.query_cache = self._create_cache('query')
+        self.context_cache = self._create_cache('context')
         self.relevance_scorer = RelevanceScorer()
         self.context_composer = ContextComposer(self.config.max_context_tokens)
         
         # Load existing index and data (reuse from current system)
         self._load_index_data()
         
+        # Embed every pack once; the watcher hot-reloads edited pack files
+        self.packs: Dict[str, PackIndex] = {}
+        self._packs_lock = threading.Lock()
+        for profile_config in get_all_profiles().values():
+            if profile_config.source == 'pack':
+                self._get_pack(profile_config)
+        self.pack_watcher = None
+        if self.config.pack_reload_interval and self.config.pack_reload_interval > 0:
+            self.pack_watcher = PackWatcher(self.packs, self.config.pack_reload_interval)
+            self.pack_watcher.start()
+        
+        # Optional node-wide tier behind the in-process query cache
+        self.shared_cache = None
+        if self.config.shared_cache_path:
+            ttl = self.config.cache_ttl_seconds
+            self.shared_cache = SharedCache(
+                self.config.shared_cache_path,
+                index_version=self.index_version,
+                max_entries=self.config.shared_cache_max_entries,
+                ttl=ttl if ttl and ttl > 0 else None
+            )
+    
+    def _create_cache(self, name: str) -> QueryCache:
+        """Create one of the configured caches ('query' or 'context')"""
+        ttl = self.config.cache_ttl_seconds
+        return QueryCache(
+            max_size=self.config.cache_sizes[name],
+            max_bytes=self.config.cache_max_bytes.get(name),
+            ttl=ttl if ttl and ttl > 0 else None,
+            num_shards=self.config.cache_shards
+        )
+    
     def _load_index_data(self):
         """Load FAISS index and associated data"""
         import pickle
         import os
         
-        # Load index
-        self.index = faiss.read_index(os.path.join(self.index_dir, 'faiss.index'))
+        # Load index, or search remote shards/replicas that hold the vectors
+        storage = self._read_embedding_storage()
+        if self.config.retrieval_shards:
+            self.index = ShardedIndex(parse_shard_urls(self.config.retrieval_shards),
+                                      timeout=self.config.shard_timeout,
+                                      concurrency=self.config.shard_concurrency)
+        elif self.config.retrieval_replicas:
+            self.index = ReplicatedIndex(parse_shard_urls(self.config.retrieval_replicas),
+                                         timeout=self.config.replica_timeout,
+                                         health_interval=self.config.replica_health_interval)
+        elif storage != 'float32':
+            # int8/binary codes in memory, exact rescoring from the mapped floats
+            self.index = TwoStageIndex(self.index_dir, storage, self.config.rescore_factor)
+        else:
+            self.index = faiss.read_index(os.path.join(self.index_dir, 'faiss.index'))
         
         # Load chunk data
         with open(os.path.join(self.index_dir, 'md_chunks.pkl'), 'rb') as f:
             self.md_chunks = pickle.load(f)
         with open(os.path.join(self.index_dir, 'md_filenames.pkl'), 'rb') as f:
             self.md_filenames = pickle.load(f)
-        with open(os.path.join(self.index_dir, 'json_data.pkl'), 'rb') as f:
-            self.json_data = pickle.load(f)
-        self.chunk_embeddings = np.load(os.path.join(self.index_dir, 'chunk_embeddings.npy'))
+        if isinstance(self.index, (ShardedIndex, ReplicatedIndex)):
+            self.chunk_embeddings = None
+        elif isinstance(self.index, TwoStageIndex):
+            self.chunk_embeddings = self.index.embeddings
+        else:
+            # Mapped, not copied: the index already holds the vectors in memory
+            self.chunk_embeddings = np.load(os.path.join(self.index_dir, 'chunk_embeddings.npy'),
+                                            mmap_mode='r')
+        self.index_version = self._read_index_version()
         
         # Load embedding model
-        from sentence_transformers import SentenceTransformer
-        self.embedder = SentenceTransformer(self.embed_model)
+        if self.embedder is None:
+            from sentence_transformers import SentenceTransformer
+            self.embedder = SentenceTransformer(self.embed_model)
+    
+    def _read_embedding_storage(self) -> str:
+        """'float32', 'int8' or 'binary' from metadata.json (float32 for older indexes)"""
+        import json
+        
+        try:
+            with open(os.path.join(self.index_dir, 'metadata.json'), 'r') as f:
+                return json.load(f).get('embedding_storage', 'float32')
+        except (OSError, ValueError):
+            return 'float32'
+    
+    def _read_index_version(self) -> str:
+        """Index build identifier from metadata.json, used to invalidate shared caches"""
+        import hashlib
+        import json
+        import os
         
+        metadata_path = os.path.join(self.index_dir, 'metadata.json')
+        try:
+            with open(metadata_path, 'rb') as f:
+                raw = f.read()
+        except OSError:
+            # No metadata: fall back to the index file's identity
+            stat = os.stat(os.path.join(self.index_dir, 'faiss.index'))
+            return f"{stat.st_size}-{stat.st_mtime_ns}"
+        
+        version = json.loads(raw).get('index_version')
+        return str(version) if version else hashlib.sha1(raw).hexdigest()
+    
     def retrieve(self, query: str, profile: str = 'theorem', k: int = None, 
-                config: Optional[Any] = None) -> List[Dict[str, Any]]:
+                config: Optional[Any] = None) -> RetrievalResult:
         """
         Perform dynamic retrieval with progressive widening
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
+        timings = dict.fromkeys(RETRIEVAL_STAGES, 0.0)
         
         # Get profile configuration
         profile_config = get_profile_config(profile)
@@ -74,168 +208,316 @@ class DynamicRetriever:
         k = k or profile_config.max_chunks
         
         # Check cache first
-        cache_key = f"{profile}::{query}"
-        cached_result = self.query_cache.get(cache_key)
-        if cached_result:
+        source_key = self._source_key(profile_config)
+        cache_key = self._cache_key(query, profile, k, source_key)
+        cached_result = self._lookup_cache(cache_key, profile, profile_config, timings, start_time)
+        if cached_result is not None:
             return cached_result
         
         # Perform retrieval based on profile source
+        used_widening = False
         if profile_config.source == 'pack':
-            chunks = self._retrieve_from_pack(profile_config)
+            candidates = self._retrieve_from_pack(query, profile_config, k, timings)
         else:
-            chunks = self._retrieve_from_index(query, profile_config, k, config)
+            candidates, used_widening = self._retrieve_from_index(
+                query, profile_config, k, config, timings)
         
-        # Compose context
-        composed_chunks = self.context_composer.compose(chunks)
+        return self._finish_retrieval(cache_key, source_key, profile, profile_config,
+                                      candidates, used_widening, timings, start_time)
+    
+    def retrieve_batch(self, queries: List[str], profile: str = 'theorem', k: int = None,
+                       config: Optional[Any] = None, batch_size: int = 32) -> List[RetrievalResult]:
+        """
+        Retrieve for many queries at once
         
-        # Cache result
-        self.query_cache.set(cache_key, composed_chunks)
+        Uncached queries are encoded and searched in batches of ``batch_size``;
+        widening and composition stay per query. Results are cached exactly as
+        ``retrieve`` would cache them.
+        """
+        profile_config = get_profile_config(profile)
+        k = k or profile_config.max_chunks
+        config = config or self.config
+        
+        source_key = self._source_key(profile_config)
         
-        retrieval_time = time.time() - start_time
+        results: List[Optional[RetrievalResult]] = [None] * len(queries)
+        pending = []
+        for i, query in enumerate(queries):
+            start_time = time.perf_counter()
+            timings = dict.fromkeys(RETRIEVAL_STAGES, 0.0)
+            cache_key = self._cache_key(query, profile, k, source_key)
+            results[i] = self._lookup_cache(cache_key, profile, profile_config, timings, start_time)
+            if results[i] is None:
+                pending.append(i)
         
-        return composed_chunks
+        for batch_start in range(0, len(pending), batch_size):
+            batch = pending[batch_start:batch_start + batch_size]
+            start_time = time.perf_counter()
+            
+            stage_start = time.perf_counter()
+            query_embeddings = self._encode_queries([queries[i] for i in batch])
+            encode_time = (time.perf_counter() - stage_start) / len(batch)
+            
+            if profile_config.source == 'pack':
+                for row, i in enumerate(batch):
+                    timings = dict.fromkeys(RETRIEVAL_STAGES, 0.0)
+                    timings['encode'] = encode_time
+                    candidates = self._search_pack(query_embeddings[row], profile_config, k, timings)
+                    results[i] = self._finish_retrieval(
+                        self._cache_key(queries[i], profile, k, source_key), source_key,
+                        profile, profile_config, candidates, False, timings, start_time)
+                continue
+            
+            stage_start = time.perf_counter()
+            start_k = min(k, config.start_k)
+            similarities, indices = self.index.search(query_embeddings, start_k)
+            search_time = (time.perf_counter() - stage_start) / len(batch)
+            
+            for row, i in enumerate(batch):
+                timings = dict.fromkeys(RETRIEVAL_STAGES, 0.0)
+                timings['encode'] = encode_time
+                candidates, used_widening = self._search_index(
+                    query_embeddings[row:row + 1], profile_config, k, config, timings,
+                    initial=(similarities[row], indices[row]))
+                timings['search'] += search_time
+                results[i] = self._finish_retrieval(
+                    self._cache_key(queries[i], profile, k, source_key), source_key,
+                    profile, profile_config, candidates, used_widening, timings, start_time)
+        
+        return results
     
-    def _retrieve_from_pack(self, profile_config) -> List[Dict[str, Any]]:
-        """Retrieve from pre-defined pack (no search needed)"""
-        import json
-        import os
+    def _source_key(self, profile_config) -> str:
+        """What a profile's results are drawn from, including the pack version"""
+        if profile_config.source == 'pack':
+            pack = self._get_pack(profile_config)
+            return f"pack:{pack.pack_file}@{pack.snapshot.version}"
+        return 'index'
+    
+    @staticmethod
+    def _cache_key(query: str, profile: str, k: int, source_key: str) -> str:
+        # Pack keys carry the pack version so a hot reload invalidates them
+        if source_key == 'index':
+            return f"{profile}::{k}::{query}"
+        return f"{profile}::{k}::{source_key}::{query}"
+    
+    def _lookup_cache(self, cache_key: str, profile: str, profile_config,
+                      timings: Dict[str, float], start_time: float) -> Optional[RetrievalResult]:
+        """Check the in-process cache, then the shared tier"""
+        cached_result = self.query_cache.get(cache_key)
+        timings['cache_lookup'] = time.perf_counter() - start_time
+        if cached_result is not None:
+            return RetrievalResult(
+                candidates=cached_result.candidates,
+                candidate_ids=cached_result.candidate_ids,
+                candidate_scores=cached_result.candidate_scores,
+                used_widening=cached_result.used_widening,
+                mean_relevance=cached_result.mean_relevance,
+                retrieval_time=time.perf_counter() - start_time,
+                profile_used=profile,
+                cache_hit=True,
+                timings=timings
+            )
         
+        # Then the node-wide tier (index results only; packs are local and cheap)
+        if self.shared_cache is not None and profile_config.source != 'pack':
+            shared_entry = self.shared_cache.get(cache_key)
+            timings['cache_lookup'] = time.perf_counter() - start_time
+            if shared_entry is not None:
+                result = self._from_shared_entry(shared_entry, profile)
+                self.query_cache.set(cache_key, result)
+                result.retrieval_time = timings['cache_lookup']
+                result.timings = timings
+                return result
+        
+        return None
+    
+    def _finish_retrieval(self, cache_key: str, source_key: str, profile: str, profile_config,
+                          candidates: CandidateSet, used_widening: bool,
+                          timings: Dict[str, float], start_time: float) -> RetrievalResult:
+        """Compose context, build the result and write it to the caches"""
+        # Compose context (shared across queries that land on the same candidates)
+        compose_start = time.perf_counter()
+        context_key = (source_key, candidates.ids.tobytes(), candidates.scores.tobytes())
+        composed = self.context_cache.get(context_key)
+        if composed is None:
+            with get_tracer().span('compose', num_candidates=len(candidates)) as span:
+                composed = self.context_composer.compose(candidates)
+                if span is not None:
+                    span.set_attribute('num_composed', len(composed))
+            self.context_cache.set(context_key, composed)
+        timings['compose'] = time.perf_counter() - compose_start
+        
+        result = RetrievalResult(
+            candidates=composed,
+            candidate_ids=candidates.ids,
+            candidate_scores=candidates.scores,
+            used_widening=used_widening,
+            mean_relevance=float(candidates.scores.mean()) if len(candidates) else 0.0,
+            retrieval_time=time.perf_counter() - start_time,
+            profile_used=profile,
+            timings=timings
+        )
+        
+        # Cache result
+        self.query_cache.set(cache_key, result)
+        if self.shared_cache is not None and profile_config.source != 'pack':
+            self.shared_cache.set(cache_key, self._to_shared_entry(result))
+        
+        return result
+    
+    def _to_shared_entry(self, result: RetrievalResult) -> Dict[str, Any]:
+        """Process-independent form of an index result (ids, not chunk text)"""
+        return {
+            'candidate_ids': np.asarray(result.candidate_ids, dtype=np.int64),
+            'candidate_scores': np.asarray(result.candidate_scores, dtype=np.float32),
+            'context_ids': result.candidates.ids,
+            'context_scores': result.candidates.scores,
+            'context_limits': np.asarray(result.candidates.text_limits, dtype=np.int64),
+            'used_widening': bool(result.used_widening),
+            'mean_relevance': float(result.mean_relevance)
+        }
+    
+    def _from_shared_entry(self, entry: Dict[str, Any], profile: str) -> RetrievalResult:
+        """Rebuild a result from a shared entry against this process's chunk store"""
+        candidates = CandidateSet(entry['context_ids'], entry['context_scores'], self.md_chunks,
+                                  self.md_filenames, source='index',
+                                  text_limits=entry['context_limits'])
+        return RetrievalResult(
+            candidates=candidates,
+            candidate_ids=entry['candidate_ids'],
+            candidate_scores=entry['candidate_scores'],
+            used_widening=entry['used_widening'],
+            mean_relevance=entry['mean_relevance'],
+            profile_used=profile,
+            cache_hit=True
+        )
+    
+    def _get_pack(self, profile_config) -> PackIndex:
+        """The in-memory index for a profile's pack, embedding it on first use"""
         pack_file = profile_config.pack_file
         # Make path relative to current directory
         if not os.path.isabs(pack_file):
             pack_file = os.path.join(os.path.dirname(__file__), '..', '..', '..', pack_file)
+        pack_file = os.path.normpath(pack_file)
         
-        if not os.path.exists(pack_file):
-            # Create default definitions pack if it doesn't exist
-            self._create_default_definitions_pack(pack_file)
+        pack = self.packs.get(pack_file)
+        if pack is None:
+            with self._packs_lock:
+                pack = self.packs.get(pack_file)
+                if pack is None:
+                    pack = PackIndex(pack_file, self._encode_queries)
+                    self.packs[pack_file] = pack
+        return pack
+    
+    def _retrieve_from_pack(self, query: str, profile_config, k: int,
+                            timings: Optional[Dict[str, float]] = None) -> CandidateSet:
+        """Retrieve the pack items most similar to the query"""
+        timings = timings if timings is not None else {}
         
-        with open(pack_file, 'r') as f:
-            pack_data = json.load(f)
+        stage_start = time.perf_counter()
+        query_embedding = self._encode_queries([query])[0]
+        timings['encode'] = time.perf_counter() - stage_start
         
-        # Convert pack data to chunk format
-        chunks = []
-        for i, item in enumerate(pack_data):
-            chunks.append({
-                'id': item.get('id', f'pack_{i}'),
-                'text': item.get('text', ''),
-                'source': 'pack',
-                'score': 1.0,  # Pack items have full relevance
-                'label': f'C{i+1}'
-            })
+        return self._search_pack(query_embedding, profile_config, k, timings)
+    
+    def _search_pack(self, query_embedding: np.ndarray, profile_config, k: int,
+                     timings: Optional[Dict[str, float]] = None) -> CandidateSet:
+        """Top-k pack items by similarity, capped at the profile's max_chunks"""
+        timings = timings if timings is not None else {}
         
-        return chunks
+        stage_start = time.perf_counter()
+        candidates = self._get_pack(profile_config).search(
+            query_embedding, min(k, profile_config.max_chunks),
+            threshold=profile_config.similarity_threshold,
+            boost=profile_config.relevance_boost)
+        timings['search'] = time.perf_counter() - stage_start
+        return candidates
     
-    def _create_default_definitions_pack(self, pack_file: str):
-        """Create a default definitions pack"""
-        import json
-        import os
+    def _retrieve_from_index(self, query: str, profile_config, k: int, 
+                           config: Optional[Any] = None,
+                           timings: Optional[Dict[str, float]] = None
+                           ) -> Tuple[CandidateSet, bool]:
+        """Retrieve from FAISS index with progressive widening
         
-        default_definitions = [
-            {
-                "id": "defs:probability",
-                "text": "Probability is a measure of the likelihood that an event will occur. It is quantified as a number between 0 and 1, where 0 indicates impossibility and 1 indicates certainty."
-            },
-            {
-                "id": "defs:random_variable",
-                "text": "A random variable is a variable whose possible values are outcomes of a random phenomenon. It can be discrete (taking countable values) or continuous (taking uncountable values)."
-            },
-            {
-                "id": "defs:expectation",
-                "text": "The expected value or expectation of a random variable is the long-run average value of repetitions of the experiment it represents. For discrete random variables, it is the sum of all possible values weighted by their probabilities."
-            },
-            {
-                "id": "defs:variance",
-                "text": "Variance measures how far a set of numbers are spread out from their average value. For a random variable, it is the expected value of the squared deviation from the mean."
-            },
-            {
-                "id": "defs:distribution",
-                "text": "A probability distribution describes the probabilities of all possible outcomes of a random variable. It can be specified by a probability mass function (discrete) or probability density function (continuous)."
-            }
-        ]
+        Returns (candidates, used_widening) and records the encode/search/widen
+        stage times into ``timings``.
+        """
         
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(pack_file), exist_ok=True)
+        timings = timings if timings is not None else {}
+        
+        # Encode query
+        stage_start = time.perf_counter()
+        query_embedding = self._encode_queries([query])
+        timings['encode'] = time.perf_counter() - stage_start
         
-        with open(pack_file, 'w') as f:
-            json.dump(default_definitions, f, indent=2)
+        return self._search_index(query_embedding, profile_config, k, config, timings)
     
-    def _retrieve_from_index(self, query: str, profile_config, k: int, 
-                           config: Optional[Any] = None) -> List[Dict[str, Any]]:
-        """Retrieve from FAISS index with progressive widening"""
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed and L2-normalize queries for inner-product search"""
+        query_embeddings = self.embedder.encode(queries, convert_to_numpy=True)
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        faiss.normalize_L2(query_embeddings)
+        return query_embeddings
+    
+    def _search_index(self, query_embedding: np.ndarray, profile_config, k: int,
+                      config: Optional[Any] = None,
+                      timings: Optional[Dict[str, float]] = None,
+                      initial: Optional[Tuple[np.ndarray, np.ndarray]] = None
+                      ) -> Tuple[CandidateSet, bool]:
+        """Threshold and progressively widen the search for one query embedding
         
+        ``initial`` takes this query's row of an already-run batched start_k
+        search, in which case only widening touches the index here.
+        """
         # Use config or default
         config = config or self.config
-        
-        # Encode query
-        query_embedding = self.embedder.encode([query], convert_to_numpy=True)
-        query_embedding = faiss.normalize_L2(query_embedding)
+        timings = timings if timings is not None else {}
         
         # Initial search with start_k
+        stage_start = time.perf_counter()
         start_k = min(k, config.start_k)
-        similarities, indices = self.index.search(query_embedding, start_k)
-        
-        # Filter by similarity threshold
-        relevant_results = []
-        for i, (sim_score, idx) in enumerate(zip(similarities[0], indices[0])):
-            if sim_score >= profile_config.similarity_threshold:
-                filename = self.md_filenames[idx]
-                content = self.md_chunks[idx]
-                
-                # Apply profile-specific relevance boost
-                boosted_score = sim_score + profile_config.relevance_boost
-                
-                relevant_results.append({
-                    'filename': filename,
-                    'content': content,
-                    'similarity': float(boosted_score),
-                    'index': idx
-                })
+        if initial is None:
+            similarities, indices = self.index.search(query_embedding, start_k)
+            initial = (similarities[0], indices[0])
+        candidate_ids, candidate_scores = self._filter_candidates(
+            initial[0], initial[1], profile_config)
+        timings['search'] = time.perf_counter() - stage_start
         
         # Calculate mean relevance
-        mean_relevance = self.relevance_scorer.mean_relevance(relevant_results)
+        mean_relevance = float(candidate_scores.mean()) if candidate_scores.size else 0.0
         
         # Progressive widening if needed
         used_widening = False
         if (profile_config.widenable and 
             mean_relevance < config.relevance_threshold and 
-            len(relevant_results) < k):
+            candidate_ids.size < k):
             
             # Search with more results
+            stage_start = time.perf_counter()
             wider_k = min(start_k + config.widen_by, k, len(self.md_chunks))
             similarities_wider, indices_wider = self.index.search(query_embedding, wider_k)
-            
-            # Combine and re-rank
-            all_results = []
-            for i, (sim_score, idx) in enumerate(zip(similarities_wider[0], indices_wider[0])):
-                if sim_score >= profile_config.similarity_threshold:
-                    filename = self.md_filenames[idx]
-                    content = self.md_chunks[idx]
-                    boosted_score = sim_score + profile_config.relevance_boost
-                    
-                    all_results.append({
-                        'filename': filename,
-                        'content': content,
-                        'similarity': float(boosted_score),
-                        'index': idx
-                    })
+            candidate_ids, candidate_scores = self._filter_candidates(
+                similarities_wider[0], indices_wider[0], profile_config)
             
             # Take top k results
-            all_results.sort(key=lambda x: x['similarity'], reverse=True)
-            relevant_results = all_results[:k]
+            order = np.argsort(-candidate_scores, kind='stable')[:k]
+            candidate_ids = candidate_ids[order]
+            candidate_scores = candidate_scores[order]
             used_widening = True
+            timings['widen'] = time.perf_counter() - stage_start
         
-        # Convert to chunk format
-        chunks = []
-        for i, result in enumerate(relevant_results):
-            chunks.append({
-                'id': result['filename'],
-                'text': result['content'],
-                'source': 'index',
-                'score': result['similarity'],
-                'label': f'C{i+1}'
-            })
-        
-        return chunks
+        candidates = CandidateSet(candidate_ids, candidate_scores, self.md_chunks,
+                                  self.md_filenames, source='index')
+        return candidates, used_widening
+    
+    def _filter_candidates(self, similarities: np.ndarray, indices: np.ndarray,
+                           profile_config) -> Tuple[np.ndarray, np.ndarray]:
+        """Apply the profile similarity threshold and relevance boost"""
+        # FAISS pads missing results with -1
+        mask = (indices >= 0) & (similarities >= profile_config.similarity_threshold)
+        candidate_ids = indices[mask].astype(np.int64, copy=False)
+        candidate_scores = (similarities[mask] + profile_config.relevance_boost).astype(np.float32, copy=False)
+        return candidate_ids, candidate_scores
     
     def get_retrieval_stats(self) -> Dict[str, Any]:
         """Get statistics about retrieval performance"""
@@ -243,5 +525,14 @@ class DynamicRetriever:
             'cache_hit_rate': self.query_cache.get_hit_rate(),
             'total_queries': self.query_cache.get_total_queries(),
             'cache_size': self.query_cache.get_size(),
+            'caches': {
+                'query': self.query_cache.get_stats(),
+                'context': self.context_cache.get_stats(),
+                'shared': self.shared_cache.get_stats() if self.shared_cache is not None else None
+            },
+            'packs': [pack.get_stats() for pack in list(self.packs.values())],
+            'shards': self.index.get_stats() if isinstance(self.index, ShardedIndex) else None,
+            'replicas': self.index.get_stats() if isinstance(self.index, ReplicatedIndex) else None,
+            'quantized': self.index.get_stats() if isinstance(self.index, TwoStageIndex) else None,
             'index_size': len(self.md_chunks) if hasattr(self, 'md_chunks') else 0
         }
@@ -0,0 +1,142 @@
+"""
+In-memory pack indexes for adaptive RAG
+"""
+
+import os
+import json
+import threading
+import numpy as np
+from typing import Dict, Any, List, Callable, Optional
+
+from .candidates import CandidateSet
+
+DEFAULT_DEFINITIONS = [
+    {
+        "id": "defs:probability",
+        "text": "Probability is a measure of the likelihood that an event will occur. It is quantified as a number between 0 and 1, where 0 indicates impossibility and 1 indicates certainty."
+    },
+    {
+        "id": "defs:random_variable",
+        "text": "A random variable is a variable whose possible values are outcomes of a random phenomenon. It can be discrete (taking countable values) or continuous (taking uncountable values)."
+    },
+    {
+        "id": "defs:expectation",
+        "text": "The expected value or expectation of a random variable is the long-run average value of repetitions of the experiment it represents. For discrete random variables, it is the sum of all possible values weighted by their probabilities."
+    },
+    {
+        "id": "defs:variance",
+        "text": "Variance measures how far a set of numbers are spread out from their average value. For a random variable, it is the expected value of the squared deviation from the mean."
+    },
+    {
+        "id": "defs:distribution",
+        "text": "A probability distribution describes the probabilities of all possible outcomes of a random variable. It can be specified by a probability mass function (discrete) or probability density function (continuous)."
+    }
+]
+
+class PackSnapshot:
+    """One loaded version of a pack: texts, names and normalized embeddings"""
+    __slots__ = ('texts', 'names', 'embeddings', 'version')
+    
+    def __init__(self, texts: List[str], names: List[str], embeddings: np.ndarray, version: int):
+        self.texts = texts
+        self.names = names
+        self.embeddings = embeddings
+        self.version = version
+
+class PackIndex:
+    """A definitions pack embedded once and searched in memory
+    
+    Packs are a handful of items, so a dense matrix product beats any FAISS
+    index. Each reload builds a new PackSnapshot and swaps it in with one
+    assignment; searches in flight keep the snapshot they started with.
+    """
+    
+    def __init__(self, pack_file: str, encode: Callable[[List[str]], np.ndarray]):
+        self.pack_file = pack_file
+        self._encode = encode
+        self.reloads = 0
+        self.reload_errors = 0
+        self.snapshot = self._load()
+    
+    def _load(self) -> PackSnapshot:
+        if not os.path.exists(self.pack_file):
+            # Create default definitions pack if it doesn't exist
+            os.makedirs(os.path.dirname(self.pack_file), exist_ok=True)
+            with open(self.pack_file, 'w') as f:
+                json.dump(DEFAULT_DEFINITIONS, f, indent=2)
+        
+        version = os.stat(self.pack_file).st_mtime_ns
+        with open(self.pack_file, 'r') as f:
+            pack_data = json.load(f)
+        
+        texts = [item.get('text', '') for item in pack_data]
+        names = [item.get('id', f'pack_{i}') for i, item in enumerate(pack_data)]
+        if texts:
+            embeddings = self._encode(texts)
+        else:
+            embeddings = np.empty((0, 0), dtype=np.float32)
+        return PackSnapshot(texts, names, embeddings, version)
+    
+    def mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.pack_file).st_mtime_ns
+        except OSError:
+            return None
+    
+    def reload_if_changed(self) -> bool:
+        """Re-embed the pack if its file changed on disk; returns True on reload"""
+        mtime = self.mtime()
+        if mtime is None or mtime == self.snapshot.version:
+            return False
+        try:
+            self.snapshot = self._load()
+        except (OSError, ValueError):
+            # Half-written or invalid file: keep serving the previous version
+            self.reload_errors += 1
+            return False
+        self.reloads += 1
+        return True
+    
+    def search(self, query_embedding: np.ndarray, k: int, threshold: float = 0.0,
+               boost: float = 0.0) -> CandidateSet:
+        """Top-``k`` pack items by cosine similarity above ``threshold``"""
+        snapshot = self.snapshot
+        if not snapshot.texts:
+            return CandidateSet.empty(snapshot.texts, snapshot.names, source='pack')
+        
+        similarities = snapshot.embeddings @ query_embedding.reshape(-1)
+        order = np.argsort(-similarities, kind='stable')[:k]
+        order = order[similarities[order] >= threshold]
+        scores = (similarities[order] + boost).astype(np.float32, copy=False)
+        return CandidateSet(order, scores, snapshot.texts, snapshot.names, source='pack')
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'pack_file': self.pack_file,
+            'size': len(self.snapshot.texts),
+            'version': self.snapshot.version,
+            'reloads': self.reloads,
+            'reload_errors': self.reload_errors
+        }
+
+class PackWatcher:
+    """Polls pack files' mtimes on a daemon thread and hot-reloads edits"""
+    
+    def __init__(self, packs: Dict[str, PackIndex], interval: float = 2.0):
+        self.packs = packs
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='pack-watcher', daemon=True)
+        self._thread.start()
+    
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            for pack in list(self.packs.values()):
+                if pack.reload_if_changed():
+                    print(f"🔄 Reloaded pack {pack.pack_file} ({len(pack.snapshot.texts)} items)")
+    
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,155 @@
+"""
+Replicated retrieval workers for adaptive RAG
+"""
+
+import time
+import random
+import threading
+import numpy as np
+import requests
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from .sharding import ShardClient
+
+class Replica:
+    """Frontend-side view of one retrieval worker"""
+    __slots__ = ('client', 'outstanding', 'requests', 'errors', 'healthy', 'last_error', 'info')
+    
+    def __init__(self, client: ShardClient):
+        self.client = client
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.healthy = True
+        self.last_error: Optional[str] = None
+        self.info: Dict[str, Any] = {}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'url': self.client.url,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'errors': self.errors,
+            'last_error': self.last_error
+        }
+
+class ReplicatedIndex:
+    """Load-balances searches over identical retrieval workers
+    
+    Each search goes to the healthy replica with the fewest requests this
+    frontend has outstanding on it (ties broken at random), and is retried
+    once on another replica if that one fails. A replica that refuses
+    connections leaves the rotation (a timed-out one stays in it); a
+    background thread polls every replica's /health and brings replicas
+    back once they answer again. Exposes FAISS's ``search`` signature.
+    """
+    
+    def __init__(self, replica_urls: List[str], timeout: float = 2.0, health_interval: float = 2.0,
+                 max_attempts: int = 2):
+        if not replica_urls:
+            raise ValueError("ReplicatedIndex needs at least one replica URL")
+        self.timeout = timeout
+        self.replicas = [Replica(ShardClient(url, timeout)) for url in replica_urls]
+        self.max_attempts = max_attempts
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.retries = 0
+        self.failures = 0
+        
+        self.check_health()
+        reachable = [replica.info for replica in self.replicas if replica.healthy]
+        if not reachable:
+            raise RuntimeError("No retrieval replica is reachable")
+        self.ntotal = reachable[0].get('ntotal', 0)
+        self.d = reachable[0].get('dim')
+        
+        self._stop = threading.Event()
+        self._health_thread = None
+        if health_interval and health_interval > 0:
+            self._health_thread = threading.Thread(target=self._health_loop, name='replica-health',
+                                                   daemon=True)
+            self._health_thread.start()
+    
+    def check_health(self) -> None:
+        """Poll every replica once and update its place in the rotation"""
+        for replica in self.replicas:
+            try:
+                replica.info = replica.client.health()
+            except requests.RequestException as e:
+                if replica.healthy:
+                    print(f"⚠️  Retrieval replica {replica.client.url} failed health check: {e}")
+                replica.healthy = False
+                replica.last_error = str(e)
+                continue
+            if not replica.healthy:
+                print(f"✅ Retrieval replica {replica.client.url} is back")
+            replica.healthy = True
+    
+    def _health_loop(self) -> None:
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+    
+    def _acquire(self, tried: Set[int]) -> Optional[int]:
+        """Pick and reserve the least-loaded healthy replica not tried yet"""
+        with self._lock:
+            candidates = [i for i, replica in enumerate(self.replicas)
+                          if replica.healthy and i not in tried]
+            if not candidates:
+                # Health state may be stale; fall back to anything untried
+                candidates = [i for i in range(len(self.replicas)) if i not in tried]
+            if not candidates:
+                return None
+            least = min(self.replicas[i].outstanding for i in candidates)
+            chosen = random.choice([i for i in candidates if self.replicas[i].outstanding == least])
+            self.replicas[chosen].outstanding += 1
+            self.replicas[chosen].requests += 1
+            return chosen
+    
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        tried: Set[int] = set()
+        last_error: Optional[Exception] = None
+        with self._lock:
+            self.searches += 1
+        for attempt in range(self.max_attempts):
+            chosen = self._acquire(tried)
+            if chosen is None:
+                break
+            tried.add(chosen)
+            replica = self.replicas[chosen]
+            if attempt:
+                with self._lock:
+                    self.retries += 1
+            try:
+                # Each attempt gets ``timeout`` in total, not per socket read
+                return replica.client.search(queries, k, time.monotonic() + self.timeout)
+            except requests.RequestException as e:
+                last_error = e
+                with self._lock:
+                    replica.errors += 1
+                    replica.last_error = str(e)
+                    # A slow reply means a busy worker, not a dead one; only
+                    # unreachable replicas leave the rotation until /health passes
+                    if isinstance(e, requests.ConnectionError):
+                        replica.healthy = False
+            finally:
+                with self._lock:
+                    replica.outstanding -= 1
+        with self._lock:
+            self.failures += 1
+        raise RuntimeError(f"No retrieval replica answered: {last_error}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'num_replicas': len(self.replicas),
+                'healthy_replicas': sum(1 for replica in self.replicas if replica.healthy),
+                'searches': self.searches,
+                'retries': self.retries,
+                'failures': self.failures,
+                'replicas': [replica.get_stats() for replica in self.replicas]
+            }
+    
+    def close(self) -> None:
+        self._stop.set()
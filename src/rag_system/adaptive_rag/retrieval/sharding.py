@@ -0,0 +1,404 @@
+"""
+Sharded retrieval for adaptive RAG
+
+Chunk embeddings are partitioned into contiguous slices, one per shard
+process. Each ShardServer serves its slice over a small HTTP protocol;
+ShardedIndex fans a query out to every shard and merges the results, and
+exposes the FAISS ``search`` signature so DynamicRetriever can use it in
+place of a local index. retrieval_shard_server.py partitions indexes
+and runs shard processes.
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import itertools
+import threading
+import numpy as np
+import faiss
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+SHARD_FILE = 'shard.json'
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """Threaded server that does not print tracebacks for clients that hung up"""
+    daemon_threads = True
+    
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def partition_index(index_dir: str, output_dir: str, num_shards: int) -> List[str]:
+    """Split an index directory's embeddings into ``num_shards`` IndexFlatIP shards
+    
+    Shard ``s`` holds a contiguous range of chunk ids and records its
+    offset, so results map back to global ids. Chunk texts stay with the
+    coordinator. Returns the shard directories.
+    """
+    embeddings = np.load(os.path.join(index_dir, 'chunk_embeddings.npy'), mmap_mode='r')
+    metadata_path = os.path.join(index_dir, 'metadata.json')
+    index_version = None
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'r') as f:
+            index_version = json.load(f).get('index_version')
+    
+    total, dim = embeddings.shape
+    bounds = np.linspace(0, total, num_shards + 1).astype(np.int64)
+    shard_dirs = []
+    for shard_id in range(num_shards):
+        start, stop = int(bounds[shard_id]), int(bounds[shard_id + 1])
+        shard_dir = os.path.join(output_dir, f"shard_{shard_id:02d}")
+        os.makedirs(shard_dir, exist_ok=True)
+        
+        vectors = np.ascontiguousarray(embeddings[start:stop], dtype=np.float32)
+        index = faiss.IndexFlatIP(dim)
+        index.add(vectors)
+        faiss.write_index(index, os.path.join(shard_dir, 'faiss.index'))
+        np.save(os.path.join(shard_dir, 'chunk_embeddings.npy'), vectors)
+        
+        with open(os.path.join(shard_dir, SHARD_FILE), 'w') as f:
+            json.dump({
+                'shard_id': shard_id,
+                'num_shards': num_shards,
+                'offset': start,
+                'count': stop - start,
+                'dim': dim,
+                'index_version': index_version
+            }, f, indent=2)
+        shard_dirs.append(shard_dir)
+        print(f"📦 Shard {shard_id}: chunks [{start}, {stop}) -> {shard_dir}")
+    return shard_dirs
+
+class MmapFlatIndex:
+    """Exact inner-product search over a memory-mapped chunk_embeddings.npy
+    
+    Unlike faiss.read_index, nothing is copied into process memory: every
+    process mapping the same file shares one copy in the page cache.
+    """
+    
+    def __init__(self, embeddings_path: str):
+        self.embeddings = np.load(embeddings_path, mmap_mode='r')
+        self.ntotal, self.d = self.embeddings.shape
+    
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        found = min(k, self.ntotal)
+        scores, ids = faiss.knn(queries, self.embeddings, found, metric=faiss.METRIC_INNER_PRODUCT)
+        if found < k:
+            # Pad like FAISS indexes do
+            pad = ((0, 0), (0, k - found))
+            scores = np.pad(scores, pad, constant_values=-np.inf)
+            ids = np.pad(ids, pad, constant_values=-1)
+        return scores, ids
+
+class ShardServer:
+    """Serves one index slice over HTTP
+    
+    ``POST /search?k=K&d=D`` takes a float32 query matrix as the raw body
+    and answers with float32 scores followed by int64 global chunk ids,
+    both shaped (num_queries, K). ``GET /health`` describes the shard.
+    """
+    
+    def __init__(self, shard_dir: str, host: str = '0.0.0.0', port: int = 0, mmap: bool = False):
+        self.shard_dir = shard_dir
+        index_path = os.path.join(shard_dir, 'faiss.index')
+        embeddings_path = os.path.join(shard_dir, 'chunk_embeddings.npy')
+        if mmap and os.path.exists(embeddings_path):
+            # Replicas of one shard share the mapped embeddings
+            self.index = MmapFlatIndex(embeddings_path)
+        elif mmap:
+            self.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+        else:
+            self.index = faiss.read_index(index_path)
+        
+        shard_path = os.path.join(shard_dir, SHARD_FILE)
+        if os.path.exists(shard_path):
+            with open(shard_path, 'r') as f:
+                self.info = json.load(f)
+        else:
+            # A plain index directory serves as a single shard
+            self.info = {'shard_id': 0, 'num_shards': 1, 'offset': 0, 'count': int(self.index.ntotal),
+                         'dim': int(self.index.d), 'index_version': None}
+        self.offset = int(self.info['offset'])
+        
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.queries = 0
+        self.in_flight = 0
+        self.httpd = _QuietHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        if host in ('0.0.0.0', ''):
+            host = '127.0.0.1'
+        return f"http://{host}:{port}"
+    
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Local top-``k`` with ids shifted into the global id space"""
+        with self._lock:
+            self.in_flight += 1
+        try:
+            scores, ids = self.index.search(queries, k)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.searches += 1
+                self.queries += len(queries)
+        ids = ids.astype(np.int64, copy=False)
+        ids[ids >= 0] += self.offset
+        return scores.astype(np.float32, copy=False), ids
+    
+    def health(self) -> Dict[str, Any]:
+        return {
+            **self.info,
+            'ntotal': int(self.index.ntotal),
+            'pid': os.getpid(),
+            'mmap': isinstance(self.index, MmapFlatIndex),
+            'searches': self.searches,
+            'queries': self.queries,
+            'in_flight': self.in_flight
+        }
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without this, Nagle
+            # plus the client's delayed ACK adds ~40 ms to every reply
+            disable_nagle_algorithm = True
+            
+            def _reply(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                if urlparse(self.path).path != '/health':
+                    self._reply(404, b'{}', 'application/json')
+                    return
+                self._reply(200, json.dumps(server.health()).encode('utf-8'), 'application/json')
+            
+            def do_POST(self):
+                parsed = urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if parsed.path != '/search':
+                    self._reply(404, b'{}', 'application/json')
+                    return
+                try:
+                    params = parse_qs(parsed.query)
+                    k = int(params['k'][0])
+                    dim = int(params['d'][0])
+                    queries = np.frombuffer(body, dtype=np.float32).reshape(-1, dim)
+                    scores, ids = server.search(queries, k)
+                except (KeyError, ValueError) as e:
+                    self._reply(400, json.dumps({'error': str(e)}).encode('utf-8'), 'application/json')
+                    return
+                self._reply(200, scores.tobytes() + ids.tobytes(), 'application/octet-stream')
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def start(self) -> 'ShardServer':
+        """Serve on a daemon thread (local tests)"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='shard-server', daemon=True)
+        self._thread.start()
+        return self
+    
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+    
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class ShardReplyError(requests.RequestException):
+    """A shard answered with a body that is not k scores and ids per query"""
+
+class ShardClient:
+    """Keep-alive HTTP client for one ShardServer"""
+    
+    def __init__(self, url: str, timeout: float = 0.5):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        # requests.Session is not thread-safe; one per calling thread
+        self._local = threading.local()
+    
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+    
+    def search(self, queries: np.ndarray, k: int,
+               deadline: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the shard; ``deadline`` (time.monotonic()) bounds the whole call
+        
+        requests' timeout only bounds each socket read, so with a deadline
+        the reply is streamed and abandoned once the deadline passes.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise requests.Timeout(f"Deadline passed before {self.url} was called")
+        response = self._session().post(
+            f"{self.url}/search", params={'k': k, 'd': queries.shape[1]},
+            data=queries.tobytes(), timeout=timeout, stream=deadline is not None)
+        if deadline is None:
+            response.raise_for_status()
+            body = response.content
+        else:
+            with response:
+                response.raise_for_status()
+                parts = []
+                for part in response.iter_content(chunk_size=1 << 16):
+                    parts.append(part)
+                    if time.monotonic() > deadline:
+                        raise requests.Timeout(f"{self.url} did not finish replying before the deadline")
+                body = b''.join(parts)
+        # float32 score + int64 id per result
+        if len(body) != len(queries) * k * 12:
+            raise ShardReplyError(f"{self.url} replied with {len(body)} bytes, "
+                                  f"expected {len(queries) * k * 12}")
+        split = len(queries) * k * 4
+        scores = np.frombuffer(body[:split], dtype=np.float32).reshape(len(queries), k)
+        ids = np.frombuffer(body[split:], dtype=np.int64).reshape(len(queries), k)
+        return scores, ids
+    
+    def health(self) -> Dict[str, Any]:
+        response = self._session().get(f"{self.url}/health", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+def merge_topk(shard_results: List[Tuple[np.ndarray, np.ndarray]], num_queries: int,
+               k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """K-way heap merge of per-shard top-k lists (each sorted by descending score)"""
+    scores = np.full((num_queries, k), -np.inf, dtype=np.float32)
+    ids = np.full((num_queries, k), -1, dtype=np.int64)
+    for row in range(num_queries):
+        streams = [zip(shard_scores[row].tolist(), shard_ids[row].tolist())
+                   for shard_scores, shard_ids in shard_results]
+        merged = heapq.merge(*streams, key=lambda pair: -pair[0])
+        top = [pair for pair in itertools.islice((p for p in merged if p[1] >= 0), k)]
+        if top:
+            scores[row, :len(top)] = [score for score, _ in top]
+            ids[row, :len(top)] = [chunk_id for _, chunk_id in top]
+    return scores, ids
+
+class ShardedIndex:
+    """Fan-out/merge over remote shards with FAISS's ``search`` signature
+    
+    Every search waits at most ``timeout`` seconds for all shards. Shards
+    that are slow or failing are left out of that search's merge (the
+    answer is then approximate and counted as partial) rather than
+    stalling the request; a search fails only if no shard answers.
+    
+    The timeout is a total deadline for each shard call too, so a stalled
+    shard frees its fan-out thread when the search gives up on it. The
+    pool has one thread per shard for each of ``concurrency`` searches in
+    flight.
+    """
+    
+    def __init__(self, shard_urls: List[str], timeout: float = 0.5, concurrency: int = 8):
+        if not shard_urls:
+            raise ValueError("ShardedIndex needs at least one shard URL")
+        self.timeout = timeout
+        self.clients = [ShardClient(url, timeout) for url in shard_urls]
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency) * len(self.clients),
+                                            thread_name_prefix='shard-fanout')
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.partial_searches = 0
+        self.shard_timeouts = [0] * len(self.clients)
+        self.shard_errors = [0] * len(self.clients)
+        
+        self.shard_info = self._describe_shards()
+        self.ntotal = sum(info.get('count', 0) for info in self.shard_info if info)
+        self.d = next((info['dim'] for info in self.shard_info if info), None)
+    
+    def _describe_shards(self) -> List[Optional[Dict[str, Any]]]:
+        """Fetch every shard's health; warn about missing or inconsistent shards"""
+        infos: List[Optional[Dict[str, Any]]] = []
+        for client in self.clients:
+            try:
+                infos.append(client.health())
+            except requests.RequestException as e:
+                print(f"⚠️  Retrieval shard {client.url} unreachable: {e}")
+                infos.append(None)
+        
+        reachable = [info for info in infos if info]
+        if not reachable:
+            raise RuntimeError("No retrieval shard is reachable")
+        expected = reachable[0].get('num_shards', len(self.clients))
+        if expected != len(self.clients):
+            print(f"⚠️  Shards report num_shards={expected} but {len(self.clients)} URLs were given")
+        versions = {info.get('index_version') for info in reachable}
+        if len(versions) > 1:
+            print(f"⚠️  Retrieval shards serve different index versions: {sorted(map(str, versions))}")
+        return infos
+    
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        deadline = time.monotonic() + self.timeout
+        futures = {self._executor.submit(client.search, queries, k, deadline): i
+                   for i, client in enumerate(self.clients)}
+        done, not_done = wait(futures, timeout=self.timeout)
+        for future in not_done:
+            # Not started yet: drop it; running calls stop at the deadline
+            future.cancel()
+        
+        results = []
+        with self._lock:
+            self.searches += 1
+            for future in not_done:
+                self.shard_timeouts[futures[future]] += 1
+            for future in done:
+                try:
+                    results.append(future.result())
+                except Exception:
+                    self.shard_errors[futures[future]] += 1
+            if len(results) < len(self.clients):
+                self.partial_searches += 1
+        
+        if not results:
+            raise RuntimeError(f"No retrieval shard answered within {self.timeout}s")
+        return merge_topk(results, len(queries), k)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'num_shards': len(self.clients),
+            'ntotal': self.ntotal,
+            'timeout': self.timeout,
+            'searches': self.searches,
+            'partial_searches': self.partial_searches,
+            'shards': [
+                {'url': client.url, 'timeouts': self.shard_timeouts[i], 'errors': self.shard_errors[i]}
+                for i, client in enumerate(self.clients)
+            ]
+        }
+    
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+def parse_shard_urls(value: str) -> List[str]:
+    """Comma-separated host:port or URL list -> URLs"""
+    urls = []
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            urls.append(item if '://' in item else f"http://{item}")
+    return urls
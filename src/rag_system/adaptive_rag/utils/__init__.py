@@ -2,9 +2,29 @@
 Utility components for adaptive RAG
 """
 
-from .telemetry import log_router_decision, setup_telemetry
+from .telemetry import (
+    log_router_decision, setup_telemetry, get_telemetry_stats, RouterDecision,
+    TelemetrySink, get_telemetry_sink, get_telemetry_sink_stats, close_telemetry_sinks
+)
+from .telemetry_stats import LatencyHistogram, TelemetryAggregator
+from .metrics import MetricsRegistry, RAGMetrics
+from .tracing import Span, Tracer, get_tracer, current_span
 
 __all__ = [
     "log_router_decision",
-    "setup_telemetry"
+    "setup_telemetry",
+    "get_telemetry_stats",
+    "RouterDecision",
+    "TelemetrySink",
+    "get_telemetry_sink",
+    "get_telemetry_sink_stats",
+    "close_telemetry_sinks",
+    "LatencyHistogram",
+    "TelemetryAggregator",
+    "MetricsRegistry",
+    "RAGMetrics",
+    "Span",
+    "Tracer",
+    "get_tracer",
+    "current_span"
 ]
@@ -0,0 +1,271 @@
+"""
+Prometheus-style metrics for adaptive RAG
+"""
+
+import time
+import bisect
+import threading
+from typing import Dict, Any, List, Callable, Optional, Sequence, Tuple
+
+# Seconds; spans sub-millisecond cache hits to multi-minute generations
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0
+)
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str],
+                   extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in pairs)
+    return '{' + body + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class _Metric:
+    """Shared bookkeeping for labelled metrics"""
+    kind = ''
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+    
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+class Gauge(_Metric):
+    """Gauge set directly or computed by a callback at scrape time
+    
+    Callbacks return ``{labelvalues_tuple: value}`` and cost nothing on the
+    request path.
+    """
+    kind = 'gauge'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+    
+    def set(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+    
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+    
+    def dec(self, amount: float = 1.0, *labelvalues: str) -> None:
+        self.inc(-amount, *labelvalues)
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self.callback is not None:
+            try:
+                values.update(self.callback())
+            except Exception:
+                # A failing callback must not break the whole scrape
+                pass
+        lines = self._header()
+        for labelvalues, value in sorted(values.items()):
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram in the Prometheus exposition format"""
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+    
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            snapshot = [(labelvalues, list(series[0]), series[1], series[2])
+                        for labelvalues, series in sorted(self._series.items())]
+        for labelvalues, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Named metrics rendered together for a /metrics scrape"""
+    
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+    
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None) -> Gauge:
+        gauge = self._register(Gauge(name, documentation, labelnames, callback))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+    
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+class RAGMetrics:
+    """Instrumentation hooks for the RAG request pipeline
+    
+    Request handlers call these hooks with timings they already measure,
+    so instrumentation is a few dict/list updates per request. Cache hit
+    ratios and queue depths are read from their owners only when scraped.
+    """
+    
+    STAGES = ('analyze', 'cache_lookup', 'embed', 'search', 'widen', 'compose', 'queue_wait', 'prefill', 'decode', 'generate')
+    
+    def __init__(self, registry: Optional[MetricsRegistry] = None, enabled: bool = True):
+        self.registry = registry or MetricsRegistry()
+        self.enabled = enabled
+        self.stage_latency = self.registry.histogram(
+            'rag_stage_latency_seconds', 'Latency of each pipeline stage', ('route', 'stage'))
+        self.request_latency = self.registry.histogram(
+            'rag_request_latency_seconds', 'End-to-end request latency', ('endpoint',))
+        self.requests = self.registry.counter(
+            'rag_requests_total', 'Requests served', ('endpoint', 'status'))
+        self.tokens = self.registry.counter(
+            'rag_generated_tokens_total', 'Tokens generated', ('route',))
+        self.tokens_per_second = self.registry.histogram(
+            'rag_generation_tokens_per_second', 'Decode throughput per request', ('route',),
+            buckets=(1, 2.5, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400))
+        self.in_flight = self.registry.gauge(
+            'rag_requests_in_flight', 'Requests currently being processed')
+        self.in_flight.set(0)
+    
+    def request_started(self) -> float:
+        """Mark a request in flight; returns the start time for request_finished"""
+        if self.enabled:
+            self.in_flight.inc()
+        return time.perf_counter()
+    
+    def request_finished(self, endpoint: str, start: float, status: str) -> None:
+        if not self.enabled:
+            return
+        self.in_flight.dec()
+        self.requests.inc(1.0, endpoint, status)
+        self.request_latency.observe(time.perf_counter() - start, endpoint)
+    
+    def observe_stage(self, route: str, stage: str, seconds: Optional[float]) -> None:
+        if self.enabled and seconds is not None:
+            self.stage_latency.observe(seconds, route, stage)
+    
+    def observe_retrieval(self, route: str, timings: Dict[str, float], cache_hit: bool) -> None:
+        """Record a RetrievalResult's stage timings (cache hits only time the lookup)"""
+        if not self.enabled:
+            return
+        if timings.get('cache_lookup') is not None:
+            self.stage_latency.observe(timings['cache_lookup'], route, 'cache_lookup')
+        if cache_hit:
+            return
+        self.stage_latency.observe(timings.get('encode', 0.0), route, 'embed')
+        self.stage_latency.observe(timings.get('search', 0.0), route, 'search')
+        if timings.get('widen'):
+            self.stage_latency.observe(timings['widen'], route, 'widen')
+        self.stage_latency.observe(timings.get('compose', 0.0), route, 'compose')
+    
+    def observe_generation(self, route: str, result: Any) -> None:
+        """Record prefill/decode split and throughput from a GenerationResult"""
+        if not self.enabled:
+            return
+        self.stage_latency.observe(result.generation_time, route, 'generate')
+        if result.prefill_time is not None:
+            self.stage_latency.observe(result.prefill_time, route, 'prefill')
+        if result.decode_time is not None:
+            self.stage_latency.observe(result.decode_time, route, 'decode')
+        self.tokens.inc(result.tokens_generated, route)
+        if result.tokens_per_second:
+            self.tokens_per_second.observe(result.tokens_per_second, route)
+    
+    def register_cache_stats(self, get_cache_stats: Callable[[], Dict[str, Optional[Dict[str, Any]]]]) -> None:
+        """Export hit ratio, size and bytes for every cache from its get_stats()"""
+        def values(field):
+            def collect():
+                return {(name,): stats.get(field) for name, stats in get_cache_stats().items() if stats}
+            return collect
+        self.registry.gauge('rag_cache_hit_ratio', 'Cache hit ratio since start', ('cache',),
+                            callback=values('hit_rate'))
+        self.registry.gauge('rag_cache_entries', 'Entries held by each cache', ('cache',),
+                            callback=values('size'))
+        self.registry.gauge('rag_cache_bytes', 'Approximate bytes held by each cache', ('cache',),
+                            callback=values('bytes'))
+    
+    def register_queue_depths(self, get_depths: Callable[[], Dict[str, float]]) -> None:
+        """Export queue depths (telemetry writer, warm-up backlog, ...) at scrape time"""
+        self.registry.gauge('rag_queue_depth', 'Items waiting in internal queues', ('queue',),
+                            callback=lambda: {(name,): depth for name, depth in get_depths().items()})
+    
+    def render(self) -> str:
+        return self.registry.render()
@@ -2,11 +2,149 @@
 Telemetry logging for adaptive RAG system
 """
 
+import os
 import json
 import time
-from typing import Dict, Any, Optional
+import queue
+import atexit
+import threading
+from typing import Dict, Any, List, Optional
 from datetime import datetime
+from dataclasses import dataclass
 from ..config.adaptive_config import get_adaptive_config
+from .telemetry_stats import TelemetryAggregator
+
+@dataclass
+class RouterDecision:
+    """Routing outcome recorded by log_router_decision"""
+    use_rag: bool
+    reason: str
+    confidence: float
+    profile: Optional[str] = None
+
+# Compact encoder shared by all sinks; numpy scalars and other odd values fall back to str
+_encoder = json.JSONEncoder(separators=(',', ':'), default=str)
+
+class TelemetrySink:
+    """Buffered, non-blocking JSONL writer
+    
+    Request handlers only enqueue event dicts. A background thread encodes
+    them and appends them in batches, flushing when ``batch_size`` events
+    are pending or ``flush_interval`` seconds have passed. When the queue
+    is full new events are dropped and counted rather than waiting on I/O.
+    """
+    
+    def __init__(self, path: str, max_queue: int = 10000, batch_size: int = 256,
+                 flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self.emitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+        self._thread.start()
+    
+    def emit(self, event: Dict[str, Any]) -> bool:
+        """Queue an event; returns False if it was dropped"""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.emitted += 1
+        return True
+    
+    def _run(self) -> None:
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._write(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+                if self._stop.is_set() and self._queue.empty():
+                    return
+    
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        lines = []
+        for event in batch:
+            try:
+                lines.append(_encoder.encode(event))
+            except (TypeError, ValueError):
+                self.errors += 1
+        try:
+            with open(self.path, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+            self.written += len(lines)
+            self.batches += 1
+        except Exception:
+            # Telemetry must never take the server down
+            self.errors += len(lines)
+    
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush queued events and stop the writer"""
+        self._stop.set()
+        self.flush_interval = 0.0
+        self._thread.join(timeout)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'queue_depth': self._queue.qsize(),
+            'max_queue': self._queue.maxsize,
+            'emitted': self.emitted,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'errors': self.errors
+        }
+
+_sinks: Dict[str, TelemetrySink] = {}
+_sinks_lock = threading.Lock()
+
+def get_telemetry_sink(path: Optional[str] = None) -> TelemetrySink:
+    """Shared sink for a log file, created on first use"""
+    config = get_adaptive_config()
+    path = os.path.abspath(path or config.telemetry_log_file)
+    sink = _sinks.get(path)
+    if sink is None:
+        with _sinks_lock:
+            sink = _sinks.get(path)
+            if sink is None:
+                sink = TelemetrySink(path,
+                                     max_queue=config.telemetry_queue_size,
+                                     batch_size=config.telemetry_batch_size,
+                                     flush_interval=config.telemetry_flush_interval)
+                _sinks[path] = sink
+    return sink
+
+def close_telemetry_sinks() -> None:
+    """Flush and stop every sink (server shutdown)"""
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+        _sinks.clear()
+    for sink in sinks:
+        sink.close()
+
+def get_telemetry_sink_stats() -> List[Dict[str, Any]]:
+    """Stats for every open sink (queue depth, drops, ...)"""
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    return [sink.get_stats() for sink in sinks]
+
+atexit.register(close_telemetry_sinks)
 
 def log_router_decision(query: str, decision: Any, performance_metrics: Dict[str, Any]) -> None:
     """Log router decision for analysis and optimization"""
@@ -32,12 +170,7 @@ def log_router_decision(query: str, decision: Any, performance_metrics: Dict[str
         }
     }
     
-    try:
-        with open(config.telemetry_log_file, 'a') as f:
-            f.write(json.dumps(log_entry) + '\n')
-    except Exception as e:
-        # Silently fail if logging fails
-        pass
+    get_telemetry_sink(config.telemetry_log_file).emit(log_entry)
 
 def setup_telemetry(log_file: Optional[str] = None) -> None:
     """Setup telemetry logging"""
@@ -55,47 +188,19 @@ def setup_telemetry(log_file: Optional[str] = None) -> None:
             # Disable telemetry if we can't write to log file
             config.enable_telemetry = False
 
+_aggregators: Dict[str, TelemetryAggregator] = {}
+
 def get_telemetry_stats(log_file: Optional[str] = None) -> Dict[str, Any]:
-    """Get statistics from telemetry logs"""
+    """Get statistics from telemetry logs
+    
+    Backed by a per-file TelemetryAggregator, so repeated calls only parse
+    lines appended since the previous call.
+    """
     config = get_adaptive_config()
-    log_file = log_file or config.telemetry_log_file
+    path = os.path.abspath(log_file or config.telemetry_log_file)
     
-    try:
-        with open(log_file, 'r') as f:
-            lines = f.readlines()
-        
-        total_queries = len(lines)
-        rag_queries = 0
-        direct_queries = 0
-        reasons = {}
-        
-        for line in lines:
-            try:
-                entry = json.loads(line.strip())
-                if entry['decision']['use_rag']:
-                    rag_queries += 1
-                else:
-                    direct_queries += 1
-                
-                reason = entry['decision']['reason']
-                reasons[reason] = reasons.get(reason, 0) + 1
-            except:
-                continue
-        
-        return {
-            'total_queries': total_queries,
-            'rag_queries': rag_queries,
-            'direct_queries': direct_queries,
-            'rag_percentage': (rag_queries / total_queries * 100) if total_queries > 0 else 0,
-            'decision_reasons': reasons,
-            'avg_response_time': 0.0  # Could calculate from performance metrics
-        }
-    except Exception:
-        return {
-            'total_queries': 0,
-            'rag_queries': 0,
-            'direct_queries': 0,
-            'rag_percentage': 0.0,
-            'decision_reasons': {},
-            'avg_response_time': 0.0
-        }
+    with _sinks_lock:
+        aggregator = _aggregators.get(path)
+        if aggregator is None:
+            aggregator = _aggregators[path] = TelemetryAggregator([path])
+    return aggregator.get_stats()
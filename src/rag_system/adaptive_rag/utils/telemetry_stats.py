@@ -0,0 +1,288 @@
+"""
+Streaming telemetry analytics for adaptive RAG
+"""
+
+import os
+import json
+import math
+import threading
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+
+class LatencyHistogram:
+    """Fixed-size log-bucketed latency histogram (HDR-style)
+    
+    Bucket edges grow geometrically from ``min_value`` to ``max_value``,
+    so every percentile is reported within ``growth`` relative error and
+    memory stays constant however many samples are recorded.
+    """
+    
+    def __init__(self, min_value: float = 1e-4, max_value: float = 600.0, growth: float = 1.05):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        num_buckets = int(math.ceil(math.log(max_value / min_value) / self._log_growth)) + 2
+        self.counts = np.zeros(num_buckets, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+    
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        bucket = int(math.log(value / self.min_value) / self._log_growth) + 1
+        return min(bucket, len(self.counts) - 1)
+    
+    def _bucket_value(self, bucket: int) -> float:
+        """Upper edge of a bucket"""
+        return self.min_value * self.growth ** bucket
+    
+    def record(self, value: float) -> None:
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+    
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(q / 100.0 * self.count)))
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(max(self._bucket_value(bucket), self.min), self.max)
+    
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+    
+    def to_state(self) -> Dict[str, Any]:
+        nonzero = np.nonzero(self.counts)[0]
+        return {
+            'buckets': nonzero.tolist(),
+            'counts': self.counts[nonzero].tolist(),
+            'count': self.count,
+            'total': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max
+        }
+    
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'LatencyHistogram':
+        histogram = cls()
+        histogram.counts[state['buckets']] = state['counts']
+        histogram.count = state['count']
+        histogram.total = state['total']
+        histogram.min = state['min'] if state['min'] is not None else math.inf
+        histogram.max = state['max']
+        return histogram
+
+class TelemetryAggregator:
+    """Incrementally aggregates JSONL query logs
+    
+    Each ``refresh`` reads only the bytes appended since the saved offset
+    of every log, so cost is proportional to new traffic rather than log
+    size. Understands both the router telemetry log and the universal
+    server's query log. Distinct reasons/profiles are capped so state stays
+    bounded; overflow is counted under 'other'.
+    """
+    
+    READ_BLOCK = 1024 * 1024
+    
+    def __init__(self, log_files: List[str], state_file: Optional[str] = None,
+                 max_keys: int = 64):
+        self.log_files = [os.path.abspath(path) for path in log_files]
+        self.state_file = state_file
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._reset()
+        if state_file:
+            self._load_state()
+    
+    def _reset(self) -> None:
+        # path -> (inode, byte offset of the next unread line)
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+        self.total_queries = 0
+        self.rag_queries = 0
+        self.direct_queries = 0
+        self.parse_errors = 0
+        self.reasons: Dict[str, int] = {}
+        self.routes: Dict[str, int] = {}
+        self.profiles: Dict[str, int] = {}
+        self.route_profiles: Dict[str, int] = {}
+        self.latency = LatencyHistogram()
+        self.latency_by_route: Dict[str, LatencyHistogram] = {}
+        self.latency_by_profile: Dict[str, LatencyHistogram] = {}
+    
+    def _bounded_key(self, table: Dict[str, Any], key: str) -> str:
+        return key if key in table or len(table) < self.max_keys else 'other'
+    
+    def _count(self, table: Dict[str, int], key: str) -> None:
+        key = self._bounded_key(table, key)
+        table[key] = table.get(key, 0) + 1
+    
+    def _histogram(self, table: Dict[str, LatencyHistogram], key: str) -> LatencyHistogram:
+        key = self._bounded_key(table, key)
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = LatencyHistogram()
+        return histogram
+    
+    def _add_entry(self, entry: Dict[str, Any]) -> None:
+        decision = entry.get('decision')
+        if decision is not None:
+            # Router telemetry log
+            performance = entry.get('performance') or {}
+            use_rag = bool(decision.get('use_rag'))
+            route = 'rag' if use_rag else 'direct'
+            reason = str(decision.get('reason', 'unknown'))
+            profile = decision.get('profile') or performance.get('profile_used')
+            latency = performance.get('total_time')
+        else:
+            # Universal server query log
+            route = str(entry.get('recommendation', 'unknown'))
+            use_rag = entry.get('used_rag', route == 'rag')
+            reason = route
+            profile = entry.get('profile')
+            latency = entry.get('total_time')
+        profile = str(profile) if use_rag and profile else 'none'
+        
+        self.total_queries += 1
+        if use_rag:
+            self.rag_queries += 1
+        else:
+            self.direct_queries += 1
+        self._count(self.reasons, reason)
+        self._count(self.routes, route)
+        self._count(self.profiles, profile)
+        self._count(self.route_profiles, f"{route}/{profile}")
+        
+        if isinstance(latency, (int, float)):
+            self.latency.record(latency)
+            self._histogram(self.latency_by_route, route).record(latency)
+            self._histogram(self.latency_by_profile, profile).record(latency)
+    
+    def _consume(self, path: str) -> bool:
+        """Read new complete lines from one log; returns True if anything was read"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        
+        inode, offset = self.offsets.get(path, (stat.st_ino, 0))
+        if inode != stat.st_ino or stat.st_size < offset:
+            # Rotated or truncated: start over on the new file, keep the totals
+            offset = 0
+        if stat.st_size == offset:
+            self.offsets[path] = (stat.st_ino, offset)
+            return False
+        
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            pending = b''
+            while True:
+                block = f.read(self.READ_BLOCK)
+                if not block:
+                    break
+                lines = (pending + block).split(b'\n')
+                # The last piece may be a line the writer has not finished yet
+                pending = lines.pop()
+                for line in lines:
+                    offset += len(line) + 1
+                    if not line.strip():
+                        continue
+                    try:
+                        self._add_entry(json.loads(line))
+                    except (ValueError, AttributeError, TypeError):
+                        self.parse_errors += 1
+        
+        self.offsets[path] = (stat.st_ino, offset)
+        return True
+    
+    def refresh(self) -> None:
+        """Fold newly appended log lines into the running state"""
+        with self._lock:
+            changed = False
+            for path in self.log_files:
+                changed = self._consume(path) or changed
+            if changed and self.state_file:
+                self._save_state()
+    
+    def _save_state(self) -> None:
+        state = {
+            'offsets': self.offsets,
+            'total_queries': self.total_queries,
+            'rag_queries': self.rag_queries,
+            'direct_queries': self.direct_queries,
+            'parse_errors': self.parse_errors,
+            'reasons': self.reasons,
+            'routes': self.routes,
+            'profiles': self.profiles,
+            'route_profiles': self.route_profiles,
+            'latency': self.latency.to_state(),
+            'latency_by_route': {k: h.to_state() for k, h in self.latency_by_route.items()},
+            'latency_by_profile': {k: h.to_state() for k, h in self.latency_by_profile.items()}
+        }
+        tmp_file = f"{self.state_file}.tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_file, self.state_file)
+        except OSError:
+            pass
+    
+    def _load_state(self) -> None:
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            self.offsets = {path: tuple(value) for path, value in state['offsets'].items()}
+            self.total_queries = state['total_queries']
+            self.rag_queries = state['rag_queries']
+            self.direct_queries = state['direct_queries']
+            self.parse_errors = state['parse_errors']
+            self.reasons = state['reasons']
+            self.routes = state['routes']
+            self.profiles = state['profiles']
+            self.route_profiles = state['route_profiles']
+            self.latency = LatencyHistogram.from_state(state['latency'])
+            self.latency_by_route = {k: LatencyHistogram.from_state(s)
+                                     for k, s in state['latency_by_route'].items()}
+            self.latency_by_profile = {k: LatencyHistogram.from_state(s)
+                                       for k, s in state['latency_by_profile'].items()}
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            # Missing or stale state: rebuild from the start of the logs
+            self._reset()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Refresh, then report counters, routing breakdowns and latency percentiles"""
+        self.refresh()
+        with self._lock:
+            total_queries = self.total_queries
+            return {
+                'total_queries': total_queries,
+                'rag_queries': self.rag_queries,
+                'direct_queries': self.direct_queries,
+                'rag_percentage': (self.rag_queries / total_queries * 100) if total_queries > 0 else 0,
+                'decision_reasons': dict(self.reasons),
+                'avg_response_time': self.latency.summary()['mean'],
+                'routing': {
+                    'by_route': dict(self.routes),
+                    'by_profile': dict(self.profiles),
+                    'by_route_profile': dict(self.route_profiles)
+                },
+                'latency': {
+                    'all': self.latency.summary(),
+                    'by_route': {k: h.summary() for k, h in self.latency_by_route.items()},
+                    'by_profile': {k: h.summary() for k, h in self.latency_by_profile.items()}
+                },
+                'parse_errors': self.parse_errors,
+                'log_offsets': {path: offset for path, (_, offset) in self.offsets.items()}
+            }
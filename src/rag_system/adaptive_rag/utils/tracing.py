@@ -0,0 +1,215 @@
+"""
+Request tracing for adaptive RAG
+"""
+
+import os
+import io
+import time
+import random
+import pstats
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from ..config.adaptive_config import get_adaptive_config
+from .telemetry import get_telemetry_sink
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('adaptive_rag_span', default=None)
+_current_profile: contextvars.ContextVar = contextvars.ContextVar('adaptive_rag_profile', default=None)
+
+class _TraceProfile:
+    """The profiler of one sampled trace, enabled only inside its synchronous stages"""
+    __slots__ = ('profiler', 'active', 'used')
+    
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.active = False
+        self.used = False
+
+class Span:
+    """One timed stage of a traced request"""
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns',
+                 'attributes', 'status')
+    
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.status = 'ok'
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+    
+    def duration(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """OTLP-style span record"""
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'durationMs': self.duration() * 1000,
+            'status': self.status,
+            'attributes': self.attributes
+        }
+
+class Tracer:
+    """Samples requests, times their stages and exports finished spans
+    
+    Spans are appended to a JSONL trace file through the buffered telemetry
+    sink, so exporting never blocks a request. Outside a sampled trace
+    ``span`` costs one context-variable lookup. Every ``profile_every``-th
+    sampled trace also gets a cProfile profile of its hottest stacks.
+    
+    The profiler only runs inside spans opened with ``profiled=True``,
+    which must be synchronous stages. A profiler enabled across an
+    ``await`` would also record every other request's coroutine that the
+    event loop ran meanwhile.
+    """
+    
+    def __init__(self, trace_file: Optional[str] = None, sample_rate: float = 1.0,
+                 profile_every: int = 0, profile_dir: str = 'profiles'):
+        self.trace_file = trace_file
+        self.sample_rate = sample_rate
+        self.profile_every = profile_every
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._sampled = 0
+        self.traces = 0
+        self.profiles = 0
+    
+    def _export(self, span: Span) -> None:
+        if self.trace_file:
+            get_telemetry_sink(self.trace_file).emit(span.to_dict())
+    
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Root span for a request; yields None when the request is not sampled"""
+        if not self.trace_file or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            token = _current_span.set(None)
+            try:
+                yield None
+            finally:
+                _current_span.reset(token)
+            return
+        
+        with self._lock:
+            self._sampled += 1
+            self.traces += 1
+            profile = self.profile_every > 0 and self._sampled % self.profile_every == 0
+        
+        root = Span(name, f"{random.getrandbits(128):032x}", attributes=attributes)
+        token = _current_span.set(root)
+        trace_profile = _TraceProfile() if profile else None
+        profile_token = _current_profile.set(trace_profile)
+        try:
+            yield root
+        except BaseException as e:
+            root.status = 'error'
+            root.set_attribute('error', repr(e))
+            raise
+        finally:
+            if trace_profile is not None and trace_profile.used:
+                root.set_attribute('profile', self._dump_profile(trace_profile.profiler, root))
+            root.end_ns = time.time_ns()
+            _current_profile.reset(profile_token)
+            _current_span.reset(token)
+            self._export(root)
+    
+    @contextmanager
+    def span(self, name: str, profiled: bool = False, **attributes):
+        """Child span of the current trace; a no-op outside a sampled trace
+        
+        ``profiled`` runs the stage under the trace's profiler, if it has one.
+        Only pass it for stages that do not await.
+        """
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+        token = _current_span.set(span)
+        trace_profile = _current_profile.get() if profiled else None
+        if trace_profile is not None:
+            if trace_profile.active:
+                # Already inside a profiled stage of this trace
+                trace_profile = None
+            else:
+                try:
+                    trace_profile.profiler.enable()
+                    trace_profile.active = trace_profile.used = True
+                except ValueError:
+                    # Another profiler is already running on this thread
+                    trace_profile = None
+        try:
+            yield span
+        except BaseException as e:
+            span.status = 'error'
+            span.set_attribute('error', repr(e))
+            raise
+        finally:
+            if trace_profile is not None:
+                trace_profile.profiler.disable()
+                trace_profile.active = False
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            self._export(span)
+    
+    def _dump_profile(self, profiler: cProfile.Profile, root: Span, top: int = 30) -> Optional[str]:
+        """Write <trace_id>.prof plus a text summary of the hottest stacks"""
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            base = os.path.join(self.profile_dir, root.trace_id)
+            profiler.dump_stats(f"{base}.prof")
+            
+            summary = io.StringIO()
+            stats = pstats.Stats(profiler, stream=summary)
+            stats.sort_stats('cumulative').print_stats(top)
+            with open(f"{base}.txt", 'w') as f:
+                f.write(f"# {root.name} trace {root.trace_id}\n")
+                f.write(summary.getvalue())
+            self.profiles += 1
+            return f"{base}.prof"
+        except OSError:
+            return None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'trace_file': self.trace_file,
+            'sample_rate': self.sample_rate,
+            'profile_every': self.profile_every,
+            'traces': self.traces,
+            'profiles': self.profiles
+        }
+
+def current_span() -> Optional[Span]:
+    """Innermost open span of the current request, if it is being traced"""
+    return _current_span.get()
+
+_tracer: Optional[Tracer] = None
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer configured from AdaptiveConfig"""
+    global _tracer
+    if _tracer is None:
+        config = get_adaptive_config()
+        _tracer = Tracer(
+            trace_file=config.trace_file,
+            sample_rate=config.trace_sample_rate,
+            profile_every=config.profile_every,
+            profile_dir=config.profile_dir
+        )
+    return _tracer
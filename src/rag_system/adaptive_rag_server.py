@@ -6,9 +6,11 @@ Uses query complexity analysis for routing decisions
 import os
 import sys
 import time
-import torch
+import asyncio
+import functools
+import contextvars
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel
 from typing import Dict, Any, Optional, List
 
@@ -16,11 +18,22 @@ from typing import Dict, Any, Optional, List
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from adaptive_rag.core.query_analyzer import QueryAnalyzer
-from adaptive_rag.core.model_interface import create_model_interface, GenerationConfig
+from adaptive_rag.core.model_interface import (
+    create_model_interface, load_model, GenerationConfig, MockModelInterface
+)
+from adaptive_rag.core.generation_service import (
+    GenerationQueue, GenerationOverloadedError, RemoteModelInterface
+)
 from adaptive_rag.config.adaptive_config import get_adaptive_config
 from adaptive_rag.retrieval.dynamic_search import DynamicRetriever
 from adaptive_rag.config.profiles_config import select_profile_for_query
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from adaptive_rag.caching.warmup import CacheWarmer, collect_warmup_queries, DEFAULT_QUESTION_BANK
+from adaptive_rag.utils.telemetry import (
+    log_router_decision, RouterDecision, close_telemetry_sinks, get_telemetry_sink_stats
+)
+from adaptive_rag.utils.metrics import RAGMetrics
+from adaptive_rag.utils.tracing import get_tracer, current_span
+from adaptive_rag.utils.telemetry_stats import TelemetryAggregator
 
 # Request/Response models
 class QueryRequest(BaseModel):
@@ -40,6 +53,8 @@ class HealthResponse(BaseModel):
     model_type: str
     router_type: str
     timestamp: float
+    warmup: Optional[Dict[str, Any]] = None
+    generation: Optional[Dict[str, Any]] = None
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -51,13 +66,17 @@ app = FastAPI(
 # Global variables
 query_analyzer = None
 model_interface = None
+generation_queue = None
 retriever = None
 config = None
+cache_warmer = None
+telemetry_stats = None
+metrics = RAGMetrics()
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize the system on startup"""
-    global query_analyzer, model_interface, retriever, config
+    global query_analyzer, model_interface, generation_queue, retriever, config, telemetry_stats
     
     print("🚀 Starting Simplified Adaptive RAG Server...")
     
@@ -66,11 +85,29 @@ async def startup_event():
         config = get_adaptive_config()
         print(f"✅ Configuration loaded")
         
-        # Load model
-        model, tokenizer = load_model()
+        # Incremental aggregation of this server's telemetry log behind /stats
+        # (rag_queries.log belongs to universal_rag_api.py)
+        telemetry_stats = TelemetryAggregator(
+            [config.telemetry_log_file],
+            state_file=config.telemetry_stats_state_file
+        )
         
-        # Create model interface
-        model_interface = create_model_interface(model, tokenizer, model_type="auto")
+        if config.generation_url:
+            # Model runs in generation_server.py; this process only routes and retrieves
+            model_interface = RemoteModelInterface(config.generation_url, config.generation_timeout)
+        else:
+            if config.mock_model:
+                # Simulated generation latency, no weights (load tests on CPU boxes)
+                model_interface = MockModelInterface(config.mock_prefill_latency,
+                                                     config.mock_per_token_latency)
+            else:
+                # Load model
+                model, tokenizer = load_model(config.model_path)
+                
+                # Create model interface
+                model_interface = create_model_interface(model, tokenizer, model_type="auto")
+            # Same admission control as the generation server, in-process
+            generation_queue = GenerationQueue(model_interface, max_size=config.generation_queue_size)
         print(f"✅ Model interface created: {model_interface.get_model_info()}")
         
         # Create query analyzer
@@ -81,52 +118,95 @@ async def startup_event():
         retriever = DynamicRetriever()
         print(f"✅ Retriever initialized")
         
-        print("🎉 Simplified Adaptive RAG Server ready!")
+        # Warm retrieval caches in the background; /health reports progress
+        start_cache_warmup()
+        
+        # Scrape-time gauges for caches and queues
+        setup_metrics()
         
+        print("🎉 Simplified Adaptive RAG Server ready!")
+    
     except Exception as e:
         print(f"❌ Failed to initialize server: {e}")
         raise
 
-def load_model():
-    """Load the model and tokenizer"""
-    try:
-        # Load Qwen model
-        model_path = "/datasets/ai/qwen/hub/models--Qwen--Qwen2.5-Math-7B-Instruct/snapshots/ef9926d75ab1d54532f6a30dd5e760355eb9aa4d"
-        
-        print(f"Loading model from {model_path}...")
-        tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
-        model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            torch_dtype="auto",
-            device_map="auto",
-            trust_remote_code=True
-        )
-        
-        print("✅ Model loaded successfully")
-        return model, tokenizer
-        
-    except Exception as e:
-        print(f"❌ Failed to load model: {e}")
-        # Return a mock model for testing
-        return MockModel(), MockTokenizer()
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Finish queued generations and flush buffered telemetry before exit"""
+    if generation_queue is not None:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, generation_queue.drain, config.generation_drain_timeout)
+    close_telemetry_sinks()
 
-class MockModel:
-    """Mock model for testing"""
-    def generate(self, **kwargs):
-        return MockOutput()
+def setup_metrics():
+    """Attach cache and queue gauges to /metrics (read only when scraped)"""
+    metrics.enabled = config.enable_metrics
+    metrics.register_cache_stats(lambda: retriever.get_retrieval_stats()['caches'])
+    
+    def queue_depths():
+        depths = {
+            f"telemetry:{os.path.basename(stats['path'])}": stats['queue_depth']
+            for stats in get_telemetry_sink_stats()
+        }
+        if cache_warmer:
+            progress = cache_warmer.get_progress()
+            depths['warmup'] = progress['total'] - progress['completed']
+        if generation_queue is not None:
+            depths['generation'] = generation_queue.get_stats()['queue_depth']
+        return depths
+    
+    metrics.register_queue_depths(queue_depths)
 
-class MockTokenizer:
-    """Mock tokenizer for testing"""
-    def __call__(self, text, **kwargs):
-        return {"input_ids": [[1, 2, 3]], "attention_mask": [[1, 1, 1]]}
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """Metrics and (sampled) tracing for the query endpoint
+    
+    The root span is opened here; the endpoint runs in a task that inherits
+    it, so its stage spans nest under it.
+    """
+    endpoint = request.url.path
+    if endpoint != "/adaptive_rag":
+        return await call_next(request)
     
-    def decode(self, tokens, **kwargs):
-        return "This is a mock response for testing purposes."
+    start = metrics.request_started()
+    status = "500"
+    try:
+        with get_tracer().trace(endpoint) as root:
+            response = await call_next(request)
+            status = str(response.status_code)
+            if root is not None:
+                root.set_attribute("http.status_code", response.status_code)
+        return response
+    finally:
+        metrics.request_finished(endpoint, start, status)
 
-class MockOutput:
-    """Mock model output for testing"""
-    def __init__(self):
-        self.sequences = [[1, 2, 3, 4, 5]]
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, stage, cache and queue metrics"""
+    return Response(content=metrics.render(), media_type=metrics.registry.CONTENT_TYPE)
+
+def start_cache_warmup():
+    """Precompute retrieval results for the most frequent queries in the background"""
+    global cache_warmer
+    
+    if config.warmup_queries <= 0:
+        return
+    
+    def load_queries():
+        return collect_warmup_queries(
+            config.warmup_queries,
+            [config.telemetry_log_file, "rag_queries.log"],
+            config.warmup_question_bank or DEFAULT_QUESTION_BANK
+        )
+    
+    cache_warmer = CacheWarmer(batch_size=config.warmup_batch_size)
+    cache_warmer.start(
+        retriever,
+        load_queries,
+        lambda query: select_profile_for_query(query) or "general",
+        k=config.start_k
+    )
+    print(f"🔥 Cache warm-up started (up to {config.warmup_queries} queries)")
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -135,7 +215,9 @@ async def health_check():
         status="healthy",
         model_type=model_interface.get_model_info()["model_type"] if model_interface else "unknown",
         router_type="simplified_complexity",
-        timestamp=time.time()
+        timestamp=time.time(),
+        warmup=cache_warmer.get_progress() if cache_warmer else None,
+        generation=generation_queue.get_stats() if generation_queue else None
     )
 
 @app.post("/adaptive_rag", response_model=QueryResponse)
@@ -148,60 +230,130 @@ async def adaptive_rag_query(request: QueryRequest):
         start_time = time.time()
         
         # Analyze query complexity
-        complexity_analysis = query_analyzer.analyze_query(request.query, request.query_metadata)
+        tracer = get_tracer()
+        stage_start = time.perf_counter()
+        with tracer.span("analyze_query", profiled=True):
+            complexity_analysis = query_analyzer.analyze_query(request.query, request.query_metadata)
+        analyze_time = time.perf_counter() - stage_start
         
         # Make routing decision
         use_rag = complexity_analysis.recommendation == "rag"
+        route = "rag" if use_rag else "direct"
+        metrics.observe_stage(route, "analyze", analyze_time)
+        root = current_span()
+        if root is not None:
+            root.set_attribute("route", route)
         
+        profile = None
         if use_rag:
             # Execute RAG path
-            profile = select_profile_for_query(request.query, request.query_metadata)
-            retrieval_result = retriever.retrieve(
-                query=request.query,
-                profile=profile or "general",
-                k=config.retrieval_k,
-                query_metadata=request.query_metadata
-            )
+            profile = select_profile_for_query(request.query, request.query_metadata) or "general"
+            retrieval_result = await retrieve(request.query, profile)
+            metrics.observe_retrieval(route, retrieval_result.timings, retrieval_result.cache_hit)
             
-            # Generate with context
-            prompt = format_rag_prompt(request.query, retrieval_result['context_blocks'])
-            result = model_interface.generate(prompt, GenerationConfig(
-                max_new_tokens=config.model_max_tokens,
-                temperature=config.model_temperature
-            ))
+            # Serialize the composed context once for both prompt and response
+            context_blocks = retrieval_result.context_blocks
+            retrieval_metrics = retrieval_result.get_metrics()
             
-            answer = result.text
-            context_blocks = retrieval_result['context_blocks']
+            # Prompt with context
+            prompt = format_rag_prompt(request.query, context_blocks)
         else:
             # Execute direct path
             prompt = format_direct_prompt(request.query)
-            result = model_interface.generate(prompt, GenerationConfig(
+            context_blocks = []
+            retrieval_metrics = {}
+        
+        with tracer.span("generate", route=route) as span:
+            result = await generate(prompt, GenerationConfig(
                 max_new_tokens=config.model_max_tokens,
                 temperature=config.model_temperature
             ))
-            
-            answer = result.text
-            context_blocks = []
+            if span is not None:
+                span.set_attribute("tokens_generated", int(result.tokens_generated))
+                span.set_attribute("prefill_time", result.prefill_time)
+                span.set_attribute("decode_time", result.decode_time)
+        metrics.observe_generation(route, result)
+        queue_wait = result.model_metadata.get('queue_wait')
+        metrics.observe_stage(route, "queue_wait", queue_wait)
+        answer = result.text
         
         end_time = time.time()
         
+        performance_metrics = {
+            'total_time': end_time - start_time,
+            'used_rag': use_rag,
+            'complexity_score': complexity_analysis.complexity_score,
+            'confidence': complexity_analysis.confidence,
+            'analyze_time': analyze_time,
+            'generation_time': result.generation_time,
+            'prefill_time': result.prefill_time,
+            'decode_time': result.decode_time,
+            'queue_wait_time': queue_wait,
+            'tokens_generated': int(result.tokens_generated),
+            **retrieval_metrics
+        }
+        
+        # Queued for the background telemetry writer
+        log_router_decision(
+            request.query,
+            RouterDecision(use_rag=use_rag, reason=complexity_analysis.recommendation,
+                           confidence=complexity_analysis.confidence, profile=profile),
+            performance_metrics
+        )
+        
         return QueryResponse(
             answer=answer,
             used_rag=use_rag,
             context_blocks=context_blocks,
             complexity_score=complexity_analysis.complexity_score,
             reasoning=complexity_analysis.reasoning,
-            performance_metrics={
-                'total_time': end_time - start_time,
-                'used_rag': use_rag,
-                'complexity_score': complexity_analysis.complexity_score,
-                'confidence': complexity_analysis.confidence
-            }
+            performance_metrics=performance_metrics
         )
-        
+    
+    except GenerationOverloadedError as e:
+        # Pass the generator's backpressure on to the client
+        raise HTTPException(status_code=503 if e.draining else 429, detail=str(e),
+                            headers={'Retry-After': str(e.retry_after)})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def retrieve(query: str, profile: str):
+    """Run retrieval without blocking the event loop
+    
+    Sharded and replicated indexes search over the network, so the stage
+    runs in the threadpool, in a copy of the request's context so its span
+    (and profiler) belong to this request.
+    """
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, _retrieve, query, profile))
+
+def _retrieve(query: str, profile: str):
+    with get_tracer().span("retrieve", profiled=True, profile=profile) as span:
+        retrieval_result = retriever.retrieve(
+            query=query,
+            profile=profile,
+            k=config.start_k
+        )
+        if span is not None:
+            span.set_attribute("cache_hit", retrieval_result.cache_hit)
+            span.set_attribute("num_candidates", int(retrieval_result.candidate_ids.size))
+            span.set_attribute("used_widening", retrieval_result.used_widening)
+    return retrieval_result
+
+async def generate(prompt: str, generation_config: GenerationConfig):
+    """Run a generation without blocking the event loop
+    
+    In-process models go through the bounded queue; a remote generation
+    server is called from the threadpool and does its own queueing.
+    """
+    if generation_queue is not None:
+        return await asyncio.wrap_future(generation_queue.submit(prompt, generation_config))
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, model_interface.generate, prompt, generation_config)
+
 def format_direct_prompt(query: str) -> str:
     """Format prompt for direct generation"""
     return f"""You are a helpful AI assistant. Please answer the following question directly and concisely.
@@ -213,7 +365,7 @@ Answer:"""
 def format_rag_prompt(query: str, context_blocks: List[Dict[str, Any]]) -> str:
     """Format prompt for RAG generation with context"""
     context_text = "\n\n".join([
-        f"Context {i+1}:\n{block['content']}" 
+        f"Context {i+1}:\n{block['text']}" 
         for i, block in enumerate(context_blocks)
     ])
     
@@ -241,22 +393,40 @@ async def get_config():
     }
 
 @app.get("/stats")
-async def get_stats():
-    """Get system statistics"""
+def get_stats():
+    """Get system statistics
+    
+    Sync so the incremental log read runs in the threadpool, off the event loop.
+    """
     return {
         "router_type": "simplified_complexity",
         "model_type": model_interface.get_model_info()["model_type"] if model_interface else "unknown",
         "config": {
-            "retrieval_k": config.retrieval_k if config else None,
+            "start_k": config.start_k if config else None,
             "model_max_tokens": config.model_max_tokens if config else None,
             "model_temperature": config.model_temperature if config else None
-        }
+        },
+        "telemetry": telemetry_stats.get_stats() if telemetry_stats else None,
+        "generation": get_generation_stats()
     }
 
+def get_generation_stats() -> Optional[Dict[str, Any]]:
+    """Queue stats from the in-process queue or the generation server"""
+    if generation_queue is not None:
+        return generation_queue.get_stats()
+    if isinstance(model_interface, RemoteModelInterface):
+        try:
+            return model_interface.get_service_stats()['queue']
+        except Exception as e:
+            return {'url': model_interface.url, 'error': str(e)}
+    return None
+
 if __name__ == "__main__":
+    # Several workers each load their own model unless ADAPTIVE_GENERATION_URL is set
     uvicorn.run(
         "adaptive_rag_server:app",
         host="0.0.0.0",
         port=8080,
-        reload=False
+        reload=False,
+        workers=get_adaptive_config().web_workers
     )
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Generation Server
+Runs the language model in its own process behind a bounded request queue.
+API servers reach it through ADAPTIVE_GENERATION_URL; when the queue is
+full new requests get 429 with Retry-After instead of waiting in memory.
+"""
+
+import os
+import sys
+import asyncio
+import uvicorn
+from dataclasses import fields
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import Dict, Any, Optional
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from adaptive_rag.core.model_interface import (
+    create_model_interface, load_model, GenerationConfig, MockModelInterface
+)
+from adaptive_rag.core.generation_service import GenerationQueue, GenerationOverloadedError
+from adaptive_rag.config.adaptive_config import get_adaptive_config
+from adaptive_rag.utils.metrics import MetricsRegistry
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    config: Optional[Dict[str, Any]] = None
+
+class GenerateResponse(BaseModel):
+    text: str
+    tokens_generated: int
+    generation_time: float
+    prefill_time: Optional[float] = None
+    decode_time: Optional[float] = None
+    queue_wait: float
+    model_metadata: Dict[str, Any]
+
+app = FastAPI(
+    title="Adaptive RAG Generation Server",
+    description="Language model behind a bounded request queue",
+    version="1.0.0"
+)
+
+# Global variables
+config = None
+model_interface = None
+generation_queue = None
+registry = MetricsRegistry()
+requests_total = registry.counter('generation_requests_total', 'Generation requests by outcome', ('status',))
+queue_wait = registry.histogram('generation_queue_wait_seconds', 'Time requests waited for the model')
+service_time = registry.histogram('generation_service_seconds', 'Time the model spent per request')
+
+@app.on_event("startup")
+async def startup_event():
+    """Load the model and start the queue worker"""
+    global config, model_interface, generation_queue
+    
+    print("🚀 Starting Generation Server...")
+    config = get_adaptive_config()
+    if config.mock_model:
+        model_interface = MockModelInterface(config.mock_prefill_latency, config.mock_per_token_latency)
+    else:
+        model, tokenizer = load_model(config.model_path)
+        model_interface = create_model_interface(model, tokenizer, model_type="auto")
+    print(f"✅ Model interface created: {model_interface.get_model_info()}")
+    
+    generation_queue = GenerationQueue(model_interface, max_size=config.generation_queue_size)
+    registry.gauge('generation_queue_depth', 'Requests waiting for the model',
+                   callback=lambda: {(): generation_queue.get_stats()['queue_depth']})
+    print(f"🎉 Generation Server ready (queue size {config.generation_queue_size})")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Refuse new requests and finish the queued ones before exiting"""
+    if generation_queue is None:
+        return
+    print(f"⏳ Draining {generation_queue.get_stats()['queue_depth']} queued generations...")
+    loop = asyncio.get_event_loop()
+    drained = await loop.run_in_executor(None, generation_queue.drain, config.generation_drain_timeout)
+    print("✅ Generation queue drained" if drained else "⚠️  Drain timed out with generations pending")
+
+@app.post("/generate", response_model=GenerateResponse)
+async def generate(request: GenerateRequest):
+    """Queue a generation and wait for its result"""
+    if generation_queue is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    unknown = set(request.config or {}) - {field.name for field in fields(GenerationConfig)}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown generation config keys: {', '.join(sorted(unknown))}")
+    
+    try:
+        future = generation_queue.submit(request.prompt, GenerationConfig(**(request.config or {})))
+    except GenerationOverloadedError as e:
+        requests_total.inc(1.0, 'draining' if e.draining else 'rejected')
+        raise HTTPException(status_code=503 if e.draining else 429, detail=str(e),
+                            headers={'Retry-After': str(e.retry_after)})
+    
+    try:
+        result = await asyncio.wrap_future(future)
+    except GenerationOverloadedError as e:
+        # Still queued when the drain timed out
+        requests_total.inc(1.0, 'draining')
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+    except Exception as e:
+        requests_total.inc(1.0, 'error')
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    requests_total.inc(1.0, 'ok')
+    wait = result.model_metadata.get('queue_wait', 0.0)
+    queue_wait.observe(wait)
+    service_time.observe(result.generation_time)
+    return GenerateResponse(
+        text=result.text,
+        tokens_generated=int(result.tokens_generated),
+        generation_time=result.generation_time,
+        prefill_time=result.prefill_time,
+        decode_time=result.decode_time,
+        queue_wait=wait,
+        model_metadata=result.model_metadata
+    )
+
+@app.get("/health")
+async def health_check():
+    """Queue depth, wait times and model info; 503 while loading or draining"""
+    if generation_queue is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    stats = generation_queue.get_stats()
+    body = {
+        "status": "draining" if stats['draining'] else "healthy",
+        "model": model_interface.get_model_info(),
+        "queue": stats
+    }
+    return JSONResponse(body, status_code=503 if stats['draining'] else 200)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of queue depth, wait and service times"""
+    return Response(content=registry.render(), media_type=registry.CONTENT_TYPE)
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "generation_server:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("GENERATION_PORT", 8090)),
+        reload=False
+    )
@@ -0,0 +1,94 @@
+"""
+Retrieval Shard Server
+Partitions an index into shards and serves one shard per process for
+sharded retrieval (ADAPTIVE_RETRIEVAL_SHARDS on the API servers), or runs
+a pool of replicated workers over one memory-mapped index
+(ADAPTIVE_RETRIEVAL_REPLICAS)
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+import faiss
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from adaptive_rag.retrieval.sharding import ShardServer, partition_index
+
+def run_replicas(args) -> None:
+    """Start ``num_replicas`` mmap workers over one index and supervise them"""
+    command = [sys.executable, os.path.abspath(__file__), 'serve', '--shard-dir', args.index_dir,
+               '--host', args.host, '--mmap', '--threads', str(args.threads)]
+    workers = [subprocess.Popen(command + ['--port', str(args.base_port + i)])
+               for i in range(args.num_replicas)]
+    host = '127.0.0.1' if args.host == '0.0.0.0' else args.host
+    replicas = ','.join(f"{host}:{args.base_port + i}" for i in range(args.num_replicas))
+    print(f"🧩 {args.num_replicas} retrieval replicas starting; "
+          f"export ADAPTIVE_RETRIEVAL_REPLICAS={replicas}")
+    
+    def stop(signum, frame):
+        for worker in workers:
+            if worker.poll() is None:
+                worker.terminate()
+        sys.exit(0)
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    # Restart workers that die; the frontends' health checks take them out meanwhile
+    while True:
+        time.sleep(1.0)
+        for i, worker in enumerate(workers):
+            if worker.poll() is not None:
+                print(f"⚠️  Replica {i} exited with code {worker.returncode}; restarting")
+                workers[i] = subprocess.Popen(command + ['--port', str(args.base_port + i)])
+
+def main():
+    parser = argparse.ArgumentParser(description='Sharded retrieval: partition an index or serve a shard')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    partition = subparsers.add_parser('partition', help='Split an index directory into shards')
+    partition.add_argument('--index-dir', required=True)
+    partition.add_argument('--output-dir', required=True)
+    partition.add_argument('--num-shards', type=int, required=True)
+    
+    serve = subparsers.add_parser('serve', help='Serve one shard')
+    serve.add_argument('--shard-dir', required=True)
+    serve.add_argument('--host', default='0.0.0.0')
+    serve.add_argument('--port', type=int, default=9100)
+    serve.add_argument('--mmap', action='store_true', help='Memory-map the index file')
+    serve.add_argument('--threads', type=int, default=0, help='FAISS threads (0 keeps the default)')
+    
+    replicas = subparsers.add_parser('replicas', help='Serve one index from several worker processes')
+    replicas.add_argument('--index-dir', required=True)
+    replicas.add_argument('--num-replicas', type=int, default=4)
+    replicas.add_argument('--host', default='0.0.0.0')
+    replicas.add_argument('--base-port', type=int, default=9200)
+    replicas.add_argument('--threads', type=int, default=1,
+                          help='FAISS threads per replica; replicas x threads should not exceed cores')
+    
+    args = parser.parse_args()
+    if args.command == 'partition':
+        partition_index(args.index_dir, args.output_dir, args.num_shards)
+        return
+    if args.command == 'replicas':
+        run_replicas(args)
+        return
+    
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    start = time.time()
+    server = ShardServer(args.shard_dir, args.host, args.port, mmap=args.mmap)
+    info = server.health()
+    print(f"🧩 Shard {info['shard_id']}/{info['num_shards']} ({info['ntotal']} chunks from offset "
+          f"{info['offset']}) loaded in {time.time() - start:.1f}s, serving on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
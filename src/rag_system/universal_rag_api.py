@@ -6,10 +6,12 @@ Deployable anywhere, works with any transformer model via HuggingFace
 import os
 import sys
 import time
-import json
+import asyncio
+import functools
+import contextvars
 import requests
 from typing import Dict, Any, Optional, List
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response
 from pydantic import BaseModel
 import uvicorn
 
@@ -20,6 +22,11 @@ from adaptive_rag.core.query_analyzer import QueryAnalyzer
 from adaptive_rag.config.adaptive_config import get_adaptive_config
 from adaptive_rag.retrieval.dynamic_search import DynamicRetriever
 from adaptive_rag.config.profiles_config import select_profile_for_query
+from adaptive_rag.caching.warmup import CacheWarmer, collect_warmup_queries, DEFAULT_QUESTION_BANK
+from adaptive_rag.utils.telemetry import get_telemetry_sink, close_telemetry_sinks, get_telemetry_sink_stats
+from adaptive_rag.utils.metrics import RAGMetrics
+from adaptive_rag.utils.tracing import get_tracer, current_span
+from adaptive_rag.utils.telemetry_stats import TelemetryAggregator
 
 # Request/Response models
 class QueryRequest(BaseModel):
@@ -41,6 +48,7 @@ class HealthResponse(BaseModel):
     rag_system: str
     model_provider: str
     timestamp: float
+    warmup: Optional[Dict[str, Any]] = None
 
 class ModelConfig(BaseModel):
     model_name: str
@@ -60,6 +68,9 @@ app = FastAPI(
 query_analyzer = None
 retriever = None
 config = None
+cache_warmer = None
+telemetry_stats = None
+metrics = RAGMetrics()
 current_model_config = None
 
 class UniversalModelInterface:
@@ -70,7 +81,7 @@ class UniversalModelInterface:
         self.model_name = model_config.model_name
         self.api_key = model_config.api_key
         self.base_url = model_config.base_url or self._get_default_url()
-        
+    
     def _get_default_url(self) -> str:
         """Get default API URL based on model name"""
         if "gemini" in self.model_name.lower():
@@ -187,7 +198,7 @@ class UniversalModelInterface:
 @app.on_event("startup")
 async def startup_event():
     """Initialize the RAG system on startup"""
-    global query_analyzer, retriever, config, current_model_config
+    global query_analyzer, retriever, config, current_model_config, telemetry_stats
     
     print("🚀 Starting Universal RAG API Server...")
     
@@ -196,6 +207,12 @@ async def startup_event():
         config = get_adaptive_config()
         print(f"✅ Configuration loaded")
         
+        # Incremental aggregation of the query logs behind /stats
+        telemetry_stats = TelemetryAggregator(
+            ["rag_queries.log"],
+            state_file=config.telemetry_stats_state_file
+        )
+        
         # Create query analyzer
         query_analyzer = QueryAnalyzer(config)
         print(f"✅ Query analyzer initialized")
@@ -204,6 +221,12 @@ async def startup_event():
         retriever = DynamicRetriever()
         print(f"✅ Retriever initialized")
         
+        # Warm retrieval caches in the background; /health reports progress
+        start_cache_warmup()
+        
+        # Scrape-time gauges for caches and queues
+        setup_metrics()
+        
         # Set default model (can be overridden per request)
         current_model_config = ModelConfig(
             model_name="gemini-1.5-flash",
@@ -214,11 +237,84 @@ async def startup_event():
         
         print("🎉 Universal RAG API Server ready!")
         print("📡 Supports: Gemini, OpenAI, HuggingFace, and custom APIs")
-        
+    
     except Exception as e:
         print(f"❌ Failed to initialize server: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered telemetry before exit"""
+    close_telemetry_sinks()
+
+def setup_metrics():
+    """Attach cache and queue gauges to /metrics (read only when scraped)"""
+    metrics.enabled = config.enable_metrics
+    metrics.register_cache_stats(lambda: retriever.get_retrieval_stats()['caches'])
+    
+    def queue_depths():
+        depths = {
+            f"telemetry:{os.path.basename(stats['path'])}": stats['queue_depth']
+            for stats in get_telemetry_sink_stats()
+        }
+        if cache_warmer:
+            progress = cache_warmer.get_progress()
+            depths['warmup'] = progress['total'] - progress['completed']
+        return depths
+    
+    metrics.register_queue_depths(queue_depths)
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """Metrics and (sampled) tracing for the query endpoint
+    
+    The root span is opened here; the endpoint runs in a task that inherits
+    it, so its stage spans nest under it.
+    """
+    endpoint = request.url.path
+    if endpoint != "/query":
+        return await call_next(request)
+    
+    start = metrics.request_started()
+    status = "500"
+    try:
+        with get_tracer().trace(endpoint) as root:
+            response = await call_next(request)
+            status = str(response.status_code)
+            if root is not None:
+                root.set_attribute("http.status_code", response.status_code)
+        return response
+    finally:
+        metrics.request_finished(endpoint, start, status)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, stage, cache and queue metrics"""
+    return Response(content=metrics.render(), media_type=metrics.registry.CONTENT_TYPE)
+
+def start_cache_warmup():
+    """Precompute retrieval results for the most frequent queries in the background"""
+    global cache_warmer
+    
+    if config.warmup_queries <= 0:
+        return
+    
+    def load_queries():
+        return collect_warmup_queries(
+            config.warmup_queries,
+            [config.telemetry_log_file, "rag_queries.log"],
+            config.warmup_question_bank or DEFAULT_QUESTION_BANK
+        )
+    
+    cache_warmer = CacheWarmer(batch_size=config.warmup_batch_size)
+    cache_warmer.start(
+        retriever,
+        load_queries,
+        lambda query: select_profile_for_query(query) or "general",
+        k=config.start_k
+    )
+    print(f"🔥 Cache warm-up started (up to {config.warmup_queries} queries)")
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
@@ -226,7 +322,8 @@ async def health_check():
         status="healthy",
         rag_system="universal_adaptive",
         model_provider=current_model_config.model_name if current_model_config else "unknown",
-        timestamp=time.time()
+        timestamp=time.time(),
+        warmup=cache_warmer.get_progress() if cache_warmer else None
     )
 
 @app.post("/query", response_model=QueryResponse)
@@ -243,46 +340,56 @@ async def query_rag(request: QueryRequest, background_tasks: BackgroundTasks):
         model_interface = UniversalModelInterface(model_config)
         
         # Analyze query complexity
-        complexity_analysis = query_analyzer.analyze_query(request.query, request.query_metadata)
+        tracer = get_tracer()
+        stage_start = time.perf_counter()
+        with tracer.span("analyze_query", profiled=True):
+            complexity_analysis = query_analyzer.analyze_query(request.query, request.query_metadata)
+        analyze_time = time.perf_counter() - stage_start
         
         # Make routing decision
         use_rag = complexity_analysis.recommendation == "rag"
+        route = "rag" if use_rag else "direct"
+        metrics.observe_stage(route, "analyze", analyze_time)
+        root = current_span()
+        if root is not None:
+            root.set_attribute("route", route)
         
+        profile = None
         if use_rag:
             # Execute RAG path
-            profile = select_profile_for_query(request.query, request.query_metadata)
-            retrieval_result = retriever.retrieve(
-                query=request.query,
-                profile=profile or "general",
-                k=config.start_k,
-                query_metadata=request.query_metadata
-            )
+            profile = select_profile_for_query(request.query, request.query_metadata) or "general"
+            retrieval_result = await retrieve(request.query, profile)
+            metrics.observe_retrieval(route, retrieval_result.timings, retrieval_result.cache_hit)
             
-            # Generate with context
-            prompt = format_rag_prompt(request.query, retrieval_result['context_blocks'])
-            answer = model_interface.generate(
-                prompt, 
-                max_tokens=model_config.max_tokens,
-                temperature=model_config.temperature
-            )
+            # Serialize the composed context once for both prompt and response
+            context_blocks = retrieval_result.context_blocks
+            retrieval_metrics = retrieval_result.get_metrics()
             
-            context_blocks = retrieval_result['context_blocks']
+            # Prompt with context
+            prompt = format_rag_prompt(request.query, context_blocks)
         else:
             # Execute direct path
             prompt = format_direct_prompt(request.query)
+            context_blocks = []
+            retrieval_metrics = {}
+        
+        # Remote providers only report text, so generation is timed as one stage
+        stage_start = time.perf_counter()
+        with tracer.span("generate", route=route, model=model_config.model_name):
             answer = model_interface.generate(
                 prompt,
                 max_tokens=model_config.max_tokens,
                 temperature=model_config.temperature
             )
-            
-            context_blocks = []
+        generation_time = time.perf_counter() - stage_start
+        metrics.observe_stage(route, "generate", generation_time)
         
         end_time = time.time()
         
         # Log query for analysis
         if config.enable_telemetry:
-            background_tasks.add_task(log_query, request.query, complexity_analysis, end_time - start_time)
+            background_tasks.add_task(log_query, request.query, complexity_analysis, end_time - start_time,
+                                      profile)
         
         return QueryResponse(
             answer=answer,
@@ -296,13 +403,29 @@ async def query_rag(request: QueryRequest, background_tasks: BackgroundTasks):
                 'used_rag': use_rag,
                 'complexity_score': complexity_analysis.complexity_score,
                 'confidence': complexity_analysis.confidence,
-                'model_provider': model_config.model_name
+                'model_provider': model_config.model_name,
+                'analyze_time': analyze_time,
+                'generation_time': generation_time,
+                **retrieval_metrics
             }
         )
-        
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stats")
+def get_stats():
+    """Query counts, routing breakdowns and latency percentiles from the query log
+    
+    Sync so the incremental log read runs in the threadpool, off the event loop.
+    """
+    return {
+        "rag_system": "universal_adaptive",
+        "model_provider": current_model_config.model_name if current_model_config else "unknown",
+        "telemetry": telemetry_stats.get_stats() if telemetry_stats else None,
+        "retrieval": retriever.get_retrieval_stats() if retriever else None
+    }
+
 @app.post("/set_model")
 async def set_default_model(model_config: ModelConfig):
     """Set default model configuration"""
@@ -333,6 +456,30 @@ async def list_supported_models():
         ]
     }
 
+async def retrieve(query: str, profile: str):
+    """Run retrieval without blocking the event loop
+    
+    Sharded and replicated indexes search over the network, so the stage
+    runs in the threadpool, in a copy of the request's context so its span
+    (and profiler) belong to this request.
+    """
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, _retrieve, query, profile))
+
+def _retrieve(query: str, profile: str):
+    with get_tracer().span("retrieve", profiled=True, profile=profile) as span:
+        retrieval_result = retriever.retrieve(
+            query=query,
+            profile=profile,
+            k=config.start_k
+        )
+        if span is not None:
+            span.set_attribute("cache_hit", retrieval_result.cache_hit)
+            span.set_attribute("num_candidates", int(retrieval_result.candidate_ids.size))
+            span.set_attribute("used_widening", retrieval_result.used_widening)
+    return retrieval_result
+
 def format_direct_prompt(query: str) -> str:
     """Format prompt for direct generation"""
     return f"""You are a helpful AI assistant. Please answer the following question directly and concisely.
@@ -344,7 +491,7 @@ Answer:"""
 def format_rag_prompt(query: str, context_blocks: List[Dict[str, Any]]) -> str:
     """Format prompt for RAG generation with context"""
     context_text = "\n\n".join([
-        f"Context {i+1}:\n{block['content']}" 
+        f"Context {i+1}:\n{block['text']}" 
         for i, block in enumerate(context_blocks)
     ])
     
@@ -357,19 +504,20 @@ Question: {query}
 
 Answer:"""
 
-def log_query(query: str, complexity_analysis, total_time: float):
+def log_query(query: str, complexity_analysis, total_time: float, profile: Optional[str] = None):
     """Log query for analysis"""
     log_entry = {
         "timestamp": time.time(),
         "query": query,
         "complexity_score": complexity_analysis.complexity_score,
         "recommendation": complexity_analysis.recommendation,
+        "used_rag": complexity_analysis.recommendation == "rag",
+        "profile": profile,
         "total_time": total_time
     }
     
-    # Log to file
-    with open("rag_queries.log", "a") as f:
-        f.write(json.dumps(log_entry) + "\n")
+    # Queue for the background writer (never blocks on file I/O)
+    get_telemetry_sink("rag_queries.log").emit(log_entry)
 
 if __name__ == "__main__":
     import os
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Element chunking test
+Checks that the indexer's recognition_json input chunks Dolphin layout
+elements as whole units: headings start new chunks, triaged, empty and
+skipped-label elements are left out, overlap repeats whole elements, and
+every chunk carries its source, page range, labels and section. With
+--json-dir it also chunks real recognition JSON both ways (elements and
+the markdown word windows) and compares chunk counts and time.
+
+Examples:
+    # Synthetic pages only
+    python tests/element_chunking_test.py
+    
+    # Plus stats for a real OCR output directory
+    python tests/element_chunking_test.py --json-dir output/recognition_json
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src', 'rag_indexing'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src', 'ocr', 'Dolphin'))
+
+import rag_pipeline
+from rag_pipeline import EnhancedContentProcessor, CHUNK_SIZE, CHUNK_OVERLAP
+
+def paragraph(words: int, tag: str) -> dict:
+    return {'label': 'para', 'text': ' '.join(f"{tag}{i}" for i in range(words))}
+
+def synthetic_pages() -> list:
+    return [
+        {'page_number': 1, 'elements': [
+            {'label': 'header', 'text': 'Running head'},
+            {'label': 'title', 'text': 'Chapter 3 Random Variables'},
+            paragraph(30, 'a'),
+            {'label': 'formula', 'text': 'E[X] = \\sum_x x p(x)'},
+            {'label': 'para', 'text': '', 'triaged': True},
+            {'label': 'fig', 'text': '![Figure](figures/x.png)'}
+        ]},
+        {'page_number': 2, 'elements': [
+            paragraph(30, 'b'),
+            {'label': 'tab', 'text': '<table><tr><th>x</th><th>p(x)</th></tr><tr><td>0</td><td>0.5</td></tr></table>'},
+            {'label': 'sec', 'text': '3.1 Expectation'},
+            paragraph(25, 'c'),
+            paragraph(25, 'd'),
+            paragraph(15, 'e'),
+            {'label': 'list', 'text': 'linearity of expecta-\ntion'}
+        ]},
+        {'page_number': 3, 'elements': [
+            {'label': 'sub_sec', 'text': '3.1.1 A long proof'},
+            paragraph(130, 'f'),
+            {'label': 'reference', 'text': '[1] Ross, A First Course in Probability'}
+        ]}
+    ]
+
+def overflow_pages() -> list:
+    """Carried overlap plus the next element would pass the chunk size"""
+    return [{'page_number': 1, 'elements': [
+        paragraph(25, 'g'), paragraph(25, 'h'), paragraph(40, 'i'),
+        {'label': 'sec', 'text': 'A four word heading'}, paragraph(58, 'j')
+    ]}]
+
+def plain_word_counts(pages: list, **kwargs) -> list:
+    """Chunk word counts without the math keywords appended after packing"""
+    enhancement = rag_pipeline.ENABLE_MATH_ENHANCEMENT
+    rag_pipeline.ENABLE_MATH_ENHANCEMENT = False
+    try:
+        return [len(text.split()) for text, _ in
+                EnhancedContentProcessor.chunk_elements(pages, 'plain.pdf', **kwargs)]
+    finally:
+        rag_pipeline.ENABLE_MATH_ENHANCEMENT = enhancement
+
+def check(condition: bool, message: str, failures: list) -> None:
+    print(f"{'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+def synthetic_checks() -> int:
+    failures = []
+    chunks = EnhancedContentProcessor.chunk_elements(synthetic_pages(), 'chapter_03.pdf',
+                                                     chunk_size=60, overlap=30)
+    texts = [text for text, _ in chunks]
+    metas = [meta for _, meta in chunks]
+    
+    check(texts[0].startswith('Chapter 3 Random Variables') and metas[0]['section'] == 'Chapter 3 Random Variables',
+          'Title opens the first chunk and names its section', failures)
+    check(not any('Running head' in t or 'figures/x.png' in t or 'Ross' in t for t in texts),
+          'Header, figure and reference elements are not indexed', failures)
+    check(metas[0]['pages'] == [1, 1] and metas[1]['pages'][0] == 1,
+          f"Page ranges follow the elements ({[m['pages'] for m in metas]})", failures)
+    check(any('x | p(x)\n0 | 0.5' in t for t in texts), 'Tables become one line per row', failures)
+    check(any('$$E[X] = \\sum_x x p(x)$$' in t for t in texts), 'Formulas are kept whole in $$', failures)
+    check(any('- linearity of expectation' in t for t in texts), 'Wrapped, hyphenated list lines are rejoined', failures)
+    
+    section = [(t, m) for t, m in chunks if m['section'] == '3.1 Expectation']
+    check(section and section[0][0].startswith('3.1 Expectation') and not any('b0' in t for t, _ in section),
+          'Section heading starts a new chunk with no overlap from the previous section', failures)
+    check(len(section) == 2 and 'e0' not in section[0][0] and section[1][0].startswith('d0 '),
+          'Overlap repeats whole trailing elements only', failures)
+    
+    long = [(t, m) for t, m in chunks if m['section'] == '3.1.1 A long proof']
+    words = plain_word_counts(synthetic_pages(), chunk_size=60, overlap=30)[-len(long):]
+    check(len(long) >= 3 and long[0][0].startswith('3.1.1 A long proof\n\nf0 ')
+          and all(w <= 60 for w in words) and long[-1][0].split()[-1] == 'f129',
+          f"An element longer than a chunk is cut into windows after its heading ({words} words)", failures)
+    
+    overflow = EnhancedContentProcessor.chunk_elements(overflow_pages(), 'chapter_04.pdf',
+                                                       chunk_size=60, overlap=30)
+    words = plain_word_counts(overflow_pages(), chunk_size=60, overlap=30)
+    check(all(w <= 60 for w in words) and overflow[1][0].startswith('i0 ')
+          and overflow[2][0].startswith('A four word heading\n\nj0 '),
+          f"Carried overlap and headings never push a chunk past 60 words ({words} words)", failures)
+    
+    real = EnhancedContentProcessor.chunk_elements(synthetic_pages(), 'chapter_03.pdf')
+    check(all(w <= CHUNK_SIZE for w in plain_word_counts(synthetic_pages())),
+          f"Default settings ({CHUNK_SIZE}/{CHUNK_OVERLAP}) produce {len(real)} chunks", failures)
+    return len(failures)
+
+def json_dir_stats(json_dir: str) -> int:
+    from utils.markdown_utils import MarkdownConverter
+    json_files = sorted(glob.glob(os.path.join(json_dir, '*.json')))
+    if not json_files:
+        print(f"❌ No recognition JSON in {json_dir}")
+        return 1
+    
+    element_chunks, element_time, markdown_chunks, markdown_time = 0, 0.0, 0, 0.0
+    for path in json_files:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        pages = data.get('pages', [])
+        
+        start = time.perf_counter()
+        element_chunks += len(EnhancedContentProcessor.chunk_elements(pages, os.path.basename(path)))
+        element_time += time.perf_counter() - start
+        
+        # The markdown path: render the whole file to a string, then word-split it
+        start = time.perf_counter()
+        text = MarkdownConverter().convert([element for page in pages for element in page.get('elements', [])])
+        markdown_chunks += len(EnhancedContentProcessor.chunk_text(text))
+        markdown_time += time.perf_counter() - start
+    
+    print(f"📊 {len(json_files)} files: {element_chunks} element chunks in {element_time:.2f}s, "
+          f"{markdown_chunks} markdown chunks in {markdown_time:.2f}s")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Element chunking test')
+    parser.add_argument('--json-dir', default=None, help='Recognition JSON directory to report stats for')
+    args = parser.parse_args()
+    
+    failures = synthetic_checks()
+    if args.json_dir:
+        failures += json_dir_stats(args.json_dir)
+    
+    if failures:
+        print(f"❌ {failures} checks failed")
+        return 1
+    print("✅ Element chunking checks passed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
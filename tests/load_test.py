@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Load-testing harness for the adaptive RAG servers
+Replays the question bank against /adaptive_rag or /query at a fixed
+concurrency or an open-loop Poisson arrival rate and writes a JSON report
+(throughput, p50/p95/p99 latency, per-stage breakdowns) for regression
+comparison.
+
+Examples:
+    # Adaptive server with the mock model, launched by the harness
+    python tests/load_test.py --launch adaptive --rate 20 --num-requests 500
+    
+    # Universal server already running; generation goes to a local mock backend
+    python tests/load_test.py --url http://localhost:8080 --endpoint /query \\
+        --mock-backend --concurrency 16 --num-requests 1000
+    
+    # Generation in its own process behind a bounded queue, two web workers
+    python tests/load_test.py --launch adaptive --generation-server --web-workers 2 --rate 40
+    
+    # Compare against a previous run
+    python tests/load_test.py --launch adaptive --baseline reports/load_baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAG_SYSTEM_DIR = os.path.join(REPO_ROOT, 'src', 'rag_system')
+DEFAULT_QUESTION_BANK = os.path.join(REPO_ROOT, 'data', 'question_bank.json')
+
+# Server-reported timings broken out in the report
+STAGE_KEYS = ['analyze_time', 'retrieval_time', 'queue_wait_time', 'generation_time', 'prefill_time',
+              'decode_time', 'total_time']
+RETRIEVAL_STAGE_KEYS = ['cache_lookup', 'encode', 'search', 'widen', 'compose']
+
+def load_questions(path: str, limit: Optional[int] = None) -> List[str]:
+    """Load question texts from the question bank"""
+    with open(path, 'r') as f:
+        questions = [q.get('question', '').strip() for q in json.load(f)]
+    questions = [q for q in questions if q]
+    return questions[:limit] if limit else questions
+
+class MockGenerationBackend:
+    """Local stand-in for a generation API (the universal server's generic provider)
+    
+    Answers POST /generate after ``prefill_latency`` plus ``per_token_latency``
+    per requested token, capped at ``max_tokens``.
+    """
+    
+    def __init__(self, port: int = 0, prefill_latency: float = 0.05,
+                 per_token_latency: float = 0.005, max_tokens: int = 64):
+        backend = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                tokens = min(int(body.get('max_tokens', backend.max_tokens)), backend.max_tokens)
+                time.sleep(backend.prefill_latency + backend.per_token_latency * tokens)
+                payload = json.dumps({'text': 'This is a mock response for testing purposes.'}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.prefill_latency = prefill_latency
+        self.per_token_latency = per_token_latency
+        self.max_tokens = max_tokens
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    
+    def start(self) -> 'MockGenerationBackend':
+        self._thread.start()
+        return self
+    
+    def stop(self) -> None:
+        self.server.shutdown()
+
+SERVER_MODULES = {
+    'adaptive': 'adaptive_rag_server',
+    'universal': 'universal_rag_api',
+    'generation': 'generation_server'
+}
+
+def launch_server(kind: str, port: int, env_overrides: Dict[str, str],
+                  startup_timeout: float = 600.0, workers: int = 1) -> subprocess.Popen:
+    """Start one of the servers under uvicorn and wait for /health"""
+    module = SERVER_MODULES[kind]
+    env = dict(os.environ, **env_overrides)
+    command = [sys.executable, '-m', 'uvicorn', f"{module}:app", '--host', '127.0.0.1',
+               '--port', str(port), '--log-level', 'warning']
+    if workers > 1:
+        command += ['--workers', str(workers)]
+    process = subprocess.Popen(command, cwd=RAG_SYSTEM_DIR, env=env)
+    
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{module} exited with code {process.returncode}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=2).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(1.0)
+    
+    process.terminate()
+    raise RuntimeError(f"{module} did not become healthy within {startup_timeout:.0f}s")
+
+def send_query(session: requests.Session, url: str, payload: Dict[str, Any],
+               scheduled: float, timeout: float) -> Dict[str, Any]:
+    """Send one request; latency is measured from its scheduled arrival time"""
+    sent = time.perf_counter()
+    record = {'queue_delay': sent - scheduled}
+    try:
+        response = session.post(url, json=payload, timeout=timeout)
+        record['status'] = response.status_code
+        if response.status_code == 200:
+            body = response.json()
+            record['used_rag'] = body.get('used_rag')
+            record['performance'] = body.get('performance_metrics', {})
+    except requests.RequestException as e:
+        record['status'] = type(e).__name__
+    done = time.perf_counter()
+    record['latency'] = done - scheduled
+    record['service_time'] = done - sent
+    record['completed_at'] = done
+    return record
+
+def run_load(url: str, endpoint: str, questions: List[str], num_requests: int,
+             rate: float, concurrency: int, timeout: float,
+             extra_payload: Optional[Dict[str, Any]] = None, seed: int = 0) -> Dict[str, Any]:
+    """Replay questions open-loop (Poisson at ``rate`` req/s) or closed-loop (rate <= 0)"""
+    rng = random.Random(seed)
+    target = f"{url.rstrip('/')}{endpoint}"
+    payloads = [dict(extra_payload or {}, query=questions[i % len(questions)])
+                for i in range(num_requests)]
+    
+    # One session per worker thread keeps connections alive
+    local = threading.local()
+    
+    def worker(payload: Dict[str, Any], scheduled: Optional[float]) -> Dict[str, Any]:
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        if scheduled is None:
+            scheduled = time.perf_counter()
+        return send_query(local.session, target, payload, scheduled, timeout)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if rate > 0:
+            # Open loop: arrivals follow the schedule regardless of completions,
+            # and queueing behind busy workers counts towards latency
+            futures = []
+            arrival = start
+            for payload in payloads:
+                arrival += rng.expovariate(rate)
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(worker, payload, arrival))
+        else:
+            # Closed loop: each worker sends its next request as soon as the last finishes
+            futures = [pool.submit(worker, payload, None) for payload in payloads]
+        records = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    
+    return {'records': records, 'elapsed': elapsed}
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Summary statistics in milliseconds"""
+    if not values:
+        return {'count': 0}
+    array = np.asarray(values, dtype=np.float64) * 1000
+    return {
+        'count': int(array.size),
+        'mean_ms': float(array.mean()),
+        'p50_ms': float(np.percentile(array, 50)),
+        'p95_ms': float(np.percentile(array, 95)),
+        'p99_ms': float(np.percentile(array, 99)),
+        'max_ms': float(array.max())
+    }
+
+def summarize(run: Dict[str, Any], settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the JSON report from raw records"""
+    records = run['records']
+    ok = [r for r in records if r['status'] == 200]
+    status_counts: Dict[str, int] = {}
+    for r in records:
+        status_counts[str(r['status'])] = status_counts.get(str(r['status']), 0) + 1
+    
+    stages: Dict[str, List[float]] = {key: [] for key in STAGE_KEYS}
+    stages.update({f"retrieval.{key}": [] for key in RETRIEVAL_STAGE_KEYS})
+    for r in ok:
+        performance = r.get('performance') or {}
+        for key in STAGE_KEYS:
+            if isinstance(performance.get(key), (int, float)):
+                stages[key].append(performance[key])
+        retrieval_stages = performance.get('retrieval_stages') or {}
+        if not performance.get('retrieval_cache_hit'):
+            for key in RETRIEVAL_STAGE_KEYS:
+                if isinstance(retrieval_stages.get(key), (int, float)):
+                    stages[f"retrieval.{key}"].append(retrieval_stages[key])
+    
+    by_route = {
+        route: percentiles([r['latency'] for r in ok if r.get('used_rag') == used_rag])
+        for route, used_rag in (('rag', True), ('direct', False))
+    }
+    cache_hits = sum(1 for r in ok if (r.get('performance') or {}).get('retrieval_cache_hit'))
+    rag_requests = sum(1 for r in ok if r.get('used_rag'))
+    
+    return {
+        'settings': settings,
+        'summary': {
+            'requests': len(records),
+            'succeeded': len(ok),
+            'failed': len(records) - len(ok),
+            'status_counts': status_counts,
+            'elapsed_s': run['elapsed'],
+            'throughput_rps': len(ok) / run['elapsed'] if run['elapsed'] > 0 else 0.0,
+            'offered_rps': settings['rate'] if settings['rate'] > 0 else None,
+            'rag_fraction': rag_requests / len(ok) if ok else 0.0,
+            'retrieval_cache_hit_rate': cache_hits / rag_requests if rag_requests else 0.0
+        },
+        'latency': percentiles([r['latency'] for r in ok]),
+        'service_time': percentiles([r['service_time'] for r in ok]),
+        'client_queue_delay': percentiles([r['queue_delay'] for r in ok]),
+        'latency_by_route': by_route,
+        'stages': {stage: percentiles(values) for stage, values in stages.items() if values}
+    }
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any],
+                    max_regression: float) -> bool:
+    """Print changes against a baseline report; returns False on a regression"""
+    print("\n📊 Comparison with baseline:")
+    passed = True
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        old = baseline.get('latency', {}).get(key)
+        new = report['latency'].get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        flag = '❌' if change > max_regression else '✅'
+        passed = passed and change <= max_regression
+        print(f"   {flag} latency {key}: {old:.1f} -> {new:.1f} ({change:+.1%})")
+    
+    old = baseline.get('summary', {}).get('throughput_rps')
+    new = report['summary']['throughput_rps']
+    if old:
+        change = (new - old) / old
+        flag = '❌' if change < -max_regression else '✅'
+        passed = passed and change >= -max_regression
+        print(f"   {flag} throughput: {old:.2f} -> {new:.2f} rps ({change:+.1%})")
+    return passed
+
+def print_report(report: Dict[str, Any]) -> None:
+    summary = report['summary']
+    latency = report['latency']
+    print("\n📈 Load test results")
+    print("=" * 50)
+    print(f"   Requests:   {summary['succeeded']}/{summary['requests']} succeeded "
+          f"({summary['status_counts']})")
+    print(f"   Throughput: {summary['throughput_rps']:.2f} req/s over {summary['elapsed_s']:.1f}s")
+    if latency.get('count'):
+        print(f"   Latency:    p50 {latency['p50_ms']:.1f}ms  p95 {latency['p95_ms']:.1f}ms  "
+              f"p99 {latency['p99_ms']:.1f}ms")
+    for stage, stats in report['stages'].items():
+        print(f"   {stage:<24} p50 {stats['p50_ms']:8.2f}ms  p99 {stats['p99_ms']:8.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the adaptive RAG servers')
+    parser.add_argument('--url', default=None, help='Base URL of a running server')
+    parser.add_argument('--launch', choices=['adaptive', 'universal'], default=None,
+                        help='Start the server locally with mock model backends')
+    parser.add_argument('--port', type=int, default=8765, help='Port for --launch')
+    parser.add_argument('--endpoint', default=None,
+                        help='Endpoint to hit (default: /adaptive_rag or /query for --launch)')
+    parser.add_argument('--question-bank', default=DEFAULT_QUESTION_BANK)
+    parser.add_argument('--num-requests', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=10.0,
+                        help='Open-loop Poisson arrival rate in req/s; 0 for closed loop')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum requests in flight')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mock-backend', action='store_true',
+                        help='Route /query generation to a local mock API')
+    parser.add_argument('--mock-prefill-latency', type=float, default=0.05)
+    parser.add_argument('--mock-per-token-latency', type=float, default=0.005)
+    parser.add_argument('--mock-tokens', type=int, default=64)
+    parser.add_argument('--generation-server', action='store_true',
+                        help='With --launch adaptive, run the mock model in a separate generation server')
+    parser.add_argument('--generation-queue-size', type=int, default=16,
+                        help='Generations waiting before the server answers 429')
+    parser.add_argument('--web-workers', type=int, default=1, help='uvicorn workers for --launch')
+    parser.add_argument('--output', default='load_test_report.json')
+    parser.add_argument('--baseline', default=None, help='Previous report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help='Allowed fractional latency/throughput regression vs baseline')
+    args = parser.parse_args()
+    
+    if not args.url and not args.launch:
+        parser.error('either --url or --launch is required')
+    
+    questions = load_questions(args.question_bank)
+    print(f"📚 Loaded {len(questions)} questions")
+    
+    backend = None
+    server = None
+    generation = None
+    extra_payload: Dict[str, Any] = {}
+    endpoint = args.endpoint or ('/query' if args.launch == 'universal' else '/adaptive_rag')
+    try:
+        if args.mock_backend or args.launch == 'universal':
+            backend = MockGenerationBackend(
+                prefill_latency=args.mock_prefill_latency,
+                per_token_latency=args.mock_per_token_latency,
+                max_tokens=args.mock_tokens
+            ).start()
+            extra_payload['model_config'] = {
+                'model_name': 'mock-generic', 'base_url': backend.url, 'max_tokens': args.mock_tokens
+            }
+            print(f"🧪 Mock generation backend at {backend.url}")
+        
+        url = args.url
+        if args.launch:
+            env = {
+                'ADAPTIVE_MOCK_MODEL': '1',
+                'ADAPTIVE_MOCK_PREFILL_LATENCY': str(args.mock_prefill_latency),
+                'ADAPTIVE_MOCK_PER_TOKEN_LATENCY': str(args.mock_per_token_latency),
+                'ADAPTIVE_MODEL_MAX_TOKENS': str(args.mock_tokens),
+                'ADAPTIVE_GENERATION_QUEUE_SIZE': str(args.generation_queue_size),
+                'ADAPTIVE_WARMUP_QUERIES': '0'
+            }
+            if args.generation_server:
+                generation_port = args.port + 1
+                print(f"🚀 Launching generation server on port {generation_port}...")
+                generation = launch_server('generation', generation_port, env)
+                env['ADAPTIVE_GENERATION_URL'] = f"http://127.0.0.1:{generation_port}"
+            print(f"🚀 Launching {args.launch} server on port {args.port}...")
+            server = launch_server(args.launch, args.port, env, workers=args.web_workers)
+            url = f"http://127.0.0.1:{args.port}"
+        
+        mode = f"open loop at {args.rate} req/s" if args.rate > 0 else "closed loop"
+        print(f"🔥 Sending {args.num_requests} requests to {url}{endpoint} "
+              f"({mode}, concurrency {args.concurrency})")
+        run = run_load(url, endpoint, questions, args.num_requests, args.rate,
+                       args.concurrency, args.timeout, extra_payload, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if generation is not None:
+            generation.terminate()
+            generation.wait(timeout=60)
+        if backend is not None:
+            backend.stop()
+    
+    settings = {
+        'url': url, 'endpoint': endpoint, 'launch': args.launch,
+        'num_requests': args.num_requests, 'rate': args.rate,
+        'concurrency': args.concurrency, 'seed': args.seed,
+        'mock_prefill_latency': args.mock_prefill_latency,
+        'mock_per_token_latency': args.mock_per_token_latency,
+        'mock_tokens': args.mock_tokens,
+        'generation_server': args.generation_server,
+        'generation_queue_size': args.generation_queue_size,
+        'web_workers': args.web_workers,
+        'timestamp': time.time()
+    }
+    report = summarize(run, settings)
+    print_report(report)
+    
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Report written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if not compare_reports(report, baseline, args.max_regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Markdown conversion test
+Checks MarkdownConverter output on fixed recognition results (paper front
+matter, formulas, tables, algorithms, Chinese text, page separators), that
+streaming to a file gives the same markdown as returning a string, and
+reports conversion throughput and peak memory on a synthetic book.
+
+Examples:
+    # Fixed cases and a 2,000-page synthetic book
+    python tests/markdown_convert_test.py
+    
+    # Real recognition JSON, compared against the converter of an older commit
+    git show <commit>:src/ocr/Dolphin/utils/markdown_utils.py > /tmp/markdown_utils_old.py
+    python tests/markdown_convert_test.py --json src/ocr/output/recognition_json/*.json \\
+        --reference /tmp/markdown_utils_old.py
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import importlib.util
+from typing import Dict, Any, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src', 'ocr', 'Dolphin'))
+
+from utils.markdown_utils import MarkdownConverter
+from utils.utils import iter_pdf_elements
+
+# (name, elements, expected markdown)
+CASES = [
+    ('paper page', [
+        {'label': 'title', 'text': 'TinyLlama: An Open-Source\nSmall Language Model'},
+        {'label': 'author', 'text': '\\author{Peiyuan Zhang \\\\ StatNLP Research Group}'},
+        {'label': 'para', 'text': '\\begin{abstract}\nWe present TinyLlama, a compact 1.1B language model pretrained on around 1 trillion tokens'},
+        {'label': 'para', 'text': 'for approximately 3 epochs.\n\\end{abstract}'},
+        {'label': 'sec', 'text': '1 Introduction'},
+        {'label': 'para', 'text': 'We of performance during training We tracked the accuracy of TinyLlama on common-\nsense reasoning benchmarks during its pre-training, as shown in Fig. 2 . Generally, the performance of'},
+        {'label': 'fnote', 'text': '${ }^{4}$ Due to a bug in the config file, the learning rate did not decrease immediately after warmup and remained at\nthe maximum value for several steps before we fixed this.'},
+        {'label': 'foot', 'text': '14'},
+    ],
+     '# TinyLlama: An Open-Source Small Language Model\n'
+     '\n'
+     '$$Peiyuan Zhang \\\\ StatNLP Research Group$$\n'
+     '\n'
+     '**Abstract**  We present TinyLlama, a compact 1.1B language model pretrained on around 1 trillion tokens\n'
+     '\n'
+     '$for approximately 3 epochs. \\\\ $\n'
+     '\n'
+     '## 1 Introduction\n'
+     '\n'
+     'We of performance during training We tracked the accuracy of TinyLlama on commonsense reasoning benchmarks during its pre-training, as shown in Fig. 2 . Generally, the performance of\n'
+     '\n'
+     '${ }^{4}$ Due to a bug in the config file, the learning rate did not decrease immediately after warmup and remained at the maximum value for several steps before we fixed this.\n'
+     '\n'
+     '14\n'
+     '\n'),
+    ('math', [
+        {'label': 'sub_sec', 'text': '2.1 Expected value'},
+        {'label': 'para', 'text': 'The expected value of $X$ is\n$\\sum_ {x} x p(x)$ when the sum\nconverges.'},
+        {'label': 'formula', 'text': '\\[ \\\\ E[X]=\\sum_ {x} x p(x) \\eqno{(2.1)} \\\\ \\]'},
+        {'label': 'formula', 'text': 'Var(X) = E[X^2] - E[X]^2\n= \\sigma^2'},
+        {'label': 'para', 'text': 'x_ {i} \\geq 0'},
+        {'label': 'list', 'text': '  non-negative values\n'},
+    ],
+     '### 2.1 Expected value\n'
+     '\n'
+     'The expected value of $X$ is $\\sum_{x} x p(x)$ when the sum converges.\n'
+     '\n'
+     '$$ \\\\ E[X]=\\sum_{x} x p(x) \\tag{2.1} \\\\ $$\n'
+     '\n'
+     '$$Var(X) = E[X^2] - E[X]^2\n'
+     '= \\sigma^2$$\n'
+     '\n'
+     '$x_{i} \\geq 0$\n'
+     '\n'
+     '- non-negative values\n'),
+    ('tables and figures', [
+        {'label': 'tab', 'text': '<table border="1"><tr><td></td><td>HellaSwag</td><td>Obqa</td></tr><tr><td>OPT-1.3B</td><td>53.65</td><td>33.40</td></tr></table>'},
+        {'label': 'cap', 'text': 'Table 2: Zero-shot performance on commonsense reasoning tasks'},
+        {'label': 'tab', 'text': 'Model Params\nTinyLlama 1.1B\nPythia 1.4'},
+        {'label': 'fig', 'text': '![Figure](figures/page_003_figure_002.png)'},
+        {'label': 'fig', 'text': 'figures/page_003_figure_004.png'},
+        {'label': 'reference', 'text': '[1] Touvron et al. Llama 2.'},
+        {'label': 'para', 'text': ''},
+    ],
+     '<table><tr><td></td><td>HellaSwag</td><td>Obqa</td></tr><tr><td>OPT-1.3B</td><td>53.65</td><td>33.40</td></tr></table>\n'
+     '\n'
+     'Table 2: Zero-shot performance on commonsense reasoning tasks\n'
+     '\n'
+     '| Model | Params |\n'
+     '| --- | --- |\n'
+     '| TinyLlama | 1.1B |\n'
+     '| Pythia | 1.4 |\n'
+     '\n'
+     '![Figure](figures/page_003_figure_002.png)\n'
+     '\n'
+     '![Figure 4](../figures/page_003_figure_004.png)\n'
+     '\n'),
+    ('algorithm', [
+        {'label': 'alg', 'text': '\\begin{algorithm}\n\\caption{Gradient descent}\n\\label{alg:gd}\n\\begin{algorithmic}\nrepeat\n  w = w - lr * grad\nuntil converged\n\\end{algorithmic}\n\\end{algorithm}'},
+    ],
+     '**Gradient descent**\n'
+     '\n'
+     '```\n'
+     '\n'
+     'repeat\n'
+     '  w = w - lr * grad\n'
+     'until converged\n'
+     '```\n'
+     '\n'),
+    ('chinese', [
+        {'label': 'sec', 'text': '第一章\n概率'},
+        {'label': 'para', 'text': '随机变量的期望\n是加权平均。\n\nSecond paragraph\nof English.'},
+    ],
+     '## 第一章概率\n'
+     '\n'
+     '随机变量的期望是加权平均。\n'
+     '\n'
+     'Second paragraph of English.\n'
+     '\n'),
+    ('page separators', [
+        {'label': 'para', 'text': 'End of page one.'},
+        {'label': 'page_separator', 'text': '\n\n---\n\n'},
+        {'label': 'tab', 'text': '<tr>'},
+        {'label': 'page_separator', 'text': '\n\n---\n\n'},
+        {'label': 'para', 'text': 'Start of page three.'},
+    ],
+     'End of page one.\n'
+     '\n'
+     '---\n'
+     '\n'
+     '---\n'
+     '\n'
+     'Start of page three.\n'
+     '\n'),
+]
+
+def synthetic_book(num_pages: int) -> List[Dict[str, Any]]:
+    """Pages built from the fixed cases, in the shape save_combined_pdf_results receives"""
+    elements = [element for _, case_elements, _ in CASES for element in case_elements]
+    per_page = 12
+    return [{'page_number': page + 1,
+             'elements': [dict(elements[(page * per_page + i) % len(elements)]) for i in range(per_page)]}
+            for page in range(num_pages)]
+
+def load_pages(paths: List[str]) -> List[Dict[str, Any]]:
+    pages = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.extend(json.load(f)['pages'])
+    return pages
+
+def load_reference(path: str):
+    spec = importlib.util.spec_from_file_location('reference_markdown_utils', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.MarkdownConverter
+
+def measure(convert) -> Dict[str, float]:
+    """Seconds and peak traced memory of one conversion"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    convert()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': elapsed, 'peak_mb': peak / 1024 / 1024}
+
+def main():
+    parser = argparse.ArgumentParser(description='Markdown conversion test')
+    parser.add_argument('--json', nargs='*', default=None, help='Recognition JSON files to convert (default: a synthetic book)')
+    parser.add_argument('--pages', type=int, default=2000, help='Pages in the synthetic book')
+    parser.add_argument('--reference', default=None, help='Older markdown_utils.py to compare output and speed against')
+    args = parser.parse_args()
+    
+    failures = 0
+    for name, elements, expected in CASES:
+        markdown = MarkdownConverter().convert(elements)
+        streamed = io.StringIO()
+        MarkdownConverter().convert(iter(elements), out=streamed)
+        if markdown != expected:
+            print(f"❌ {name}: unexpected markdown\n  expected {expected!r}\n  got      {markdown!r}")
+            failures += 1
+        elif streamed.getvalue() != markdown:
+            print(f"❌ {name}: streamed markdown differs from convert()")
+            failures += 1
+    print(f"{'✅' if not failures else '❌'} {len(CASES) - failures}/{len(CASES)} fixed cases")
+    
+    pages = load_pages(args.json) if args.json else synthetic_book(args.pages)
+    num_elements = sum(1 for _ in iter_pdf_elements(pages))
+    print(f"🧪 {len(pages)} pages, {num_elements} elements")
+    
+    converter = MarkdownConverter()
+    result = {}
+    in_memory = measure(lambda: result.setdefault('markdown', converter.convert(list(iter_pdf_elements(pages)))))
+    markdown = result['markdown']
+    with tempfile.TemporaryDirectory(prefix='markdown_convert_') as tmp_dir:
+        path = os.path.join(tmp_dir, 'book.md')
+        def stream():
+            with open(path, 'w', encoding='utf-8') as f:
+                converter.convert(iter_pdf_elements(pages), out=f)
+        streamed = measure(stream)
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() != markdown:
+                print("❌ Streamed book differs from convert()")
+                failures += 1
+    
+    size_mb = len(markdown.encode('utf-8')) / 1024 / 1024
+    print(f"  convert():       {num_elements / in_memory['seconds']:,.0f} elements/s, "
+          f"{size_mb / in_memory['seconds']:.1f} MB/s, peak {in_memory['peak_mb']:.1f} MB")
+    print(f"  streamed to file: {num_elements / streamed['seconds']:,.0f} elements/s, "
+          f"peak {streamed['peak_mb']:.1f} MB ({size_mb:.1f} MB of markdown)")
+    
+    if args.reference:
+        reference = load_reference(args.reference)()
+        result = {}
+        timing = measure(lambda: result.setdefault('markdown', reference.convert(list(iter_pdf_elements(pages)))))
+        same = result['markdown'] == markdown
+        print(f"  reference:       {num_elements / timing['seconds']:,.0f} elements/s, peak {timing['peak_mb']:.1f} MB "
+              f"({timing['seconds'] / streamed['seconds']:.1f}x slower than streaming) "
+              f"{'✅ same markdown' if same else '❌ different markdown'}")
+        failures += not same
+    
+    if failures:
+        print(f"❌ {failures} checks failed")
+        return 1
+    print("✅ Markdown conversion checks passed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Batched Dolphin element recognition test
+Renders a page, crops its layout elements and recognizes them one at a
+time and in batches, checking that batched decoding gives the same text
+and reporting crops/second for each batch size.
+
+Examples:
+    # First page of a chapter with the production checkpoint
+    python tests/ocr_batch_inference_test.py --pdf src/ocr/pdf_by_chapter/chapter_01.pdf
+    
+    # Larger batches on a GPU node
+    python tests/ocr_batch_inference_test.py --pdf chapter.pdf --batch-sizes 1,8,16,32
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src', 'ocr'))
+
+from pipeline import DolphinModel, DEFAULT_CONFIG, LAYOUT_PROMPT, TEXT_PROMPT
+from utils.utils import convert_pdf_to_images, parse_layout_string, prepare_image, process_coordinates
+
+def page_crops(model: DolphinModel, image, max_crops: int) -> List:
+    """Element crops from the page's layout, or horizontal strips if the layout finds none"""
+    import cv2
+    from PIL import Image
+    
+    padded_image, dims = prepare_image(image)
+    crops, previous_box = [], None
+    for bbox, label in parse_layout_string(model.chat(LAYOUT_PROMPT, image)):
+        if label == 'fig':
+            continue
+        try:
+            x1, y1, x2, y2, _, _, _, _, previous_box = process_coordinates(bbox, padded_image, dims, previous_box)
+        except Exception:
+            continue
+        cropped = padded_image[y1:y2, x1:x2]
+        if cropped.size and cropped.shape[0] > 3 and cropped.shape[1] > 3:
+            crops.append(Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB)))
+    if not crops:
+        print("⚠️  Layout found no text elements; using page strips as crops")
+        strip = max(1, image.height // max_crops)
+        crops = [image.crop((0, top, image.width, min(image.height, top + strip)))
+                 for top in range(0, image.height, strip)]
+    return crops[:max_crops]
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare batched and one-at-a-time element recognition')
+    parser.add_argument('--pdf', required=True, help='PDF to take the page from')
+    parser.add_argument('--page', type=int, default=1, help='1-based page number')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='Dolphin model config')
+    parser.add_argument('--device', default=None)
+    parser.add_argument('--batch-sizes', default='1,4,8,16')
+    parser.add_argument('--max-crops', type=int, default=32)
+    args = parser.parse_args()
+    
+    model = DolphinModel(args.config, device=args.device)
+    images = convert_pdf_to_images(args.pdf, first_page=args.page - 1, last_page=args.page)
+    if not images:
+        print(f"❌ Could not render page {args.page} of {args.pdf}")
+        return 1
+    crops = page_crops(model, images[0], args.max_crops)
+    print(f"🧪 {len(crops)} crops from page {args.page} of {os.path.basename(args.pdf)} on {model.device}")
+    
+    start = time.time()
+    expected = [model.chat(TEXT_PROMPT, crop) for crop in crops]
+    serial_time = time.time() - start
+    print(f"  one at a time: {len(crops) / serial_time:.2f} crops/s")
+    
+    failures = 0
+    for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+        start = time.time()
+        texts = []
+        for offset in range(0, len(crops), batch_size):
+            texts.extend(model.chat_batch(TEXT_PROMPT, crops[offset:offset + batch_size]))
+        elapsed = time.time() - start
+        mismatches = [i for i, (a, b) in enumerate(zip(expected, texts)) if a.strip() != b.strip()]
+        if len(texts) != len(expected):
+            mismatches.append(len(texts))
+        status = "✅" if not mismatches else f"❌ {len(mismatches)} mismatches (first at crop {mismatches[0]})"
+        print(f"  batch {batch_size:>3}: {len(crops) / elapsed:.2f} crops/s "
+              f"({serial_time / elapsed:.2f}x) {status}")
+        failures += bool(mismatches)
+    
+    if failures:
+        print("❌ Batched recognition differs from one-at-a-time recognition")
+        return 1
+    print("✅ Batched recognition matches one-at-a-time recognition")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
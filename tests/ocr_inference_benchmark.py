@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Dolphin inference mode benchmark
+Runs the full page pipeline (layout pass and element recognition) over a
+fixed page set in each inference mode and reports pages per minute, load
+and warm-up time, and how far each mode's output drifts from fp32.
+
+Modes are the ``inference`` settings of Dolphin.yaml: fp32, bf16, fp16
+(CUDA), int8 (dynamic quantization of the decoder) and compile (compiled
+encoder); combine them with '+', e.g. bf16+compile.
+
+Examples:
+    # CPU node: the modes that make sense without a GPU
+    python tests/ocr_inference_benchmark.py --pdf src/ocr/pdf_by_chapter/chapter_01.pdf \\
+        --pages 1-5 --modes fp32,bf16,int8,compile,int8+compile
+    
+    # GPU node, appending to a trend file
+    python tests/ocr_inference_benchmark.py --pdf chapter.pdf --pages 10-19 \\
+        --modes fp32,bf16,fp16,bf16+compile --history reports/ocr_history.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import difflib
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Dict, Any, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src', 'ocr'))
+
+import torch
+from pipeline import DolphinModel, DEFAULT_CONFIG, process_page
+from triage import parse_ranges
+from utils.utils import iter_pdf_images
+
+MODE_SETTINGS = {
+    'fp32': {'precision': 'fp32'},
+    'bf16': {'precision': 'bf16'},
+    'fp16': {'precision': 'fp16'},
+    'int8': {'quantize_decoder': True},
+    'compile': {'compile_encoder': True}
+}
+
+def mode_overrides(mode: str) -> Dict[str, Any]:
+    overrides = {'precision': 'fp32', 'quantize_decoder': False, 'compile_encoder': False}
+    for part in mode.split('+'):
+        if part not in MODE_SETTINGS:
+            raise ValueError(f"Unknown mode '{part}' (expected {', '.join(MODE_SETTINGS)})")
+        overrides.update(MODE_SETTINGS[part])
+    return overrides
+
+def page_text(elements: List[Dict[str, Any]]) -> str:
+    return '\n'.join(f"{element['label']}: {element.get('text', '')}" for element in elements)
+
+def run_mode(mode: str, images: List, args, save_dir: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    model = DolphinModel(args.config, device=args.device, inference=mode_overrides(mode))
+    load_time = time.perf_counter() - start
+    
+    # The first page pays lazy initialization and, when compiling, compilation
+    start = time.perf_counter()
+    process_page(model, images[0], save_dir, f"warmup_{mode}", args.max_batch_size)
+    warmup_time = time.perf_counter() - start
+    
+    outputs, page_times = [], []
+    for repeat in range(args.repeats):
+        for i, image in enumerate(images):
+            start = time.perf_counter()
+            elements = process_page(model, image, save_dir, f"{mode}_{i}", args.max_batch_size)
+            page_times.append(time.perf_counter() - start)
+            if repeat == 0:
+                outputs.append(page_text(elements))
+    
+    total = sum(page_times)
+    del model
+    return {
+        'mode': mode,
+        'settings': mode_overrides(mode),
+        'load_time': load_time,
+        'warmup_time': warmup_time,
+        'pages_timed': len(page_times),
+        'seconds_per_page': total / len(page_times),
+        'pages_per_minute': 60.0 * len(page_times) / total if total else None,
+        'outputs': outputs
+    }
+
+def compare(result: Dict[str, Any], reference: Dict[str, Any]) -> None:
+    """Output drift against the reference mode, per page and averaged"""
+    ratios = [difflib.SequenceMatcher(None, a, b).ratio()
+              for a, b in zip(reference['outputs'], result['outputs'])]
+    result['similarity_to_fp32'] = sum(ratios) / len(ratios)
+    result['min_similarity_to_fp32'] = min(ratios)
+    result['identical_pages'] = sum(1 for a, b in zip(reference['outputs'], result['outputs']) if a == b)
+    result['speedup_vs_fp32'] = reference['seconds_per_page'] / result['seconds_per_page']
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_result(result: Dict[str, Any], num_pages: int) -> None:
+    drift = ""
+    if 'similarity_to_fp32' in result:
+        drift = (f"  {result['speedup_vs_fp32']:.2f}x  similarity {result['similarity_to_fp32']:.3f} "
+                 f"(min {result['min_similarity_to_fp32']:.3f}, {result['identical_pages']}/{num_pages} identical)")
+    print(f"  {result['mode']:>14}  {result['pages_per_minute']:.2f} pages/min  "
+          f"load {result['load_time']:.1f}s  warm-up {result['warmup_time']:.1f}s{drift}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Dolphin inference modes on a fixed page set')
+    parser.add_argument('--pdf', required=True, help='PDF the page set is taken from')
+    parser.add_argument('--pages', default='1-5', help='1-based page ranges, e.g. 1-5,12')
+    parser.add_argument('--modes', default='fp32,bf16,int8,compile',
+                        help="Comma-separated modes; fp32 is always run first as the reference")
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='Dolphin model config')
+    parser.add_argument('--device', default=None)
+    parser.add_argument('--threads', type=int, default=None, help='torch CPU threads')
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--repeats', type=int, default=1, help='Timed passes over the page set')
+    parser.add_argument('--output', default='ocr_inference_benchmark.json')
+    parser.add_argument('--history', default=None,
+                        help='JSONL file to append one line per mode to, for trend tracking')
+    args = parser.parse_args()
+    
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    for mode in modes:
+        mode_overrides(mode)
+    modes = ['fp32'] + [mode for mode in modes if mode != 'fp32']
+    
+    wanted = set(parse_ranges(args.pages, 10 ** 6))
+    images = [image for page_num, image in iter_pdf_images(args.pdf, first_page=min(wanted),
+                                                           last_page=max(wanted) + 1)
+              if page_num in wanted]
+    if not images:
+        print(f"❌ No pages {args.pages} in {args.pdf}")
+        return 1
+    
+    meta = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'cuda_device': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        'params': vars(args)
+    }
+    print(f"🧪 {len(images)} pages of {os.path.basename(args.pdf)}, modes: {', '.join(modes)}")
+    
+    save_dir = tempfile.mkdtemp(prefix='ocr_bench_')
+    os.makedirs(os.path.join(save_dir, 'markdown', 'figures'), exist_ok=True)
+    results: List[Dict[str, Any]] = []
+    failed: List[Dict[str, Any]] = []
+    try:
+        for mode in modes:
+            try:
+                result = run_mode(mode, images, args, save_dir)
+            except Exception as e:
+                print(f"  {mode:>14}  ❌ {type(e).__name__}: {e}")
+                failed.append({'mode': mode, 'error': f"{type(e).__name__}: {e}"})
+                continue
+            if results:
+                compare(result, results[0])
+            results.append(result)
+            print_result(result, len(images))
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+    
+    report = {'meta': meta, 'results': results, 'failed': failed}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"📄 Report written to {args.output}")
+    
+    if args.history:
+        with open(args.history, 'a') as f:
+            for result in results:
+                f.write(json.dumps({'timestamp': meta['timestamp'], 'git_commit': meta['git_commit'],
+                                    **{key: value for key, value in result.items() if key != 'outputs'}},
+                                   default=str) + '\n')
+        print(f"📈 Appended {len(results)} modes to {args.history}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
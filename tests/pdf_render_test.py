@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Streaming PDF rasterization test
+Checks that pages rendered straight from the pixmap buffer match the old
+PNG round trip, then streams a long PDF through iter_pdf_images against a
+consumer that stands in for the GPU stage, reporting render throughput,
+how much rendering overlapped with the consumer, and resident memory
+compared with materializing every page first.
+
+Examples:
+    # Synthetic 400-page book, 50 ms of "inference" per page
+    python tests/pdf_render_test.py
+    
+    # A real chapter
+    python tests/pdf_render_test.py --pdf src/ocr/pdf_by_chapter/chapter_01.pdf --consumer-ms 200
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+import pymupdf
+from PIL import Image
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'src', 'ocr', 'Dolphin'))
+
+from utils.utils import convert_pdf_to_images, iter_pdf_images, render_pdf_page
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+class PeakRSS:
+    """Samples resident memory in the background while a phase runs"""
+    
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_mb())
+            time.sleep(self.interval)
+    
+    def __enter__(self):
+        self.baseline = rss_mb()
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+def make_book(path: str, num_pages: int) -> None:
+    """Text, rules and a filled box on every page, so pages are not blank"""
+    doc = pymupdf.open()
+    for i in range(num_pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Chapter {i // 20 + 1}, page {i + 1}", fontsize=18)
+        for line in range(30):
+            page.insert_text((72, 110 + line * 20), f"Line {line}: the expected value of X is the sum of x p(x).",
+                             fontsize=10)
+        page.draw_rect(pymupdf.Rect(350, 650, 520, 760), color=(0, 0, 1), fill=(0.8, 0.9, 1))
+    doc.save(path)
+
+def png_round_trip(page, target_size: int) -> Image.Image:
+    """The previous conversion: render, encode to PNG, decode with PIL"""
+    scale = target_size / max(page.rect.width, page.rect.height)
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale))
+    return Image.open(io.BytesIO(pix.tobytes("png")))
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming PDF rasterization test')
+    parser.add_argument('--pdf', default=None, help='PDF to use (default: a synthetic book)')
+    parser.add_argument('--pages', type=int, default=400, help='Pages in the synthetic book')
+    parser.add_argument('--target-size', type=int, default=896)
+    parser.add_argument('--consumer-ms', type=float, default=50.0, help='Simulated inference time per page')
+    parser.add_argument('--prefetch', type=int, default=4)
+    parser.add_argument('--check-pages', type=int, default=10, help='Pages compared against the PNG path')
+    args = parser.parse_args()
+    
+    tmp_dir = tempfile.mkdtemp(prefix='pdf_render_')
+    pdf_path = args.pdf
+    if pdf_path is None:
+        pdf_path = os.path.join(tmp_dir, 'book.pdf')
+        make_book(pdf_path, args.pages)
+    with pymupdf.open(pdf_path) as doc:
+        num_pages = len(doc)
+        check = min(args.check_pages, num_pages)
+        
+        start = time.time()
+        expected = [png_round_trip(doc[i], args.target_size) for i in range(check)]
+        png_time = time.time() - start
+        start = time.time()
+        rendered = [render_pdf_page(doc[i], args.target_size) for i in range(check)]
+        buffer_time = time.time() - start
+    print(f"🧪 {num_pages} pages from {os.path.basename(pdf_path)}")
+    
+    failures = 0
+    for i, (a, b) in enumerate(zip(expected, rendered)):
+        if a.size != b.size or not np.array_equal(np.asarray(a.convert('RGB')), np.asarray(b)):
+            print(f"❌ Page {i + 1} differs from the PNG round trip")
+            failures += 1
+    print(f"{'✅' if not failures else '❌'} Pixmap buffer matches PNG round trip on {check} pages "
+          f"({check / png_time:.1f} -> {check / buffer_time:.1f} pages/s)")
+    
+    consume = args.consumer_ms / 1000.0
+    with PeakRSS() as streamed:
+        start = time.time()
+        count = 0
+        for page_num, image in iter_pdf_images(pdf_path, args.target_size, prefetch=args.prefetch):
+            if page_num != count:
+                print(f"❌ Expected page {count}, got {page_num}")
+                failures += 1
+            count += 1
+            time.sleep(consume)
+        stream_time = time.time() - start
+    
+    with PeakRSS() as materialized:
+        start = time.time()
+        images = convert_pdf_to_images(pdf_path, args.target_size)
+        render_time = time.time() - start
+        for _ in images:
+            time.sleep(consume)
+        list_time = time.time() - start
+        del images
+    
+    if count != num_pages:
+        print(f"❌ Streamed {count} of {num_pages} pages")
+        failures += 1
+    overlap = 1.0 - (stream_time - num_pages * consume) / render_time if render_time else 0.0
+    print(f"  render alone:  {render_time:.1f}s ({num_pages / render_time:.1f} pages/s)")
+    print(f"  streamed:      {stream_time:.1f}s end to end, {max(0.0, min(1.0, overlap)) * 100:.0f}% of "
+          f"rendering hidden behind the consumer (list first: {list_time:.1f}s)")
+    print(f"  peak RSS over baseline: streamed {streamed.peak - streamed.baseline:.0f} MB, "
+          f"list {materialized.peak - materialized.baseline:.0f} MB")
+    
+    # Stopping early must not leave the renderer running
+    for page_num, _ in iter_pdf_images(pdf_path, args.target_size, prefetch=args.prefetch):
+        if page_num == 2:
+            break
+    time.sleep(0.2)
+    leftover = [t for t in threading.enumerate() if t.name == 'pdf-render']
+    if leftover:
+        print("❌ Renderer thread still running after the consumer stopped")
+        failures += 1
+    
+    try:
+        list(iter_pdf_images(os.path.join(tmp_dir, 'missing.pdf')))
+        print("❌ Missing PDF did not raise")
+        failures += 1
+    except Exception:
+        pass
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    if failures:
+        print(f"❌ {failures} checks failed")
+        return 1
+    print("✅ Streaming rasterization checks passed")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
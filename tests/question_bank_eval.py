@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Parallel question-bank evaluation for the adaptive RAG pipeline
+Loads the analyzer, retriever and (optionally) model once per worker,
+shards the question bank into batches across a process pool and runs
+each batch through routing, batched retrieval and generation. Every
+finished batch is appended to a JSONL checkpoint and a CSV, and the JSON
+summary is rewritten, so a preempted SLURM job resumes where it stopped.
+
+Examples:
+    # Routing + retrieval on 4 worker processes
+    python tests/question_bank_eval.py --mode retrieve --workers 4
+    
+    # End-to-end with the mock model, resuming an interrupted run
+    python tests/question_bank_eval.py --mode generate --mock-model \\
+        --run-name nightly --resume
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import multiprocessing
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAG_SYSTEM_DIR = os.path.join(REPO_ROOT, 'src', 'rag_system')
+DEFAULT_QUESTION_BANK = os.path.join(REPO_ROOT, 'data', 'question_bank.json')
+DEFAULT_OUTPUT_DIR = os.path.join(REPO_ROOT, 'tests', 'question_bank_reports')
+
+MODES = ['analyze', 'retrieve', 'generate']
+
+# Per-question fields written to the CSV (the JSONL also keeps answers)
+CSV_FIELDS = [
+    'key', 'question_number', 'category', 'question_type', 'question_length',
+    'is_numerical', 'used_rag', 'recommendation', 'complexity_score', 'confidence',
+    'profile', 'num_candidates', 'mean_relevance', 'used_widening', 'analyze_time',
+    'retrieval_time', 'generation_time', 'tokens_generated', 'worker', 'error'
+]
+TIMING_FIELDS = ['analyze_time', 'retrieval_time', 'generation_time']
+
+def load_question_bank(path: str, limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """(key, question) pairs; keys are stable across runs of the same bank"""
+    with open(path, 'r') as f:
+        questions = json.load(f)
+    keyed = [(f"{i}:{q.get('question_number', '')}", q) for i, q in enumerate(questions)
+             if q.get('question', '').strip()]
+    return keyed[:limit] if limit else keyed
+
+def classify_question(question_text: str) -> Tuple[str, Optional[str]]:
+    """(complexity category, question type) with question_bank_test's heuristics"""
+    text = question_text.lower()
+    category = 'simple' if len(text.split()) < 20 else 'complex'
+    if any(word in text for word in ['define', 'what is', 'definition']):
+        return category, 'definitions'
+    if any(word in text for word in ['prove', 'theorem', 'lemma', 'corollary']):
+        return category, 'theorems'
+    if any(word in text for word in ['example', 'compute', 'calculate', 'find']):
+        return category, 'worked_examples'
+    return category, None
+
+# Worker state: models are loaded once per process by init_worker
+_worker: Dict[str, Any] = {}
+
+def init_worker(mode: str, mock_model: bool) -> None:
+    """Load the pipeline components this mode needs into the current process"""
+    if RAG_SYSTEM_DIR not in sys.path:
+        sys.path.insert(0, RAG_SYSTEM_DIR)
+    from adaptive_rag.config.adaptive_config import get_adaptive_config
+    from adaptive_rag.core.query_analyzer import QueryAnalyzer
+    
+    config = get_adaptive_config()
+    _worker.clear()
+    _worker.update(mode=mode, config=config, analyzer=QueryAnalyzer(config),
+                   name=multiprocessing.current_process().name)
+    
+    if mode in ('retrieve', 'generate'):
+        from adaptive_rag.retrieval.dynamic_search import DynamicRetriever
+        _worker['retriever'] = DynamicRetriever()
+    
+    if mode == 'generate':
+        from adaptive_rag.core.model_interface import create_model_interface, load_model, MockModelInterface
+        if mock_model or config.mock_model:
+            _worker['model'] = MockModelInterface(config.mock_prefill_latency,
+                                                  config.mock_per_token_latency)
+        else:
+            # Same weights and prompts as the adaptive server
+            model, tokenizer = load_model(config.model_path)
+            _worker['model'] = create_model_interface(model, tokenizer, model_type="auto")
+
+def evaluate_batch(batch: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Route, retrieve and generate for one batch of (key, question) pairs"""
+    from adaptive_rag.config.profiles_config import select_profile_for_query
+    
+    config = _worker['config']
+    analyzer = _worker['analyzer']
+    rows: List[Dict[str, Any]] = []
+    
+    for key, question in batch:
+        text = question.get('question', '')
+        category, question_type = classify_question(text)
+        row = dict.fromkeys(CSV_FIELDS)
+        row.update(key=key, question_number=question.get('question_number', ''),
+                   category=category, question_type=question_type,
+                   question_length=len(text.split()),
+                   is_numerical=bool(question.get('is_numerical', False)),
+                   worker=_worker['name'], question=text)
+        try:
+            stage_start = time.perf_counter()
+            analysis = analyzer.analyze_query(text)
+            row['analyze_time'] = time.perf_counter() - stage_start
+            row.update(used_rag=analysis.recommendation == 'rag',
+                       recommendation=analysis.recommendation,
+                       complexity_score=analysis.complexity_score,
+                       confidence=analysis.confidence)
+            if row['used_rag']:
+                row['profile'] = select_profile_for_query(text) or 'general'
+        except Exception as e:
+            row['error'] = f"analyze: {e}"
+        rows.append(row)
+    
+    retrieval = {}
+    retriever = _worker.get('retriever')
+    if retriever is not None:
+        # One batched encode + search per profile
+        by_profile: Dict[str, List[int]] = {}
+        for i, row in enumerate(rows):
+            if row['used_rag'] and not row['error']:
+                by_profile.setdefault(row['profile'], []).append(i)
+        for profile, positions in by_profile.items():
+            try:
+                results = retriever.retrieve_batch([rows[i]['question'] for i in positions],
+                                                   profile=profile, k=config.start_k)
+            except Exception as e:
+                for i in positions:
+                    rows[i]['error'] = f"retrieve: {e}"
+                continue
+            for i, result in zip(positions, results):
+                retrieval[i] = result
+                rows[i].update(num_candidates=int(result.candidate_ids.size),
+                               mean_relevance=result.mean_relevance,
+                               used_widening=result.used_widening,
+                               retrieval_time=result.retrieval_time)
+    
+    model = _worker.get('model')
+    if model is not None:
+        from adaptive_rag.core.model_interface import GenerationConfig
+        from adaptive_rag_server import format_direct_prompt, format_rag_prompt
+        generation_config = GenerationConfig(max_new_tokens=config.model_max_tokens,
+                                             temperature=config.model_temperature)
+        for i, row in enumerate(rows):
+            if row['error']:
+                continue
+            if i in retrieval:
+                prompt = format_rag_prompt(row['question'], retrieval[i].context_blocks)
+            else:
+                prompt = format_direct_prompt(row['question'])
+            try:
+                result = model.generate(prompt, generation_config)
+            except Exception as e:
+                row['error'] = f"generate: {e}"
+                continue
+            row.update(generation_time=result.generation_time,
+                       tokens_generated=int(result.tokens_generated), answer=result.text)
+    
+    return rows
+
+class EvaluationRun:
+    """Checkpointed results of one evaluation run
+    
+    ``results.jsonl`` is the checkpoint: one line per finished question,
+    flushed and fsynced after every batch. ``results.csv`` and
+    ``summary.json`` are derived from it and rewritten on resume, so a
+    crash mid-write never leaves them inconsistent with the checkpoint.
+    """
+    
+    def __init__(self, run_dir: str, resume: bool = False):
+        self.run_dir = run_dir
+        self.results_file = os.path.join(run_dir, 'results.jsonl')
+        self.csv_file = os.path.join(run_dir, 'results.csv')
+        self.summary_file = os.path.join(run_dir, 'summary.json')
+        self.rows: List[Dict[str, Any]] = []
+        os.makedirs(run_dir, exist_ok=True)
+        
+        if resume:
+            self._load_checkpoint()
+        elif os.path.exists(self.results_file):
+            raise FileExistsError(f"{self.results_file} exists; pass --resume or a new --run-name")
+        
+        # Rebuild the CSV from the checkpoint, then append as batches finish
+        with open(self.csv_file, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.rows)
+        self._results = open(self.results_file, 'a')
+        self._csv = open(self.csv_file, 'a', newline='')
+        self._csv_writer = csv.DictWriter(self._csv, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    
+    def _load_checkpoint(self) -> None:
+        if not os.path.exists(self.results_file):
+            return
+        latest: Dict[str, Dict[str, Any]] = {}
+        valid_bytes = 0
+        with open(self.results_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Torn final write from a killed job
+                    break
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    break
+                # A retried question's newer row replaces its failed one
+                latest[row['key']] = row
+                valid_bytes += len(line)
+        with open(self.results_file, 'ab') as f:
+            f.truncate(valid_bytes)
+        # Failed questions are dropped here so they are retried
+        self.rows = [row for row in latest.values() if not row.get('error')]
+    
+    def done_keys(self) -> set:
+        return {row['key'] for row in self.rows}
+    
+    def append(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self._results.write(json.dumps(row, default=str) + '\n')
+        self._results.flush()
+        os.fsync(self._results.fileno())
+        self._csv_writer.writerows(rows)
+        self._csv.flush()
+        self.rows.extend(rows)
+    
+    def write_summary(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        summary = {'meta': meta, **summarize(self.rows)}
+        tmp_file = f"{self.summary_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+        os.replace(tmp_file, self.summary_file)
+        return summary
+    
+    def close(self) -> None:
+        self._results.close()
+        self._csv.close()
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    """Seconds"""
+    if not values:
+        return {'count': 0}
+    array = np.asarray(values, dtype=np.float64)
+    return {
+        'count': int(array.size),
+        'mean': float(array.mean()),
+        'p50': float(np.percentile(array, 50)),
+        'p95': float(np.percentile(array, 95)),
+        'p99': float(np.percentile(array, 99))
+    }
+
+def summarize(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Routing, per-category and latency breakdowns over finished questions"""
+    ok = [row for row in rows if not row.get('error')]
+    rag = [row for row in ok if row.get('used_rag')]
+    
+    by_category: Dict[str, Dict[str, Any]] = {}
+    for row in ok:
+        for group in (row['category'], row.get('question_type')):
+            if not group:
+                continue
+            stats = by_category.setdefault(group, {'total': 0, 'rag_used': 0, 'complexity': []})
+            stats['total'] += 1
+            stats['rag_used'] += 1 if row.get('used_rag') else 0
+            stats['complexity'].append(row['complexity_score'])
+    for stats in by_category.values():
+        stats['rag_percentage'] = stats['rag_used'] / stats['total'] * 100
+        stats['avg_complexity'] = float(np.mean(stats.pop('complexity')))
+    
+    return {
+        'questions_evaluated': len(ok),
+        'errors': len(rows) - len(ok),
+        'rag_used': len(rag),
+        'direct_generation': len(ok) - len(rag),
+        'rag_percentage': len(rag) / len(ok) * 100 if ok else 0.0,
+        'avg_complexity_score': float(np.mean([r['complexity_score'] for r in ok])) if ok else 0.0,
+        'avg_confidence': float(np.mean([r['confidence'] for r in ok])) if ok else 0.0,
+        'by_profile': {profile: sum(1 for r in rag if r.get('profile') == profile)
+                       for profile in sorted({r.get('profile') for r in rag if r.get('profile')})},
+        'retrieval': {
+            'widening_rate': (sum(1 for r in rag if r.get('used_widening')) / len(rag)) if rag else 0.0,
+            'avg_candidates': float(np.mean([r['num_candidates'] for r in rag
+                                             if r.get('num_candidates') is not None] or [0])),
+        },
+        'by_category': by_category,
+        'latency': {field: latency_summary([r[field] for r in ok if r.get(field) is not None])
+                    for field in TIMING_FIELDS}
+    }
+
+def make_batches(pending: List[Tuple[str, Dict[str, Any]]],
+                 batch_size: int) -> List[List[Tuple[str, Dict[str, Any]]]]:
+    return [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+def report_progress(run: EvaluationRun, meta: Dict[str, Any], completed: int, total: int,
+                    start_time: float) -> None:
+    """Print throughput and refresh summary.json after each checkpointed batch"""
+    elapsed = time.time() - start_time
+    rate = completed / elapsed if elapsed > 0 else 0.0
+    remaining = (total - completed) / rate if rate > 0 else 0.0
+    print(f"  Progress: {completed}/{total} ({completed / total * 100:.1f}%) - "
+          f"{rate:.1f} q/s, ~{remaining:.0f}s left")
+    run.write_summary(meta)
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate the adaptive RAG pipeline on the question bank')
+    parser.add_argument('--question-bank', default=DEFAULT_QUESTION_BANK)
+    parser.add_argument('--mode', choices=MODES, default='retrieve',
+                        help='analyze: routing only; retrieve: + batched retrieval; generate: + answers')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes (each loads its own models); 1 runs in-process')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--limit', type=int, default=None, help='Only the first N questions')
+    parser.add_argument('--mock-model', action='store_true',
+                        help='Simulated generation latency instead of loading the model')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--run-name', default=None, help='Run directory name (default: timestamp)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip questions already in the run checkpoint and retry failures')
+    args = parser.parse_args()
+    
+    run_name = args.run_name or datetime.now().strftime('eval_%Y%m%d_%H%M%S')
+    run_dir = os.path.join(args.output_dir, run_name)
+    
+    questions = load_question_bank(args.question_bank, args.limit)
+    print(f"📚 Loaded {len(questions)} questions")
+    
+    run = EvaluationRun(run_dir, resume=args.resume)
+    done = run.done_keys()
+    pending = [(key, q) for key, q in questions if key not in done]
+    print(f"📝 {len(done)} already evaluated, {len(pending)} to go ({args.mode} mode)")
+    
+    meta = {
+        'run_name': run_name,
+        'mode': args.mode,
+        'question_bank': args.question_bank,
+        'questions_total': len(questions),
+        'workers': args.workers,
+        'batch_size': args.batch_size,
+        'mock_model': args.mock_model,
+        'started': datetime.now().isoformat(timespec='seconds')
+    }
+    
+    batches = make_batches(pending, args.batch_size)
+    start_time = time.time()
+    completed = 0
+    try:
+        if args.workers > 1:
+            # Spawn so CUDA and FAISS OpenMP state are never forked
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(args.workers, initializer=init_worker,
+                              initargs=(args.mode, args.mock_model)) as pool:
+                for rows in pool.imap_unordered(evaluate_batch, batches):
+                    run.append(rows)
+                    completed += len(rows)
+                    report_progress(run, meta, completed, len(pending), start_time)
+        else:
+            init_worker(args.mode, args.mock_model)
+            for batch in batches:
+                rows = evaluate_batch(batch)
+                run.append(rows)
+                completed += len(rows)
+                report_progress(run, meta, completed, len(pending), start_time)
+    finally:
+        meta['elapsed_this_session'] = time.time() - start_time
+        summary = run.write_summary(meta)
+        run.close()
+    
+    print("\n📊 EVALUATION SUMMARY")
+    print("=" * 40)
+    print(f"Questions Evaluated: {summary['questions_evaluated']} (errors: {summary['errors']})")
+    print(f"RAG Used: {summary['rag_used']} ({summary['rag_percentage']:.1f}%)")
+    print(f"Direct Generation: {summary['direct_generation']}")
+    print(f"Average Complexity Score: {summary['avg_complexity_score']:.2f}")
+    for field, stats in summary['latency'].items():
+        if stats['count']:
+            print(f"{field}: p50 {stats['p50'] * 1000:.1f} ms, p95 {stats['p95'] * 1000:.1f} ms")
+    print(f"Results: {run.csv_file}")
+    print(f"Summary: {run.summary_file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,12 +6,12 @@ Tests the system with real mathematical questions and produces detailed reports
 
 import sys
 import os
+import csv
 import json
 import time
 import statistics
 from typing import Dict, List, Any, Optional
 from datetime import datetime
-import pandas as pd
 
 def load_question_bank():
     """Load the question bank from JSON file"""
@@ -113,15 +113,21 @@ def test_adaptive_rag_components():
         print(f"❌ Component test failed: {e}")
         return None
 
+_analyzer = None
+
+def get_query_analyzer():
+    """Shared QueryAnalyzer, so the embedding model loads once per run"""
+    global _analyzer
+    if _analyzer is None:
+        sys.path.append('src/rag_system')
+        from adaptive_rag.core.query_analyzer import QueryAnalyzer
+        from adaptive_rag.config.adaptive_config import get_adaptive_config
+        _analyzer = QueryAnalyzer(get_adaptive_config())
+    return _analyzer
+
 def simulate_query_processing(question, category):
     """Simulate processing a single query using complexity analysis"""
-    import sys
-    sys.path.append('src/rag_system')
-    from adaptive_rag.core.query_analyzer import QueryAnalyzer
-    from adaptive_rag.config.adaptive_config import get_adaptive_config
-    
-    config = get_adaptive_config()
-    analyzer = QueryAnalyzer(config)
+    analyzer = get_query_analyzer()
     
     # Analyze query complexity
     complexity_analysis = analyzer.analyze_query(question)
@@ -277,9 +283,11 @@ def generate_report(test_results, component_results, total_time, categories):
             f.write(f"  Confidence: {result['confidence']:.2f}\n\n")
     
     # Create CSV report
-    df = pd.DataFrame(test_results)
     csv_file = f"{report_dir}/adaptive_rag_results_{timestamp}.csv"
-    df.to_csv(csv_file, index=False)
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(test_results[0].keys()) if test_results else [])
+        writer.writeheader()
+        writer.writerows(test_results)
     
     print(f"✅ Report generated: {report_file}")
     print(f"✅ CSV data: {csv_file}")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Local test of replicated retrieval workers
+Starts a pool of mmap retrieval workers over one index, checks that the
+load-balanced frontend returns the local index's results, compares
+concurrent throughput against a single worker, reports how much memory
+the workers share, and kills a worker to check that searches keep
+succeeding and the restarted worker rejoins the rotation.
+
+Examples:
+    python tests/replicated_retrieval_test.py --num-replicas 4
+    python tests/replicated_retrieval_test.py --index-dir src/rag_system/index_data
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+import faiss
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAG_SYSTEM_DIR = os.path.join(REPO_ROOT, 'src', 'rag_system')
+sys.path.insert(0, RAG_SYSTEM_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from adaptive_rag.retrieval.replicas import ReplicatedIndex
+from sharded_retrieval_test import make_synthetic_index
+
+def launch_replicas(index_dir: str, num_replicas: int, base_port: int) -> subprocess.Popen:
+    """Start the replica supervisor and wait for every worker to be healthy"""
+    supervisor = subprocess.Popen(
+        [sys.executable, 'retrieval_shard_server.py', 'replicas', '--index-dir', index_dir,
+         '--num-replicas', str(num_replicas), '--host', '127.0.0.1', '--base-port', str(base_port)],
+        cwd=RAG_SYSTEM_DIR)
+    for i in range(num_replicas):
+        wait_healthy(f"http://127.0.0.1:{base_port + i}", supervisor)
+    return supervisor
+
+def wait_healthy(url: str, process: subprocess.Popen, timeout: float = 60.0) -> dict:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Replica supervisor exited with code {process.returncode}")
+        try:
+            response = requests.get(f"{url}/health", timeout=1)
+            if response.ok:
+                return response.json()
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become healthy")
+
+def pss_bytes(pid: int) -> Optional[int]:
+    """Proportional set size: shared pages are split between the processes mapping them"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+def throughput(index: ReplicatedIndex, queries: np.ndarray, k: int, concurrency: int) -> float:
+    """Single-query searches per second with ``concurrency`` client threads"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda row: index.search(queries[row:row + 1], k), range(len(queries))))
+    return len(queries) / (time.perf_counter() - start)
+
+def test_results_match(index: ReplicatedIndex, local_index, queries: np.ndarray, k: int,
+                       batch_size: int = 20) -> bool:
+    print("\n🔍 Replicated results vs local index...")
+    expected_scores, expected_ids = local_index.search(queries, k)
+    # Batches sized like real requests, so each stays well inside the replica timeout
+    batches = [index.search(queries[start:start + batch_size], k)
+               for start in range(0, len(queries), batch_size)]
+    scores = np.concatenate([batch[0] for batch in batches])
+    ids = np.concatenate([batch[1] for batch in batches])
+    same_ids = all(set(a) == set(b) for a, b in zip(ids.tolist(), expected_ids.tolist()))
+    close_scores = np.allclose(scores, expected_scores, atol=1e-5)
+    print(f"{'✅' if same_ids and close_scores else '❌'} ids match={same_ids}, scores match={close_scores}")
+    return same_ids and close_scores
+
+def test_scaling(urls: List[str], queries: np.ndarray, k: int, concurrency: int) -> None:
+    print(f"\n⚖️  Throughput at concurrency {concurrency}...")
+    single = ReplicatedIndex(urls[:1], health_interval=0)
+    pool = ReplicatedIndex(urls, health_interval=0)
+    throughput(pool, queries[:20], k, concurrency)
+    single_qps = throughput(single, queries, k, concurrency)
+    pool_qps = throughput(pool, queries, k, concurrency)
+    per_replica = [replica.requests for replica in pool.replicas]
+    print(f"  1 replica:  {single_qps:.0f} q/s")
+    print(f"  {len(urls)} replicas: {pool_qps:.0f} q/s ({pool_qps / single_qps:.2f}x), "
+          f"requests per replica {per_replica}")
+
+def test_memory_sharing(urls: List[str]) -> None:
+    print("\n🧠 Worker memory (shared mmap pages are split across workers in PSS)...")
+    for url in urls:
+        info = requests.get(f"{url}/health", timeout=1).json()
+        rss, pss = rss_bytes(info['pid']), pss_bytes(info['pid'])
+        if rss is None:
+            print("  /proc not available; skipping")
+            return
+        pss_text = f"{pss / 2**20:.0f} MiB" if pss is not None else 'n/a'
+        print(f"  {url}: mmap={info.get('mmap')} RSS {rss / 2**20:.0f} MiB, PSS {pss_text}")
+
+def test_failover(index: ReplicatedIndex, urls: List[str], supervisor: subprocess.Popen,
+                  queries: np.ndarray, k: int) -> bool:
+    print("\n💀 Killing one replica under load...")
+    victim = requests.get(f"{urls[0]}/health", timeout=1).json()['pid']
+    os.kill(victim, signal.SIGKILL)
+    failures = 0
+    for row in range(len(queries)):
+        try:
+            index.search(queries[row:row + 1], k)
+        except RuntimeError:
+            failures += 1
+    stats = index.get_stats()
+    print(f"{'✅' if not failures else '❌'} {len(queries)} searches, {failures} failed, "
+          f"{stats['retries']} retried on another replica")
+    
+    print("🔄 Waiting for the supervisor to restart it...")
+    info = wait_healthy(urls[0], supervisor)
+    deadline = time.time() + 3 * index.health_interval + 5
+    while time.time() < deadline and not index.replicas[0].healthy:
+        time.sleep(0.2)
+    rejoined = index.replicas[0].healthy and info['pid'] != victim
+    print(f"{'✅' if rejoined else '❌'} Replica restarted (pid {victim} -> {info['pid']}) and "
+          f"{'rejoined' if rejoined else 'did not rejoin'} the rotation")
+    return not failures and rejoined
+
+def main():
+    parser = argparse.ArgumentParser(description='Test replicated retrieval workers locally')
+    parser.add_argument('--index-dir', default=None, help='Index to serve (default: synthetic)')
+    parser.add_argument('--num-chunks', type=int, default=100000, help='Synthetic index size')
+    parser.add_argument('--num-replicas', type=int, default=4)
+    parser.add_argument('--num-queries', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--base-port', type=int, default=9250)
+    args = parser.parse_args()
+    
+    print("🧪 Replicated Retrieval Test")
+    print("=" * 50)
+    
+    index_dir = args.index_dir
+    if index_dir is None:
+        index_dir = os.path.join(tempfile.mkdtemp(prefix='replica_test_'), 'index')
+        make_synthetic_index(index_dir, args.num_chunks)
+    
+    local_index = faiss.read_index(os.path.join(index_dir, 'faiss.index'))
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((args.num_queries, local_index.d)).astype(np.float32)
+    faiss.normalize_L2(queries)
+    
+    supervisor = launch_replicas(index_dir, args.num_replicas, args.base_port)
+    urls = [f"http://127.0.0.1:{args.base_port + i}" for i in range(args.num_replicas)]
+    passed = []
+    try:
+        index = ReplicatedIndex(urls, health_interval=0.5)
+        print(f"✅ Frontend sees {index.get_stats()['healthy_replicas']} healthy replicas, "
+              f"{index.ntotal} chunks")
+        passed.append(test_results_match(index, local_index, queries, args.k))
+        test_scaling(urls, queries, args.k, args.concurrency)
+        test_memory_sharing(urls)
+        passed.append(test_failover(index, urls, supervisor, queries, args.k))
+        index.close()
+    finally:
+        supervisor.terminate()
+        supervisor.wait()
+    
+    print(f"\n{'🎉 All replica tests passed' if all(passed) else '❌ Some replica tests failed'}")
+    return 0 if all(passed) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
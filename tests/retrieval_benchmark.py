@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Retrieval micro-benchmark on synthetic corpora
+Generates clustered, L2-normalized chunk embeddings (bge-small dimension
+by default), builds each index type, loads it through DynamicRetriever
+and reports build/load time, memory footprint, single and batched query
+latency and recall@k against exact search as JSON for CI trend tracking.
+The 'int8' and 'binary' types are the quantized two-stage storages; for
+them the report adds resident memory and recall relative to 'flat'.
+
+Examples:
+    # Quick run: 10k and 100k chunks, every index type
+    python tests/retrieval_benchmark.py --sizes 10k,100k
+    
+    # The indexer's IndexFlatIP at 1M chunks, appending to a trend file
+    python tests/retrieval_benchmark.py --sizes 1m --index-types flat \\
+        --history reports/retrieval_history.jsonl
+    
+    # Quantized storage against the float index, rescoring 4 candidates per result
+    python tests/retrieval_benchmark.py --sizes 100k,1m --index-types flat,int8,binary \\
+        --rescore-factor 4
+    
+    # 10M chunks need ~15 GB per copy of the vectors; raise the guard explicitly
+    python tests/retrieval_benchmark.py --sizes 10m --index-types ivf --max-memory-gb 64
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import faiss
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAG_SYSTEM_DIR = os.path.join(REPO_ROOT, 'src', 'rag_system')
+sys.path.insert(0, RAG_SYSTEM_DIR)
+
+from adaptive_rag.config.adaptive_config import update_adaptive_config
+from adaptive_rag.retrieval.dynamic_search import DynamicRetriever
+from adaptive_rag.retrieval.quantized import (TwoStageIndex, build_quantized_index,
+                                              write_quantized_index)
+
+# Index types to compare. 'flat' is what rag_pipeline.build_enhanced_index
+# writes by default, 'int8' and 'binary' its quantized storages; ivf and
+# hnsw are candidates for larger corpora.
+INDEX_TYPES = ['flat', 'ivf', 'hnsw', 'int8', 'binary']
+QUANTIZED_TYPES = ('int8', 'binary')
+GENERATE_BLOCK = 100_000
+EXACT_BLOCK = 262_144
+
+def parse_size(text: str) -> int:
+    """'10k' -> 10000, '1m' -> 1000000"""
+    text = text.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    if multiplier > 1:
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is a high-water mark (KiB on Linux), the best we can do elsewhere
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class SyntheticCorpus:
+    """Clustered unit vectors standing in for chunk embeddings
+    
+    Points are drawn around ``num_clusters`` random unit centers with
+    per-dimension noise ``spread``, which gives same-topic cosine
+    similarities in the 0.4-0.8 range that real bge-small chunks show.
+    Queries come from the same mixture, so they have true neighbours.
+    """
+    
+    def __init__(self, dim: int = 384, num_clusters: int = 1024, spread: float = 0.04,
+                 seed: int = 0):
+        self.dim = dim
+        self.spread = spread
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        centers = rng.standard_normal((num_clusters, dim)).astype(np.float32)
+        faiss.normalize_L2(centers)
+        self.centers = centers
+    
+    def _sample(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        labels = rng.integers(0, len(self.centers), size=n)
+        vectors = self.centers[labels]
+        vectors += (rng.standard_normal((n, self.dim)) * self.spread).astype(np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+    
+    def vectors(self, n: int) -> np.ndarray:
+        """``n`` corpus vectors, generated blockwise to bound temporaries"""
+        rng = np.random.default_rng(self.seed + 1)
+        out = np.empty((n, self.dim), dtype=np.float32)
+        for start in range(0, n, GENERATE_BLOCK):
+            stop = min(start + GENERATE_BLOCK, n)
+            out[start:stop] = self._sample(stop - start, rng)
+        return out
+    
+    def queries(self, n: int) -> np.ndarray:
+        return self._sample(n, np.random.default_rng(self.seed + 2))
+
+class SyntheticEmbedder:
+    """Stands in for SentenceTransformer: returns registered vectors by text
+    
+    Unregistered texts (pack definitions loaded at retriever start-up) get
+    a deterministic random unit vector.
+    """
+    
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.vectors: Dict[str, np.ndarray] = {}
+    
+    def register(self, texts: List[str], vectors: np.ndarray) -> None:
+        self.vectors.update(zip(texts, vectors))
+    
+    def _fallback(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:4], 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+    
+    def encode(self, texts: List[str], convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        return np.stack([self.vectors.get(text) if text in self.vectors else self._fallback(text)
+                         for text in texts])
+
+def build_index(kind: str, vectors: np.ndarray, nlist: Optional[int] = None,
+                hnsw_m: int = 32, ef_construction: int = 80) -> Tuple[Any, Dict[str, Any]]:
+    """Build one index type over ``vectors``; returns (index, build info)"""
+    n, dim = vectors.shape
+    info: Dict[str, Any] = {}
+    start = time.perf_counter()
+    if kind == 'flat':
+        index = faiss.IndexFlatIP(dim)
+        info['faiss_type'] = 'IndexFlatIP'
+    elif kind == 'ivf':
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        # ~64 training points per list is plenty for k-means
+        sample = vectors[np.random.default_rng(0).choice(n, min(n, 64 * nlist), replace=False)]
+        train_start = time.perf_counter()
+        index.train(sample)
+        info['train_time'] = time.perf_counter() - train_start
+        info.update(faiss_type='IndexIVFFlat', nlist=nlist)
+    elif kind == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        info.update(faiss_type='IndexHNSWFlat', hnsw_m=hnsw_m, ef_construction=ef_construction)
+    elif kind in QUANTIZED_TYPES:
+        index = build_quantized_index(vectors, kind)
+        info['faiss_type'] = type(index).__name__
+        info['build_time'] = time.perf_counter() - start
+        return index, info
+    else:
+        raise ValueError(f"Unknown index type: {kind}")
+    
+    for block_start in range(0, n, GENERATE_BLOCK * 10):
+        index.add(vectors[block_start:block_start + GENERATE_BLOCK * 10])
+    info['build_time'] = time.perf_counter() - start
+    return index, info
+
+def set_search_params(index: Any, kind: str, nprobe: int, ef_search: int,
+                      rescore_factor: int) -> Dict[str, Any]:
+    """Apply query-time knobs (these are not persisted by write_index)"""
+    if kind in QUANTIZED_TYPES:
+        index.rescore_factor = rescore_factor
+        return {'rescore_factor': rescore_factor}
+    if kind == 'ivf':
+        faiss.extract_index_ivf(index).nprobe = nprobe
+        return {'nprobe': nprobe}
+    if kind == 'hnsw':
+        index.hnsw.efSearch = ef_search
+        return {'ef_search': ef_search}
+    return {}
+
+def write_index_dir(index_dir: str, index: Any, vectors: np.ndarray, kind: str) -> int:
+    """Lay out an index directory exactly as the indexer does; returns index file bytes"""
+    os.makedirs(index_dir, exist_ok=True)
+    if kind in QUANTIZED_TYPES:
+        index_path = write_quantized_index(index, index_dir, kind)
+    else:
+        index_path = os.path.join(index_dir, 'faiss.index')
+        faiss.write_index(index, index_path)
+    
+    n = len(vectors)
+    with open(os.path.join(index_dir, 'md_chunks.pkl'), 'wb') as f:
+        pickle.dump([f"Synthetic chunk {i} about topic {i % 997}." for i in range(n)], f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(index_dir, 'md_filenames.pkl'), 'wb') as f:
+        pickle.dump([f"synthetic_{i // 1000:05d}.md" for i in range(n)], f)
+    np.save(os.path.join(index_dir, 'chunk_embeddings.npy'), vectors)
+    
+    metadata = {
+        'index_version': f"synthetic-{kind}-{n}",
+        'num_chunks': n,
+        'embedding_dimension': vectors.shape[1],
+        'index_type': type(index).__name__,
+        'embedding_storage': kind if kind in QUANTIZED_TYPES else 'float32',
+        'similarity_metric': 'cosine'
+    }
+    with open(os.path.join(index_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return os.path.getsize(index_path)
+
+def exact_topk(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ground-truth top-``k`` ids by brute-force inner product, blockwise"""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for start in range(0, len(vectors), EXACT_BLOCK):
+        scores = queries @ vectors[start:start + EXACT_BLOCK].T
+        top = min(k, scores.shape[1])
+        part = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        merged_scores = np.hstack([best_scores, np.take_along_axis(scores, part, axis=1)])
+        merged_ids = np.hstack([best_ids, part + start])
+        order = np.argsort(-merged_scores, axis=1, kind='stable')[:, :k]
+        best_scores = np.take_along_axis(merged_scores, order, axis=1)
+        best_ids = np.take_along_axis(merged_ids, order, axis=1)
+    return best_ids
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(np.intersect1d(row_found[row_found >= 0], row_truth)) for row_found, row_truth in
+               zip(found[:, :k], truth))
+    return hits / float(truth.size)
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """Milliseconds"""
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    if not values.size:
+        return {'count': 0}
+    return {
+        'count': int(values.size),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99))
+    }
+
+def benchmark_case(corpus_vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray,
+                   kind: str, args: argparse.Namespace, work_dir: str) -> Dict[str, Any]:
+    """Build, load and query one (size, index type) combination"""
+    n, dim = corpus_vectors.shape
+    result: Dict[str, Any] = {'num_vectors': n, 'dim': dim, 'index_type': kind}
+    
+    rss_before = rss_bytes()
+    index, build_info = build_index(kind, corpus_vectors, nlist=args.nlist, hnsw_m=args.hnsw_m,
+                                    ef_construction=args.ef_construction)
+    result.update(build_info)
+    result['build_rss_delta_bytes'] = rss_bytes() - rss_before
+    
+    index_dir = os.path.join(work_dir, f"{kind}_{n}")
+    result['index_file_bytes'] = write_index_dir(index_dir, index, corpus_vectors, kind)
+    # The float embeddings file is on disk for every type; quantized types only map it
+    result['disk_bytes'] = result['index_file_bytes'] + corpus_vectors.nbytes
+    del index
+    
+    # Load through the serving path
+    embedder = SyntheticEmbedder(dim)
+    single_texts = [f"benchmark query {i}" for i in range(len(queries))]
+    batch_texts = [f"benchmark batch query {i}" for i in range(len(queries))]
+    embedder.register(single_texts, queries)
+    embedder.register(batch_texts, queries)
+    
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    retriever = DynamicRetriever(index_dir=index_dir, embedder=embedder)
+    result['load_time'] = time.perf_counter() - start
+    result['load_rss_delta_bytes'] = rss_bytes() - rss_before
+    if retriever.pack_watcher is not None:
+        retriever.pack_watcher.stop()
+    result.update(set_search_params(retriever.index, kind, args.nprobe, args.ef_search,
+                                    args.rescore_factor))
+    index = retriever.index
+    # What the index keeps in process memory: the codes, or the whole index file
+    result['resident_index_bytes'] = (index.code_bytes() if isinstance(index, TwoStageIndex)
+                                      else result['index_file_bytes'])
+    
+    # Raw index: single-query and batched latency, recall against exact search
+    for row in range(min(args.warmup, len(queries))):
+        index.search(queries[row:row + 1], args.k)
+    samples = []
+    found = np.empty((len(queries), args.k), dtype=np.int64)
+    for row in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[row:row + 1], args.k)
+        samples.append(time.perf_counter() - start)
+        found[row] = ids[0]
+    result['index_single'] = latency_summary(samples)
+    result[f'recall_at_{args.k}'] = recall_at_k(found, truth)
+    
+    samples = []
+    for batch_start in range(0, len(queries), args.batch_size):
+        batch = queries[batch_start:batch_start + args.batch_size]
+        start = time.perf_counter()
+        index.search(batch, args.k)
+        samples.append((time.perf_counter() - start) / len(batch))
+    result['index_batched_per_query'] = latency_summary(samples)
+    
+    # Full retriever path: encode lookup, threshold/widen, compose (caches cold)
+    samples = []
+    num_candidates = 0
+    for text in single_texts:
+        retrieval = retriever.retrieve(text, profile=args.profile)
+        samples.append(retrieval.retrieval_time)
+        num_candidates += int(retrieval.candidate_ids.size)
+    result['retriever_single'] = latency_summary(samples)
+    result['retriever_mean_candidates'] = num_candidates / float(len(single_texts))
+    
+    samples = []
+    for batch_start in range(0, len(batch_texts), args.batch_size):
+        batch = batch_texts[batch_start:batch_start + args.batch_size]
+        start = time.perf_counter()
+        retriever.retrieve_batch(batch, profile=args.profile, batch_size=args.batch_size)
+        samples.append((time.perf_counter() - start) / len(batch))
+    result['retriever_batched_per_query'] = latency_summary(samples)
+    
+    if isinstance(index, TwoStageIndex):
+        stats = index.get_stats()
+        result['rescored_per_query'] = stats['rescored'] / float(max(1, stats['searches']))
+    
+    del retriever, index
+    if not args.keep:
+        shutil.rmtree(index_dir, ignore_errors=True)
+    return result
+
+def estimated_bytes(n: int, dim: int, kind: str) -> int:
+    """Rough peak: corpus + index copy (+ pages of the mapped embeddings file)"""
+    vectors = n * dim * 4
+    if kind in QUANTIZED_TYPES:
+        return 3 * vectors
+    overhead = {'flat': 0, 'ivf': n * 8, 'hnsw': n * 32 * 2 * 4}[kind]
+    return 3 * vectors + overhead
+
+def compare_to_flat(results: List[Dict[str, Any]], k: int) -> None:
+    """Memory reduction and recall change of each quantized case against flat at the same size"""
+    flat = {result['num_vectors']: result for result in results if result['index_type'] == 'flat'}
+    for result in results:
+        reference = flat.get(result['num_vectors'])
+        if result['index_type'] not in QUANTIZED_TYPES or reference is None:
+            continue
+        result['memory_reduction_vs_flat'] = reference['resident_index_bytes'] / result['resident_index_bytes']
+        result['disk_reduction_vs_flat'] = reference['disk_bytes'] / result['disk_bytes']
+        result['recall_delta_vs_flat'] = result[f'recall_at_{k}'] - reference[f'recall_at_{k}']
+        print(f"  {result['index_type']:>6} n={result['num_vectors']:>10,}  "
+              f"memory {result['memory_reduction_vs_flat']:.1f}x smaller, "
+              f"disk {result['disk_reduction_vs_flat']:.2f}x smaller, "
+              f"recall@{k} {result['recall_delta_vs_flat']:+.3f} vs flat")
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_result(result: Dict[str, Any], k: int) -> None:
+    print(f"  {result['index_type']:>6} n={result['num_vectors']:>10,}  "
+          f"build {result['build_time']:.2f}s  load {result['load_time']:.2f}s  "
+          f"file {result['index_file_bytes'] / 2**20:.1f} MiB  "
+          f"resident {result['resident_index_bytes'] / 2**20:.1f} MiB  "
+          f"recall@{k} {result[f'recall_at_{k}']:.3f}")
+    print(f"        index p50 {result['index_single']['p50_ms']:.3f} ms "
+          f"(batched {result['index_batched_per_query']['p50_ms']:.3f} ms/q)  "
+          f"retriever p50 {result['retriever_single']['p50_ms']:.3f} ms "
+          f"(batched {result['retriever_batched_per_query']['p50_ms']:.3f} ms/q)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark retrieval on synthetic corpora')
+    parser.add_argument('--sizes', default='10k,100k,1m',
+                        help='Comma-separated corpus sizes, e.g. 10k,100k,1m,10m')
+    parser.add_argument('--index-types', default=','.join(INDEX_TYPES),
+                        help=f"Comma-separated subset of {INDEX_TYPES}")
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--num-clusters', type=int, default=1024)
+    parser.add_argument('--spread', type=float, default=0.04)
+    parser.add_argument('--num-queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10, help='Neighbours for recall@k and latency')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--profile', default='general', help='Retrieval profile for the retriever path')
+    parser.add_argument('--nlist', type=int, default=None, help='IVF lists (default 4*sqrt(n))')
+    parser.add_argument('--nprobe', type=int, default=16)
+    parser.add_argument('--hnsw-m', type=int, default=32)
+    parser.add_argument('--ef-construction', type=int, default=80)
+    parser.add_argument('--ef-search', type=int, default=64)
+    parser.add_argument('--rescore-factor', type=int, default=8,
+                        help='int8/binary: first-pass candidates per result rescored in float')
+    parser.add_argument('--threads', type=int, default=None, help='FAISS OpenMP threads')
+    parser.add_argument('--max-memory-gb', type=float, default=16.0,
+                        help='Skip cases whose estimated peak memory exceeds this')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', default=None, help='Where index dirs are written')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated index dirs')
+    parser.add_argument('--output', default='retrieval_benchmark.json')
+    parser.add_argument('--history', default=None,
+                        help='JSONL file to append one line per case to, for trend tracking')
+    args = parser.parse_args()
+    
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    kinds = [kind.strip() for kind in args.index_types.split(',') if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in INDEX_TYPES]
+    if unknown:
+        parser.error(f"unknown index types: {unknown}")
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    
+    # Keep benchmark runs out of the serving telemetry and caches. The config
+    # was read from the environment on import, so override it directly.
+    update_adaptive_config(trace_sample_rate=0.0, pack_reload_interval=0.0, shared_cache_path=None)
+    
+    meta = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'faiss': getattr(faiss, '__version__', None),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'faiss_threads': faiss.omp_get_max_threads() if hasattr(faiss, 'omp_get_max_threads') else None,
+        'params': vars(args)
+    }
+    
+    corpus = SyntheticCorpus(args.dim, args.num_clusters, args.spread, args.seed)
+    queries = corpus.queries(args.num_queries)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='retrieval_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    
+    results: List[Dict[str, Any]] = []
+    skipped: List[Dict[str, Any]] = []
+    try:
+        for n in sizes:
+            runnable = [kind for kind in kinds
+                        if estimated_bytes(n, args.dim, kind) <= args.max_memory_gb * 2**30]
+            for kind in kinds:
+                if kind not in runnable:
+                    skipped.append({'num_vectors': n, 'index_type': kind,
+                                    'reason': 'exceeds --max-memory-gb'})
+                    print(f"⏭️  Skipping {kind} at n={n:,} (estimated memory over --max-memory-gb)")
+            if not runnable:
+                continue
+            
+            print(f"🧪 Generating {n:,} x {args.dim} synthetic vectors...")
+            start = time.perf_counter()
+            vectors = corpus.vectors(n)
+            generate_time = time.perf_counter() - start
+            truth = exact_topk(vectors, queries, args.k)
+            
+            for kind in runnable:
+                result = benchmark_case(vectors, queries, truth, kind, args, work_dir)
+                result['generate_time'] = generate_time
+                results.append(result)
+                print_result(result, args.k)
+            del vectors
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    compare_to_flat(results, args.k)
+    
+    report = {'meta': meta, 'results': results, 'skipped': skipped}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"📄 Report written to {args.output}")
+    
+    if args.history:
+        with open(args.history, 'a') as f:
+            for result in results:
+                f.write(json.dumps({'timestamp': meta['timestamp'], 'git_commit': meta['git_commit'],
+                                    **result}, default=str) + '\n')
+        print(f"📈 Appended {len(results)} cases to {args.history}")
+
+if __name__ == "__main__":
+    main()
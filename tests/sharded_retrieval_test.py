@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Local test of sharded retrieval
+Partitions an index into N shards, serves each from its own process on
+this machine and checks that the coordinator's merged results match a
+single local index, then that a stopped (slow) and a killed shard only
+degrade results instead of failing or stalling the search.
+
+Examples:
+    # Synthetic 20k-chunk index, 4 shards
+    python tests/sharded_retrieval_test.py --num-shards 4
+    
+    # A real index directory
+    python tests/sharded_retrieval_test.py --index-dir src/rag_system/index_data --num-shards 3
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import signal
+import argparse
+import tempfile
+import subprocess
+from typing import List
+
+import numpy as np
+import faiss
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAG_SYSTEM_DIR = os.path.join(REPO_ROOT, 'src', 'rag_system')
+sys.path.insert(0, RAG_SYSTEM_DIR)
+
+from adaptive_rag.retrieval.sharding import ShardedIndex, partition_index
+
+def make_synthetic_index(index_dir: str, num_chunks: int, dim: int = 384, seed: int = 0) -> None:
+    """Minimal index directory in the indexer's layout"""
+    os.makedirs(index_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((num_chunks, dim)).astype(np.float32)
+    faiss.normalize_L2(embeddings)
+    index = faiss.IndexFlatIP(dim)
+    index.add(embeddings)
+    faiss.write_index(index, os.path.join(index_dir, 'faiss.index'))
+    np.save(os.path.join(index_dir, 'chunk_embeddings.npy'), embeddings)
+    with open(os.path.join(index_dir, 'md_chunks.pkl'), 'wb') as f:
+        pickle.dump([f"Synthetic chunk {i}" for i in range(num_chunks)], f)
+    with open(os.path.join(index_dir, 'md_filenames.pkl'), 'wb') as f:
+        pickle.dump(['synthetic.md'] * num_chunks, f)
+    with open(os.path.join(index_dir, 'metadata.json'), 'w') as f:
+        json.dump({'index_version': f"synthetic-{num_chunks}", 'num_chunks': num_chunks}, f)
+
+def launch_local_shards(shard_dirs: List[str], base_port: int) -> List[subprocess.Popen]:
+    """One shard server process per shard directory, waiting until each is healthy"""
+    processes = []
+    for i, shard_dir in enumerate(shard_dirs):
+        processes.append(subprocess.Popen(
+            [sys.executable, 'retrieval_shard_server.py', 'serve',
+             '--shard-dir', shard_dir, '--host', '127.0.0.1', '--port', str(base_port + i)],
+            cwd=RAG_SYSTEM_DIR))
+    for i, process in enumerate(processes):
+        url = f"http://127.0.0.1:{base_port + i}/health"
+        deadline = time.time() + 60
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Shard {i} exited with code {process.returncode}")
+            try:
+                if requests.get(url, timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError(f"Shard {i} did not become healthy")
+            time.sleep(0.2)
+    return processes
+
+def test_merge_matches_local(sharded: ShardedIndex, local_index, queries: np.ndarray, k: int) -> bool:
+    """Merged shard top-k must equal a single flat index's top-k"""
+    print("\n🔍 Merged results vs single index...")
+    expected_scores, expected_ids = local_index.search(queries, k)
+    scores, ids = sharded.search(queries, k)
+    # Ties may legitimately order differently; compare id sets and scores
+    same_ids = all(set(a) == set(b) for a, b in zip(ids.tolist(), expected_ids.tolist()))
+    close_scores = np.allclose(scores, expected_scores, atol=1e-5)
+    print(f"{'✅' if same_ids and close_scores else '❌'} {len(queries)} queries, k={k}: "
+          f"ids match={same_ids}, scores match={close_scores}")
+    return same_ids and close_scores
+
+def test_latency(sharded: ShardedIndex, queries: np.ndarray, k: int) -> None:
+    samples = []
+    for row in range(len(queries)):
+        start = time.perf_counter()
+        sharded.search(queries[row:row + 1], k)
+        samples.append(time.perf_counter() - start)
+    samples_ms = np.asarray(samples) * 1000
+    print(f"⏱️  Single-query fan-out: p50 {np.percentile(samples_ms, 50):.2f} ms, "
+          f"p95 {np.percentile(samples_ms, 95):.2f} ms")
+
+def test_slow_shard(sharded: ShardedIndex, process: subprocess.Popen, queries: np.ndarray, k: int) -> bool:
+    """A paused shard costs at most the timeout and yields partial results"""
+    print("\n🐢 Pausing one shard (SIGSTOP)...")
+    process.send_signal(signal.SIGSTOP)
+    try:
+        before = sharded.partial_searches
+        start = time.perf_counter()
+        scores, ids = sharded.search(queries[:4], k)
+        elapsed = time.perf_counter() - start
+    finally:
+        process.send_signal(signal.SIGCONT)
+    ok = elapsed < sharded.timeout + 0.5 and sharded.partial_searches == before + 1 and (ids >= 0).any()
+    print(f"{'✅' if ok else '❌'} Search returned in {elapsed * 1000:.0f} ms "
+          f"(timeout {sharded.timeout * 1000:.0f} ms) with partial results")
+    return ok
+
+def test_dead_shard(sharded: ShardedIndex, process: subprocess.Popen, queries: np.ndarray, k: int) -> bool:
+    print("\n💀 Killing one shard...")
+    process.kill()
+    process.wait()
+    try:
+        _, ids = sharded.search(queries[:4], k)
+    except RuntimeError as e:
+        print(f"❌ Search failed: {e}")
+        return False
+    print(f"✅ Search still answered from the remaining shards ({int((ids >= 0).sum())} hits)")
+    return True
+
+def test_retriever(index_dir: str, urls: List[str], queries: np.ndarray) -> bool:
+    """DynamicRetriever configured with ADAPTIVE_RETRIEVAL_SHARDS returns the local results"""
+    print("\n🔍 DynamicRetriever over shards vs local index...")
+    from adaptive_rag.config.adaptive_config import update_adaptive_config
+    from adaptive_rag.retrieval.dynamic_search import DynamicRetriever
+    
+    class FixedEmbedder:
+        def encode(self, texts, convert_to_numpy=True, **kwargs):
+            return np.stack([queries[int(t.rsplit(' ', 1)[1]) % len(queries)] if t.startswith('q ')
+                             else queries[0] for t in texts])
+    
+    texts = [f"q {i}" for i in range(len(queries))]
+    update_adaptive_config(retrieval_shards=None, pack_reload_interval=0)
+    local = DynamicRetriever(index_dir=index_dir, embedder=FixedEmbedder())
+    update_adaptive_config(retrieval_shards=','.join(urls))
+    remote = DynamicRetriever(index_dir=index_dir, embedder=FixedEmbedder())
+    update_adaptive_config(retrieval_shards=None)
+    
+    mismatches = 0
+    for local_result, remote_result in zip(local.retrieve_batch(texts, profile='general'),
+                                           remote.retrieve_batch(texts, profile='general')):
+        if set(local_result.candidate_ids.tolist()) != set(remote_result.candidate_ids.tolist()):
+            mismatches += 1
+    print(f"{'✅' if not mismatches else '❌'} {len(texts)} retrievals, {mismatches} mismatches; "
+          f"shard stats: {remote.get_retrieval_stats()['shards']['searches']} searches")
+    return not mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Test sharded retrieval with local shard processes')
+    parser.add_argument('--index-dir', default=None, help='Index to shard (default: synthetic)')
+    parser.add_argument('--num-chunks', type=int, default=20000, help='Synthetic index size')
+    parser.add_argument('--num-shards', type=int, default=4)
+    parser.add_argument('--num-queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--base-port', type=int, default=9150)
+    parser.add_argument('--timeout', type=float, default=0.5)
+    args = parser.parse_args()
+    
+    print("🧪 Sharded Retrieval Test")
+    print("=" * 50)
+    
+    work_dir = tempfile.mkdtemp(prefix='shard_test_')
+    index_dir = args.index_dir
+    if index_dir is None:
+        index_dir = os.path.join(work_dir, 'index')
+        make_synthetic_index(index_dir, args.num_chunks)
+    shard_dirs = partition_index(index_dir, os.path.join(work_dir, 'shards'), args.num_shards)
+    
+    local_index = faiss.read_index(os.path.join(index_dir, 'faiss.index'))
+    rng = np.random.default_rng(1)
+    queries = rng.standard_normal((args.num_queries, local_index.d)).astype(np.float32)
+    faiss.normalize_L2(queries)
+    
+    processes = launch_local_shards(shard_dirs, args.base_port)
+    urls = [f"http://127.0.0.1:{args.base_port + i}" for i in range(len(shard_dirs))]
+    passed = []
+    try:
+        sharded = ShardedIndex(urls, timeout=args.timeout)
+        print(f"✅ Coordinator sees {len(urls)} shards, {sharded.ntotal} chunks")
+        passed.append(test_merge_matches_local(sharded, local_index, queries, args.k))
+        test_latency(sharded, queries, args.k)
+        passed.append(test_retriever(index_dir, urls, queries))
+        passed.append(test_slow_shard(sharded, processes[-1], queries, args.k))
+        passed.append(test_dead_shard(sharded, processes[0], queries, args.k))
+        print(f"\n📊 Coordinator stats: {sharded.get_stats()}")
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+    
+    print(f"\n{'🎉 All sharding tests passed' if all(passed) else '❌ Some sharding tests failed'}")
+    return 0 if all(passed) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())